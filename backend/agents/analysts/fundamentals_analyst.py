@@ -1,6 +1,8 @@
 import time
 import json
 
+from utils.metrics import llm_call
+
 
 def create_fundamentals_analyst(llm):
     def fundamentals_analyst_node(state) -> dict:
@@ -9,7 +11,8 @@ def create_fundamentals_analyst(llm):
         provide a detailed fundamentals analysis report including financial statements review, key ratios, and growth prospects.
         """
 
-        response = llm.invoke(prompt)
+        with llm_call("fundamentals_analyst"):
+            response = llm.invoke(prompt)
         report = response.content
 
         return {
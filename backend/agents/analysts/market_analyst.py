@@ -1,6 +1,8 @@
 import time
 import json
 
+from utils.metrics import llm_call
+
 
 def create_market_analyst(llm):
     def market_analyst_node(state) -> dict:
@@ -10,7 +12,8 @@ def create_market_analyst(llm):
         """
 
 
-        response = llm.invoke(prompt)
+        with llm_call("market_analyst"):
+            response = llm.invoke(prompt)
         report = response.content
 
         return {
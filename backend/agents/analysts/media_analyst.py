@@ -1,6 +1,8 @@
 import time
 import json
 
+from utils.metrics import llm_call
+
 
 def create_media_analyst(llm):
     def media_analyst_node(state) -> dict:
@@ -11,7 +13,8 @@ def create_media_analyst(llm):
         
 
 
-        response = llm.invoke(prompt)
+        with llm_call("media_analyst"):
+            response = llm.invoke(prompt)
         report = response.content
 
         return {
@@ -1,14 +1,441 @@
-from flask import Flask, jsonify
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from utils.generatePortfolio import make_portfolio
+from utils import bar_store, metrics, response_cache
+from utils.generatePortfolio import get_universe_cache, make_portfolio
+from utils.optimizer import METHODS
+from utils.portfolio_cache import PortfolioCache, etag_for
+from utils.portfolio_stream import PortfolioStream
+from utils.refresh_worker import RefreshWorker
+from utils.universe_query import encode, parse_query, run_query, sort_order
 
 app = Flask(__name__)
 CORS(app)
 
+portfolio_cache = PortfolioCache(maxsize=int(os.getenv("PORTFOLIO_CACHE_SIZE", "256")))
+worker = RefreshWorker()
+
+
+# ---------- Instrumentation ---------- #
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.HTTP_SECONDS.observe(
+            time.perf_counter() - started, method=request.method, endpoint=endpoint, status=response.status_code
+        )
+    return response
+
+
+metrics.gauge("universe_version", "Data version of the scored universe being served.",
+              function=lambda: get_universe_cache().get().version)
+metrics.gauge("portfolio_cache_entries", "Portfolios held in the response cache.",
+              function=lambda: portfolio_cache.stats()["size"])
+metrics.gauge("portfolio_stream_subscribers", "Connected /portfolio/stream clients.",
+              function=lambda: sum(stream.subscriber_count for stream in list(_streams.values())))
+for _name, _help in [
+    ("hits", "Provider responses served fresh from the response cache."),
+    ("stale_hits", "Stale provider responses served while a background refresh runs."),
+    ("misses", "Response cache misses fetched inline."),
+    ("refreshes", "Background refreshes of stale responses."),
+    ("evictions", "Responses evicted to stay under the byte budget."),
+    ("uncacheable", "Empty or error responses that were not cached."),
+    ("entries", "Responses held in the response cache."),
+    ("bytes", "Bytes of response bodies held in the response cache."),
+]:
+    metrics.gauge(f"response_cache_{_name}", _help,
+                  function=lambda name=_name: response_cache.default_stats().get(name, 0))
+
+
+@app.route("/metrics")
+def get_metrics():
+    """Prometheus text exposition of every metric in utils.metrics."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+PORTFOLIO_METHODS = ("logspace", *METHODS)
+
+
+def _float_arg(args, name, default, low, high, low_inclusive=True):
+    raw = args.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, got {raw!r}")
+    if not (value >= low if low_inclusive else value > low) or value > high:
+        bracket = "[" if low_inclusive else "("
+        raise ValueError(f"{name} must be in {bracket}{low}, {high}], got {value}")
+    return value
+
+
+def portfolio_params(args):
+    """Validated make_portfolio keyword arguments from the query string."""
+    method = args.get("method", "risk_parity")
+    if method not in PORTFOLIO_METHODS:
+        raise ValueError(f"method must be one of {', '.join(PORTFOLIO_METHODS)}, got {method!r}")
+    return {
+        "diversification": _float_arg(args, "diversification", 100.0, 0, 100),
+        "max_risk": _float_arg(args, "max_risk", 50.0, 0, 100),
+        "method": method,
+        "max_weight": _float_arg(args, "max_weight", None, 0, 1, low_inclusive=False),
+        "sector_cap": _float_arg(args, "sector_cap", None, 0, 1, low_inclusive=False),
+    }
+
+
+def portfolio_key(params, snapshot):
+    """Cache key and ETag input: the universe snapshot plus the bar cache the weights were fitted on."""
+    return (snapshot.version, bar_store.generation(), *sorted(params.items()))
+
+
+def cached_portfolio(params):
+    """(key, portfolio) computed from one universe snapshot, so the body always matches its key."""
+    snapshot = get_universe_cache().get()
+    key = portfolio_key(params, snapshot)
+    return key, portfolio_cache.get_or_compute(key, lambda: make_portfolio(**params, snapshot=snapshot))
+
+
 @app.route("/portfolio")
 def get_portfolio():
-    portfolio = make_portfolio(diversification=100, max_risk=50)
-    return jsonify(portfolio)
+    try:
+        params = portfolio_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    snapshot = get_universe_cache().get()
+    key = portfolio_key(params, snapshot)
+    etag = etag_for(key)
+    if request.if_none_match.contains(etag):
+        portfolio_cache.record_not_modified()
+        response = app.response_class(status=304)
+    else:
+        try:
+            portfolio = portfolio_cache.get_or_compute(key, lambda: make_portfolio(**params, snapshot=snapshot))
+        except ValueError as e:  # e.g. a max_weight or sector_cap the selection can't satisfy
+            return jsonify({"error": str(e)}), 400
+        response = jsonify(portfolio)
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # browsers revalidate with If-None-Match every time
+    return response
+
+
+@app.route("/portfolio/stats")
+def get_portfolio_stats():
+    snapshot = get_universe_cache().get()
+    with _streams_lock:
+        streams = {str(key): stream.stats() for key, stream in _streams.items()}
+    return jsonify({
+        "cache": portfolio_cache.stats(),
+        "universe": {"version": snapshot.version, "loaded_at": snapshot.loaded_at, "stocks": len(snapshot.frame)},
+        "streams": streams,
+    })
+
+
+@app.route("/universe")
+def get_universe():
+    """The scored universe with column projection, filters and cursor pagination.
+
+    Query: columns (comma list or *), sector (comma list), min_risk/max_risk,
+    min_roi/max_roi, sort (column, "-column" for descending), limit, cursor,
+    format (json, msgpack or arrow).
+    """
+    universe = get_universe_cache()
+    snapshot = universe.get()
+    try:
+        query = parse_query(request.args, snapshot.frame)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    etag = etag_for((snapshot.version, *sorted(request.args.items(multi=True))))
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        order = universe.derived(f"universe_order:{query['sort']}",
+                                 lambda frame: sort_order(frame, query["sort"]), snapshot)
+        page, next_cursor, total = run_query(snapshot.frame, query, order)
+        try:
+            body, content_type = encode(page, next_cursor, total, snapshot.version, query["format"])
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 406
+        response = app.response_class(body, content_type=content_type)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Universe-Version"] = str(snapshot.version)
+    return response
+
+
+# ---------- Live valuation stream ---------- #
+
+# Each open stream holds one server thread for as long as the client stays connected.
+# At most MAX_STREAM_CLIENTS of them are allowed at once, and serve() gives the server
+# that many threads on top of WEB_THREADS, so streams can never starve the other endpoints.
+MAX_STREAM_CLIENTS = int(os.getenv("MAX_STREAM_CLIENTS", "16"))
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "2"))
+
+_streams = {}
+_streams_lock = threading.Lock()
+_stream_slots = threading.BoundedSemaphore(MAX_STREAM_CLIENTS)
+
+
+def universe_prices(symbols):
+    """Prices stored with the scored universe; no provider I/O.
+
+    These are end-of-day: the prices job fills them from previous-session
+    closes, so a stream on this source moves at most once a day.
+    """
+    universe = get_universe_cache()
+    prices = universe.derived(
+        "price_map", lambda frame: frame.set_index("symbol")["price"].dropna().astype(float).to_dict()
+    )
+    return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+
+def alpaca_prices(symbols):
+    from utils.marketData import fetch_alpaca_latest_prices
+    return fetch_alpaca_latest_prices(symbols)
+
+
+_quote_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="stream-quote")
+
+
+def quote_prices(symbols):
+    """One quote per symbol through the hedged quote resolver; symbols nobody could price are left out."""
+    from utils.marketData import get_quote_resolver
+    resolver = get_quote_resolver()
+
+    def quote(symbol):
+        try:
+            return symbol, resolver.get_price(symbol)
+        except Exception as e:
+            print(f"No live quote for {symbol}: {e}")
+            return symbol, None
+
+    return {symbol: price for symbol, price in _quote_pool.map(quote, symbols) if price}
+
+
+def live_prices(symbols):
+    """Intraday prices: Alpaca's latest bars in one request, else the quote resolver.
+
+    Anything neither could price keeps its end-of-day universe price.
+    """
+    from utils import marketData
+    prices = {}
+    try:
+        prices = alpaca_prices(symbols) if marketData.API_KEY else quote_prices(symbols)
+    except Exception as e:
+        print(f"Live prices failed ({e}); trying the quote resolver")
+        prices = quote_prices(symbols)
+    missing = [symbol for symbol in symbols if not prices.get(symbol)]
+    return {**prices, **universe_prices(missing)} if missing else prices
+
+
+def shared_prices(source, max_age):
+    """Wrap a price source so every stream reuses prices younger than `max_age` seconds.
+
+    N streams over overlapping portfolios then cost about one provider call
+    per symbol per interval instead of N.
+    """
+    seen = {}  # symbol -> (fetched at, price)
+    lock = threading.Lock()
+
+    def prices(symbols):
+        now = time.monotonic()
+        with lock:
+            fresh = {s: seen[s][1] for s in symbols if s in seen and now - seen[s][0] < max_age}
+        missing = [s for s in symbols if s not in fresh]
+        if missing:
+            fetched = source(missing)
+            with lock:
+                seen.update((s, (now, price)) for s, price in fetched.items())
+            fresh.update(fetched)
+        return fresh
+
+    return prices
+
+
+# STREAM_PRICE_SOURCE picks one; "universe" is end-of-day and costs no provider calls.
+PRICE_SOURCES = {
+    "live": shared_prices(live_prices, STREAM_INTERVAL),
+    "alpaca": shared_prices(alpaca_prices, STREAM_INTERVAL),
+    "quotes": shared_prices(quote_prices, STREAM_INTERVAL),
+    "universe": universe_prices,
+}
+
+
+def subscribe_portfolio_stream(params, notional):
+    """Subscribe to the shared stream for a portfolio definition, creating it for the first client.
+
+    Returns (key, stream, subscriber). Subscribing under the registry lock means
+    release_portfolio_stream can't drop a stream that a new client just joined.
+    """
+    key = (*sorted(params.items()), notional)
+    with _streams_lock:
+        stream = _streams.get(key)
+        if stream is None:
+            stream = PortfolioStream(
+                lambda: cached_portfolio(params),
+                PRICE_SOURCES[os.getenv("STREAM_PRICE_SOURCE", "live")],
+                notional=notional,
+                interval=STREAM_INTERVAL,
+            )
+            _streams[key] = stream
+        return key, stream, stream.subscribe()
+
+
+def release_portfolio_stream(key, stream, subscriber):
+    """Unsubscribe, and drop the stream from the registry once its last client has gone."""
+    stream.unsubscribe(subscriber)
+    with _streams_lock:
+        if stream.subscriber_count or _streams.get(key) is not stream:
+            return
+        del _streams[key]
+    stream.stop()  # outside the lock: waits for the producer's current tick
+
+
+@app.route("/portfolio/stream")
+def stream_portfolio():
+    """Server-sent events: a `snapshot` of the valued portfolio, then `update`s with only what changed.
+
+    Answers 503 when MAX_STREAM_CLIENTS streams are already open; clients should fall back to /portfolio.
+    """
+    try:
+        params = portfolio_params(request.args)
+        notional = _float_arg(request.args, "notional", 100_000.0, 0, 1e12, low_inclusive=False)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not _stream_slots.acquire(blocking=False):
+        response = jsonify({"error": f"too many open streams (limit {MAX_STREAM_CLIENTS})"})
+        response.headers["Retry-After"] = "30"
+        return response, 503
+    try:
+        key, stream, subscriber = subscribe_portfolio_stream(params, notional)
+    except Exception:
+        _stream_slots.release()
+        raise
+
+    def events():
+        yield "retry: 5000\n\n"
+        while True:
+            item = subscriber.next(timeout=15)
+            if item is None:
+                if subscriber.closed:
+                    return
+                yield ": keepalive\n\n"  # keeps proxies from closing an idle connection
+                continue
+            event, payload = item
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    released = threading.Event()
+
+    def close():
+        # The server closes the response when the client goes away (noticed at the next
+        # write, so within one keepalive), even if the generator never started.
+        if not released.is_set():
+            released.set()
+            release_portfolio_stream(key, stream, subscriber)
+            _stream_slots.release()
+
+    response = Response(events(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(close)
+    return response
+
+
+@app.route("/health")
+def get_health():
+    stats = worker.stats()
+    return jsonify(stats), 200 if stats["ready"] else 503
+
+
+# ---------- Background refresh ---------- #
+
+def refresh_prices():
+    """Reprice the universe, then rescore right away instead of waiting for the next universe poll."""
+    from utils.marketData import refresh_prices as reprice  # provider clients are only needed on the worker
+    reprice(os.getenv("PRICE_PROVIDER", "polygon"))
+    get_universe_cache().refresh()
+
+
+def refresh_bars(lookback_days=400):
+    """Gap-fill the daily bars the optimizers read, so requests never fetch history themselves."""
+    from utils.marketData import get_bar_store
+    store = get_bar_store()
+    start = time.time() - lookback_days * 86400
+    for symbol in get_universe_cache().get().frame["symbol"].dropna():
+        store.read(symbol, "1Day", start=int(start * 1e9))
+
+
+def warm_default_portfolio():
+    """Build the risk/ROI index and the default /portfolio response before the first request."""
+    cached_portfolio(portfolio_params({}))
+
+
+_background_lock = threading.Lock()
+_background_started = False
+
+
+def start_background():
+    """Start the universe and refresh jobs once per process; later calls do nothing."""
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+        # Score the universe now and rebuild it in the background whenever the data changes.
+        get_universe_cache().start(interval=float(os.getenv("UNIVERSE_REFRESH_SECONDS", "30")))
+        worker.add("prices", refresh_prices, interval=float(os.getenv("PRICE_REFRESH_SECONDS", "300")))
+        worker.add("bars", refresh_bars, interval=float(os.getenv("BAR_REFRESH_SECONDS", "21600")))
+        worker.warm(warm_default_portfolio)
+        worker.start()
+
+
+def create_app():
+    """The WSGI app with its background refresh running (unless BACKGROUND_REFRESH=0).
+
+    Importing this module starts nothing, so tools and tests can use `app`
+    without provider I/O; servers other than serve() should load the app
+    through this factory, e.g. `waitress-serve --call app:create_app`.
+    """
+    if os.getenv("BACKGROUND_REFRESH", "1") != "0":
+        start_background()
+    return app
+
+
+def serve(host=None, port=None, threads=None):
+    """Serve with waitress (a multi-threaded production WSGI server), or Flask's threaded server without it.
+
+    `threads` (WEB_THREADS) is the pool for ordinary requests; waitress gets
+    MAX_STREAM_CLIENTS more for /portfolio/stream connections.
+    """
+    create_app()
+    host = host or os.getenv("HOST", "127.0.0.1")
+    port = int(port or os.getenv("PORT", "5000"))
+    threads = int(threads or os.getenv("WEB_THREADS", "8")) + MAX_STREAM_CLIENTS
+    try:
+        from waitress import serve as waitress_serve
+    except ImportError:
+        print("waitress is not installed; falling back to Flask's threaded server")
+        app.run(host=host, port=port, threaded=True)
+        return
+    waitress_serve(app, host=host, port=port, threads=threads)
+
 
 if __name__ == "__main__":
-    app.run(port=5000)
\ No newline at end of file
+    serve()
@@ -2,7 +2,8 @@ from langchain.chat_models import init_chat_model
 from langchain.agents import create_agent
 from langchain_core.tools import tool
 from langchain_core.prompts import ChatPromptTemplate
-from utils.alpaca_utils import get_account_info, get_positions, place_market_order
+from utils.alpaca_utils import place_market_order
+from utils.broker_state import get_broker_state
 from langchain_ollama.llms import OllamaLLM
 from langchain_ollama import ChatOllama
 import os, json
@@ -15,12 +16,12 @@ load_dotenv()
 @tool
 def get_account_info_tool(_: str) -> str:
     """Fetches Alpaca account info such as equity and buying power."""
-    return str(get_account_info())
+    return str(get_broker_state().get_account_info())
 
 @tool
 def get_positions_tool(_: str) -> str:
     """Fetches all open positions in the trading account."""
-    return str(get_positions())
+    return str(get_broker_state().get_positions())
 
 
 # @tool
@@ -99,12 +100,12 @@ if __name__ == "__main__":
 
         print("-------------------")
         if intent == "get_account_info":
-            info = get_account_info()
+            info = get_broker_state().get_account_info()
             print("💰 Account Info: ")
             print(summarize_message(query, json.dumps(info, default=str)))
 
         elif intent == "get_positions":
-            info = get_positions()
+            info = get_broker_state().get_positions()
             print("📊 Positions Info: ")
             print(summarize_message(query, json.dumps(info, default=str)))
 
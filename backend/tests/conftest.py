@@ -0,0 +1,6 @@
+import os
+
+# utils.marketData builds its Alpaca client at import time and refuses empty credentials;
+# no test talks to Alpaca, so placeholders are enough.
+os.environ.setdefault("ALPACA_API_KEY", "test")
+os.environ.setdefault("ALPACA_API_SECRET", "test")
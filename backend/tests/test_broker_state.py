@@ -0,0 +1,184 @@
+import threading
+import time
+
+import pytest
+
+from utils.broker_state import BrokerState, LocalTradeStream
+
+
+def wait_for(condition, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.005)
+
+
+class FakeBroker:
+    """REST stand-in; `hold` makes the positions read block until released."""
+
+    def __init__(self):
+        self.account = {"equity": "1000", "cash": "1000", "buying_power": "1000"}
+        self.positions = []
+        self.orders = []
+        self.hold = None
+        self.reading = threading.Event()
+
+    def load_account(self):
+        return dict(self.account)
+
+    def load_positions(self):
+        if self.hold is not None:
+            self.reading.set()
+            self.hold.wait(5)
+        return [dict(p) for p in self.positions]
+
+    def load_orders(self):
+        return [dict(o) for o in self.orders]
+
+
+def order(order_id, status, side="buy", qty="10", filled_qty="0", symbol="AAPL"):
+    return {"id": order_id, "client_order_id": f"c-{order_id}", "symbol": symbol, "qty": qty,
+            "filled_qty": filled_qty, "side": side, "type": "market", "status": status}
+
+
+def update(event, o, price=None, qty=None, position_qty=None):
+    return {"event": event, "order": o, "price": price, "qty": qty, "position_qty": position_qty}
+
+
+@pytest.fixture
+def make_state():
+    started = []
+
+    def make(**kwargs):
+        broker = FakeBroker()
+        stream = LocalTradeStream()
+        kwargs.setdefault("reconcile_interval", 3600)
+        kwargs.setdefault("fallback_interval", 3600)
+        kwargs.setdefault("heartbeat_interval", 3600)
+        state = BrokerState(broker.load_account, broker.load_positions, broker.load_orders,
+                            stream=stream, **kwargs)
+        state.start()
+        started.append(state)
+        wait_for(lambda: state.snapshot().stream_connected())
+        wait_for(lambda: state.reconciles >= 2)  # the seed, then the resync on connect
+        return state, stream, broker
+
+    yield make
+    for state in started:
+        state.stop()
+
+
+def test_partial_fill_then_fill(make_state):
+    state, stream, broker = make_state()
+    stream.publish(update("new", order("o1", "new")))
+    stream.publish(update("partial_fill", order("o1", "partially_filled", filled_qty="4"),
+                          price="100", qty="4", position_qty="4"))
+    stream.join()
+
+    (open_order,) = state.get_open_orders()
+    assert open_order["id"] == "o1" and open_order["filled_qty"] == "4"
+    (position,) = state.get_positions()
+    assert position["qty"] == "4" and position["avg_entry_price"] == "100"
+    wait_for(lambda: not state.snapshot().account_pending)
+
+    broker.account = dict(broker.account, cash="0")
+    stream.publish(update("fill", order("o1", "filled", filled_qty="10"), price="110", qty="6", position_qty="10"))
+    stream.join()
+
+    assert state.get_open_orders() == []
+    (position,) = state.get_positions()
+    assert position["qty"] == "10"
+    assert float(position["avg_entry_price"]) == pytest.approx((4 * 100 + 6 * 110) / 10)
+    assert position["market_value"] == "1100"
+    # Fills leave cash unknown until the account is read again, which the worker does at once.
+    wait_for(lambda: state.get_account_info()["cash"] == "0")
+    assert not state.snapshot().account_pending
+
+
+def test_sell_fill_closes_position(make_state):
+    state, stream, broker = make_state()
+    stream.publish(update("fill", order("o1", "filled"), price="50", qty="10", position_qty="10"))
+    stream.publish(update("fill", order("o2", "filled", side="sell"), price="55", qty="10", position_qty="0"))
+    stream.join()
+    assert state.get_positions() == []
+
+
+def test_order_state_transitions(make_state):
+    state, stream, broker = make_state()
+    versions = [state.snapshot().version]
+
+    stream.publish(update("pending_new", order("o1", "pending_new")))
+    stream.join()
+    assert [o["status"] for o in state.get_open_orders()] == ["pending_new"]
+    versions.append(state.snapshot().version)
+
+    stream.publish(update("new", order("o1", "new")))
+    stream.join()
+    assert [o["status"] for o in state.get_open_orders()] == ["new"]
+    versions.append(state.snapshot().version)
+
+    stream.publish(update("canceled", order("o1", "canceled")))
+    stream.join()
+    assert state.get_open_orders() == []
+
+    # A late, out-of-order event for a closed order must not bring it back.
+    stream.publish(update("new", order("o1", "new")))
+    stream.join()
+    assert state.get_open_orders() == []
+    assert versions == sorted(set(versions))
+
+
+def test_silent_stream_reported_disconnected(make_state):
+    state, stream, broker = make_state(heartbeat_interval=0.05, max_age=0.1)
+    assert state.meta()["stream_connected"] and not state.meta()["stale"]
+
+    stream.responsive = False  # socket still "open", but nothing comes back
+    wait_for(lambda: not state.snapshot().stream_connected())
+    assert stream.running.is_set()
+    wait_for(lambda: state.meta()["stale"])
+
+    reconciles = state.reconciles
+    stream.responsive = True
+    wait_for(lambda: state.snapshot().stream_connected())
+    wait_for(lambda: state.reconciles > reconciles)  # coming back resyncs
+    assert not state.meta()["stale"]
+
+
+def test_reconnect_triggers_reconcile(make_state):
+    state, stream, broker = make_state(reconnect_delay=0.2)
+    reconciles = state.reconciles
+
+    stream.drop()
+    wait_for(lambda: state.reconciles == reconciles + 1)  # resync as soon as it goes down
+    assert not state.snapshot().stream_connected()
+
+    # Something filled while the stream was down; only REST knows.
+    broker.positions = [{"symbol": "MSFT", "qty": "3", "avg_entry_price": "300"}]
+    broker.orders = [order("o9", "new", symbol="MSFT")]
+    wait_for(lambda: state.snapshot().stream_connected())
+    wait_for(lambda: state.reconciles == reconciles + 2)
+    assert [p["symbol"] for p in state.get_positions()] == ["MSFT"]
+    assert [o["id"] for o in state.get_open_orders()] == ["o9"]
+
+
+def test_events_during_reconcile_are_replayed(make_state):
+    state, stream, broker = make_state()
+    stream.publish(update("new", order("o1", "new")))
+    stream.join()
+
+    # REST is read before the fill, but answers after it has been streamed.
+    broker.orders = [order("o1", "new")]
+    broker.hold = threading.Event()
+    reconcile = threading.Thread(target=state.reconcile)
+    reconcile.start()
+    assert broker.reading.wait(5)
+    stream.publish(update("fill", order("o1", "filled", filled_qty="10"), price="20", qty="10", position_qty="10"))
+    stream.join()
+    assert state.get_positions()[0]["qty"] == "10"  # applied immediately as well
+
+    broker.hold.set()
+    reconcile.join(5)
+    assert state.get_open_orders() == []
+    (position,) = state.get_positions()
+    assert position["qty"] == "10" and position["avg_entry_price"] == "20"
@@ -0,0 +1,33 @@
+from utils.bulk_loader import run_bulk
+
+
+def test_failed_batch_marks_every_symbol_and_run_continues():
+    stored, calls = [], []
+
+    def write(batch):
+        calls.append(sorted(batch))
+        if len(calls) in (2, 4):  # the second batch and the short final one
+            raise RuntimeError("disk full")
+        stored.extend(batch)
+
+    symbols = [f"S{i}" for i in range(10)]
+    result = run_bulk(symbols, lambda s: {"symbol": s}, max_workers=1, retries=0, on_batch=write, batch_size=3)
+
+    assert [len(c) for c in calls] == [3, 3, 3, 1]
+    failed = set(calls[1]) | set(calls[3])
+    assert set(result.failed) == failed and all(e == "store failed: disk full" for e in result.failed.values())
+    assert set(result.succeeded) == set(stored) and not failed & set(stored)
+    assert result.attempted == 10
+
+
+def test_fetch_failures_never_reach_the_batch():
+    batches = []
+
+    def fetch(symbol):
+        if symbol == "BAD":
+            raise ValueError("no data")
+        return symbol
+
+    result = run_bulk(["A", "BAD", "B"], fetch, retries=0, on_batch=batches.append, batch_size=10)
+    assert result.failed == {"BAD": "no data"}
+    assert [sorted(b) for b in batches] == [["A", "B"]]
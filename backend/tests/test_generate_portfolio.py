@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import generatePortfolio
+from utils.generatePortfolio import make_portfolio, make_portfolios
+from utils.universe_cache import UniverseSnapshot
+
+
+@pytest.fixture
+def universe(monkeypatch):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "symbol": [f"S{i}" for i in range(60)],
+        "roiScore": rng.uniform(0, 100, 60),
+        "riskScore": rng.uniform(0, 100, 60),
+    })
+
+    class Cache:
+        snapshot = UniverseSnapshot(frame=frame, version=1, loaded_at=0.0)
+
+        def get(self):
+            return self.snapshot
+
+        def derived(self, name, build, snapshot=None):
+            return build((snapshot or self.snapshot).frame)
+
+    monkeypatch.setattr(generatePortfolio, "_universe_cache", Cache())
+    return frame
+
+
+@pytest.mark.parametrize("max_risk", [np.nan, np.inf, -np.inf])
+def test_non_finite_max_risk_is_rejected(universe, max_risk):
+    with pytest.raises(ValueError, match="max_risk"):
+        make_portfolios([(50, 40), (50, max_risk)], method="logspace")
+    with pytest.raises(ValueError, match="max_risk"):
+        make_portfolio(50, max_risk, method="logspace")
+
+
+def test_batch_matches_single_profiles(universe):
+    profiles = [(10, 30), (50, 60), (95, 100), (50, 0)]
+    batch = make_portfolios(profiles, method="logspace")
+    for i, (diversification, max_risk) in enumerate(profiles):
+        assert batch.portfolio(i) == make_portfolio(diversification, max_risk, method="logspace")
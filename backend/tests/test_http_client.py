@@ -0,0 +1,63 @@
+import pytest
+import requests
+
+from utils.http_client import ProviderClient, _alpha_vantage_errors
+from utils.rate_limit import RateLimitError
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+        self.text = ""
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}", response=self)
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def client(responses, **kwargs):
+    c = ProviderClient("alpha_vantage", "http://provider.test", _alpha_vantage_errors, backoff=0.001, **kwargs)
+    c.session = FakeSession(responses)
+    return c
+
+
+def test_transient_errors_are_retried_by_default():
+    c = client([requests.ConnectionError("reset"), FakeResponse(503, {}), FakeResponse(200, {"ok": 1})])
+    assert c.get_json("/query") == {"ok": 1}
+    assert c.session.calls == 3
+
+
+def test_retries_zero_leaves_retrying_to_the_caller():
+    c = client([FakeResponse(503, {}), FakeResponse(200, {"ok": 1})])
+    with pytest.raises(requests.HTTPError):
+        c.get_json("/query", retries=0)
+    assert c.session.calls == 1
+
+
+def test_quota_is_retried_but_permanent_errors_are_not():
+    c = client([FakeResponse(200, {"Note": "standard API rate limit is 25 requests per day"})] * 2, retries=1)
+    with pytest.raises(RateLimitError):
+        c.get_json("/query")
+    assert c.session.calls == 2
+
+    c = client([FakeResponse(200, {"Information": "the apikey is invalid"}), FakeResponse(200, {"ok": 1})])
+    with pytest.raises(RuntimeError, match="invalid"):
+        c.get_json("/query")
+    assert c.session.calls == 1
@@ -0,0 +1,25 @@
+import math
+
+import pytest
+
+from utils.marketData import parse_overview_batch, safe_float, safe_int
+
+RAW_VALUES = [
+    None, "None", "-", "", "nan", "NaN", " nan ", "inf", "-inf", "Infinity", "12", " 12 ", "1e3", "1_000",
+    "abc", "12.7", "-3.9", 12.5, 7, float("nan"), float("inf"), "1e400",
+]
+
+
+@pytest.mark.parametrize("value", RAW_VALUES)
+def test_batch_parser_matches_scalar_parsers(value):
+    columns = parse_overview_batch([{"PERatio": value, "SharesOutstanding": value}])
+    expected_float, expected_int = safe_float(value, 0.0), safe_int(value, 0)
+    actual_float, actual_int = columns["pe_ratio"][0], columns["shares_outstanding"][0]
+    assert actual_float == expected_float or (math.isnan(actual_float) and math.isnan(expected_float))
+    assert actual_int == expected_int
+
+
+def test_batch_parser_mixed_column():
+    columns = parse_overview_batch([{"PERatio": v} for v in RAW_VALUES])
+    assert len(columns["pe_ratio"]) == len(RAW_VALUES)
+    assert columns["symbol"][0] is None
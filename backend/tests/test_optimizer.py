@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.optimizer import optimize_weights
+
+
+def prices_for(symbols, days=200, seed=0):
+    rng = np.random.default_rng(seed)
+    vols = np.linspace(0.005, 0.04, len(symbols))
+    returns = rng.normal(0, vols, size=(days, len(symbols)))
+    index = pd.date_range("2025-01-01", periods=days, freq="B", tz="UTC")
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=index, columns=symbols)
+
+
+SYMBOLS = ["A", "B", "C", "D", "E"]
+
+
+def test_risk_parity_uses_history():
+    w = optimize_weights(SYMBOLS, method="risk_parity", prices=prices_for(SYMBOLS))
+    assert w.sum() == pytest.approx(100)
+    assert (np.diff(w) < 0).all()  # calmer names get more weight
+
+
+@pytest.mark.parametrize("prices", [None, pd.DataFrame()])
+def test_no_history_falls_back_to_equal_weights_with_a_warning(prices, capsys):
+    w = optimize_weights(SYMBOLS, method="risk_parity", prices=prices, max_weight=0.3)
+    assert w == pytest.approx([20.0] * 5)
+    assert "falls back to equal weights" in capsys.readouterr().out
+
+
+def test_partial_history_is_reported(capsys):
+    prices = prices_for(SYMBOLS)
+    prices["E"] = np.nan
+    w = optimize_weights(SYMBOLS, method="min_variance", prices=prices)
+    assert w.sum() == pytest.approx(100) and w[-1] > 0
+    assert "no price history for 1 of 5 symbols" in capsys.readouterr().out
+
+
+def test_sector_caps_hold():
+    sectors = ["Tech", "Tech", "Tech", "Energy", "Health"]
+    w = optimize_weights(SYMBOLS, method="risk_parity", prices=prices_for(SYMBOLS), sectors=sectors,
+                         sector_cap=0.4, max_weight=0.5)
+    assert w[:3].sum() <= 40 + 1e-6 and w.max() <= 50 + 1e-6
@@ -0,0 +1,178 @@
+import threading
+from datetime import date
+
+import pytest
+
+from utils import rebalancer
+from utils.rebalancer import client_order_id, execute, plan_orders, rebalance, rebalance_id_for
+
+
+class FreeBucket:
+    def acquire(self, tokens=1):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limit(monkeypatch):
+    monkeypatch.setattr(rebalancer, "get_bucket", lambda name: FreeBucket())
+
+
+class FakeBroker:
+    """submit/get_order stand-ins; sells reach `sell_outcome` after `polls_to_fill` lookups."""
+
+    def __init__(self, sell_outcome="filled", polls_to_fill=2):
+        self.sell_outcome = sell_outcome
+        self.polls_to_fill = polls_to_fill
+        self.orders = {}  # client_order_id -> order dict
+        self.calls = []  # ("submit" | "get", client_order_id, side)
+        self._lock = threading.Lock()
+
+    def submit(self, symbol, qty, side, client_order_id=None, time_in_force="gtc"):
+        with self._lock:
+            self.calls.append(("submit", client_order_id, side))
+            if client_order_id in self.orders:
+                return {"error": "client_order_id must be unique"}
+            self.orders[client_order_id] = {
+                "id": f"id-{len(self.orders)}", "client_order_id": client_order_id, "symbol": symbol,
+                "qty": qty, "side": side, "time_in_force": time_in_force, "status": "accepted",
+                "filled_qty": "0", "polls": 0,
+            }
+            return dict(self.orders[client_order_id])
+
+    def get_order(self, client_order_id):
+        with self._lock:
+            order = self.orders.get(client_order_id)
+            if order is None:
+                return {"error": "order not found"}
+            self.calls.append(("get", client_order_id, order["side"]))
+            order["polls"] += 1
+            if order["status"] == "accepted" and order["polls"] >= self.polls_to_fill:
+                order["status"] = self.sell_outcome if order["side"] == "sell" else "filled"
+                if order["status"] == "filled":
+                    order["filled_qty"] = str(order["qty"])
+            return dict(order)
+
+    def submitted(self, side=None):
+        return [c for c in self.calls if c[0] == "submit" and side in (None, c[2])]
+
+
+POSITIONS = [
+    {"symbol": "OLD", "qty": "10", "current_price": "50"},
+    {"symbol": "AAA", "qty": "20", "current_price": "100"},
+]
+PRICES = {"AAA": 100.0, "BBB": 25.0, "OLD": 50.0}
+TARGETS = [("AAA", 10.0), ("BBB", 50.0)]  # equity 3000: trim AAA, close OLD, open BBB
+
+
+def plan(**kwargs):
+    orders, _ = plan_orders(TARGETS, POSITIONS, 3000, PRICES, cash_buffer=0.0, **kwargs)
+    return orders
+
+
+def test_plan_nets_holdings_against_targets():
+    orders = {o.symbol: (o.side, o.qty) for o in plan()}
+    assert orders == {"AAA": ("sell", 17.0), "BBB": ("buy", 60.0), "OLD": ("sell", 10.0)}
+    with pytest.raises(ValueError):
+        plan_orders([("AAA", 70.0), ("BBB", 40.0)], [], 1000, PRICES)
+
+
+def test_sells_fill_before_any_buy_is_sent():
+    broker = FakeBroker(polls_to_fill=3)
+    results = execute(plan(), "r1", submit=broker.submit, get_order=broker.get_order, poll_interval=0.001)
+
+    assert [r.status for r in results] == ["submitted"] * 3
+    assert [r.side for r in results] == ["sell", "sell", "buy"]
+    first_buy = broker.calls.index(broker.submitted("buy")[0])
+    for coid, order in broker.orders.items():
+        if order["side"] == "sell":
+            fills = [i for i, c in enumerate(broker.calls) if c[:2] == ("get", coid)]
+            assert len(fills) == 3 and fills[-1] < first_buy
+    assert all(r.broker_status == "filled" for r in results if r.side == "sell")
+
+
+@pytest.mark.parametrize("outcome", ["accepted", "canceled", "rejected"])
+def test_buys_blocked_when_sells_do_not_fill(outcome):
+    broker = FakeBroker(sell_outcome=outcome, polls_to_fill=1)
+    results = execute(plan(), "r1", submit=broker.submit, get_order=broker.get_order,
+                      fill_timeout=0.05, poll_interval=0.001)
+
+    assert broker.submitted("buy") == []
+    (buy,) = [r for r in results if r.side == "buy"]
+    assert buy.status == "blocked" and "not filled" in buy.error
+    assert all(r.status == "submitted" for r in results if r.side == "sell")
+
+
+def test_buys_blocked_when_a_sell_is_rejected_on_submit():
+    broker = FakeBroker()
+    submit = broker.submit
+
+    def failing_submit(symbol, qty, side, **kwargs):
+        if symbol == "OLD":
+            return {"error": "insufficient qty"}
+        return submit(symbol, qty, side, **kwargs)
+
+    results = execute(plan(), "r1", submit=failing_submit, get_order=broker.get_order, poll_interval=0.001)
+    assert broker.submitted("buy") == []
+    assert {r.symbol: r.status for r in results} == {"AAA": "submitted", "OLD": "failed", "BBB": "blocked"}
+
+
+def test_client_order_ids_are_stable_and_reruns_place_nothing_new():
+    today = date(2026, 10, 16)
+    rid = rebalance_id_for(TARGETS, today)
+    assert rid == rebalance_id_for(dict(TARGETS), today)
+    assert rid != rebalance_id_for(TARGETS, date(2026, 10, 17))
+    assert rid != rebalance_id_for([("AAA", 10.0), ("BBB", 49.0)], today)
+    assert client_order_id(rid, "AAA", "sell") == f"rb-{rid}-AAA-sell"
+
+    broker = FakeBroker(polls_to_fill=1)
+    first = execute(plan(), rid, submit=broker.submit, get_order=broker.get_order, poll_interval=0.001)
+    placed = dict(broker.orders)
+    # Re-run after a crash: the plan may differ slightly (a partial fill), the ids don't.
+    again = execute(plan(), rid, submit=broker.submit, get_order=broker.get_order, poll_interval=0.001)
+
+    assert broker.orders.keys() == placed.keys()
+    assert [r.client_order_id for r in again] == [r.client_order_id for r in first]
+    assert [r.status for r in again] == ["duplicate"] * 3
+    assert all(r.broker_status == "filled" and r.order_id for r in again)
+
+
+def test_duplicate_of_a_dead_order_is_a_failure_and_blocks_buys():
+    broker = FakeBroker(sell_outcome="canceled", polls_to_fill=1)
+    rid = "r1"
+    execute(plan(), rid, submit=broker.submit, get_order=broker.get_order, fill_timeout=0.05, poll_interval=0.001)
+    assert broker.submitted("buy") == []
+
+    broker.sell_outcome = "filled"
+    results = execute(plan(), rid, submit=broker.submit, get_order=broker.get_order, fill_timeout=0.05,
+                      poll_interval=0.001)
+    sells = [r for r in results if r.side == "sell"]
+    assert all(r.status == "failed" and r.broker_status == "canceled" for r in sells)
+    assert "canceled" in sells[0].error
+    assert broker.submitted("buy") == []
+    assert [r.status for r in results if r.side == "buy"] == ["blocked"]
+
+
+def test_fractional_quantities_are_day_orders():
+    positions = [{"symbol": "OLD", "qty": "2.5", "current_price": "50"}]
+    orders, _ = plan_orders([("AAA", 50.0)], positions, 1000, PRICES, cash_buffer=0.0)
+    assert {o.symbol: o.qty for o in orders} == {"OLD": 2.5, "AAA": 5.0}
+
+    broker = FakeBroker(polls_to_fill=1)
+    execute(orders, "r1", submit=broker.submit, get_order=broker.get_order, poll_interval=0.001)
+    tif = {o["symbol"]: o["time_in_force"] for o in broker.orders.values()}
+    assert tif == {"OLD": "day", "AAA": "gtc"}
+
+    broker = FakeBroker(polls_to_fill=1)
+    orders, _ = plan_orders([("AAA", 50.0)], [], 1000, PRICES, cash_buffer=0.0, fractional=True)
+    execute(orders, "r2", submit=broker.submit, get_order=broker.get_order, fractional=True)
+    assert [o["time_in_force"] for o in broker.orders.values()] == ["day"]
+
+
+def test_dry_run_submits_nothing():
+    broker = FakeBroker()
+    report = rebalance(TARGETS, dry_run=True, prices=PRICES, account={"equity": "3000"}, positions=POSITIONS,
+                       submit=broker.submit, get_order=broker.get_order, cash_buffer=0.0)
+
+    assert broker.calls == []
+    assert [o.status for o in report.orders] == ["planned"] * 3
+    assert report.summary()["sells"] == 2 and report.ok
@@ -0,0 +1,56 @@
+import json
+
+from utils import response_cache
+from utils.response_cache import ResponseCache
+
+
+def test_empty_and_error_bodies_are_not_cached(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    calls = []
+
+    def fetch(value):
+        def run():
+            calls.append(value)
+            return value
+        return run
+
+    for i, body in enumerate([{}, [], {"Information": "try again later"}, {"status": "ERROR", "message": "x"}]):
+        assert cache.get_or_fetch(f"k{i}", "fundamentals", fetch(body)) == body
+        assert cache.get_or_fetch(f"k{i}", "fundamentals", fetch(body)) == body
+    assert len(calls) == 8  # every one refetched
+    assert cache.stats()["entries"] == 0 and cache.stats()["uncacheable"] == 8
+
+    cache.get_or_fetch("good", "fundamentals", fetch({"Symbol": "AAPL"}))
+    cache.get_or_fetch("good", "fundamentals", fetch({"Symbol": "AAPL"}))
+    assert len(calls) == 9 and cache.stats()["hits"] == 1
+
+
+def test_running_size_matches_table_and_evicts_lru(tmp_path):
+    body = {"data": "x" * 100}
+    size = len(json.dumps(body))
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=3 * size)
+    for key in ["a", "b", "c"]:
+        cache.put(key, body)
+    cache.put("a", body)  # replacing doesn't double count
+    assert cache.stats()["bytes"] == 3 * size and cache.stats()["entries"] == 3
+
+    cache.get_or_fetch("a", "fundamentals", lambda: None)  # touch "a" so "b" is least recently used
+    cache.put("d", body)
+    assert cache.stats()["evictions"] == 1
+    assert cache._lookup("b") is None and cache._lookup("a") is not None
+    total = cache._conn.execute("SELECT COUNT(*), SUM(size) FROM responses").fetchone()
+    assert total == (cache.stats()["entries"], cache.stats()["bytes"])
+
+    reopened = ResponseCache(str(tmp_path / "cache.db"), max_bytes=3 * size)
+    assert reopened.stats()["bytes"] == 3 * size
+
+
+def test_default_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "_default_cache", None)
+    assert response_cache.default_stats() == {}
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    monkeypatch.setattr(response_cache, "_default_cache", cache)
+    cache.get_or_fetch("k", "prices", lambda: {"price": 1})
+    cache.get_or_fetch("k", "prices", lambda: {"price": 1})
+    stats = response_cache.default_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
@@ -5,6 +5,8 @@ from alpaca.trading.requests import MarketOrderRequest
 from alpaca.trading.enums import OrderSide, TimeInForce, QueryOrderStatus, OrderType, OrderClass
 from alpaca.trading.requests import GetOrdersRequest
 
+from utils.metrics import provider_call
+
 # Load environment variables
 load_dotenv()
 
@@ -23,7 +25,8 @@ trading_client = TradingClient(API_KEY, API_SECRET, paper=PAPER)
 def get_account_info():
     """Fetch basic account information."""
     try:
-        account = trading_client.get_account()
+        with provider_call("alpaca_trading", "get_account"):
+            account = trading_client.get_account()
         #print(account)
         return {
             "id": account.id,
@@ -38,9 +41,16 @@ def get_account_info():
 def get_positions():
     """Get all open positions."""
     try:
-        positions = trading_client.get_all_positions()
+        with provider_call("alpaca_trading", "get_all_positions"):
+            positions = trading_client.get_all_positions()
         return [
-            {"symbol": p.symbol, "qty": p.qty, "avg_entry_price": p.avg_entry_price}
+            {
+                "symbol": p.symbol,
+                "qty": p.qty,
+                "avg_entry_price": p.avg_entry_price,
+                "current_price": p.current_price,
+                "market_value": p.market_value,
+            }
             for p in positions
         ]
     except Exception as e:
@@ -50,13 +60,17 @@ def get_positions():
 def get_open_orders():
     """Retrieve all open orders."""
     try:
-        orders = trading_client.get_orders(
-            GetOrdersRequest(status=QueryOrderStatus.OPEN)
-        )
+        with provider_call("alpaca_trading", "get_orders"):
+            orders = trading_client.get_orders(
+                GetOrdersRequest(status=QueryOrderStatus.OPEN)
+            )
         return [
             {
+                "id": str(o.id),
+                "client_order_id": o.client_order_id,
                 "symbol": o.symbol,
                 "qty": o.qty,
+                "filled_qty": o.filled_qty,
                 "side": o.side,
                 "type": o.type,
                 "limit_price": getattr(o, "limit_price", None),
@@ -68,17 +82,45 @@ def get_open_orders():
         return {"error": str(e)}
 
 
-def place_market_order(symbol: str, qty: int, side: str):
-    """Place a market buy/sell order."""
+def place_market_order(symbol: str, qty: float, side: str, client_order_id: str = None, time_in_force: str = "gtc"):
+    """Place a market buy/sell order.
+
+    A `client_order_id` makes the order idempotent: Alpaca rejects a second
+    order with the same id. Fractional quantities need time_in_force="day".
+    """
     try:
         order_data = MarketOrderRequest(
             symbol=symbol,
             qty=qty,
             side=OrderSide.BUY if side.lower() == "buy" else OrderSide.SELL,
-            time_in_force=TimeInForce.GTC
+            time_in_force=TimeInForce(time_in_force.lower()),
+            client_order_id=client_order_id,
         )
-        order = trading_client.submit_order(order_data)
-        return {"id": order.id, "symbol": order.symbol, "status": order.status}
+        with provider_call("alpaca_trading", "submit_order"):
+            order = trading_client.submit_order(order_data)
+        return {
+            "id": order.id,
+            "client_order_id": order.client_order_id,
+            "symbol": order.symbol,
+            "status": order.status,
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def get_order_by_client_id(client_order_id: str):
+    """Current state of one order, looked up by the client_order_id it was submitted with."""
+    try:
+        with provider_call("alpaca_trading", "get_order"):
+            order = trading_client.get_order_by_client_id(client_order_id)
+        return {
+            "id": str(order.id),
+            "client_order_id": order.client_order_id,
+            "symbol": order.symbol,
+            "status": order.status,
+            "filled_qty": order.filled_qty,
+            "filled_avg_price": order.filled_avg_price,
+        }
     except Exception as e:
         return {"error": str(e)}
 
@@ -86,7 +128,8 @@ def place_market_order(symbol: str, qty: int, side: str):
 def cancel_all_orders():
     """Cancel all open orders."""
     try:
-        trading_client.cancel_orders()
+        with provider_call("alpaca_trading", "cancel_orders"):
+            trading_client.cancel_orders()
         return {"message": "All open orders canceled."}
     except Exception as e:
         return {"error": str(e)}
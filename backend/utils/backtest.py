@@ -0,0 +1,287 @@
+"""Historical backtests of the make_portfolio strategy.
+
+Prices are a dates x symbols frame of daily closes. Fundamentals are either
+point-in-time (a long frame with `date` and `symbol` columns, each row valid
+from its date until the next row for that symbol) or a static one-row-per-
+symbol snapshot, which is applied to every date and so carries look-ahead.
+The price-based inputs of score_stock (price, 52-week range and the 50/200
+day moving averages) are always rebuilt from the price history as of each
+rebalance date.
+
+Every rebalance date is scored in one score_universe call, selection is one
+argsort over a rebalance-dates x symbols matrix, and the daily equity curve
+between rebalances is computed from cumulative growth matrices, so nothing
+loops over days. sweep() runs a parameter grid on a process pool.
+"""
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from utils.generatePortfolio import num_stocks_for, portfolio_weights, score_universe
+
+TRADING_DAYS = 252
+
+# score_stock inputs derived from the price history: column -> (window, reducer)
+PRICE_FEATURES = {
+    "52WeekHigh": (TRADING_DAYS, "max"),
+    "52WeekLow": (TRADING_DAYS, "min"),
+    "50DayMovingAverage": (50, "mean"),
+    "200DayMovingAverage": (200, "mean"),
+}
+
+
+@dataclass
+class BacktestData:
+    """Everything about a backtest that doesn't depend on the strategy parameters."""
+    prices: pd.DataFrame
+    growth: np.ndarray        # dates x symbols cumulative growth of 1 (missing returns count as 0)
+    rebalance_at: np.ndarray  # row positions in `prices` of the rebalance dates
+    scored: pd.DataFrame      # score_universe output for every (rebalance date, symbol) pair
+    roi: np.ndarray           # rebalance dates x symbols
+    risk: np.ndarray
+    listed: np.ndarray        # has a price and fundamentals as of the rebalance date
+
+
+@dataclass
+class BacktestResult:
+    params: dict
+    equity: pd.Series         # net asset value, 1.0 at the first rebalance
+    returns: pd.Series        # daily net returns
+    weights: pd.DataFrame     # target weights (fractions) per rebalance date
+    turnover: pd.Series       # sum of |weight change| traded at each rebalance (1.0 = the initial buy)
+    costs: pd.Series          # fraction of NAV paid in transaction costs at each rebalance
+    stats: dict = field(default_factory=dict)
+
+    def summary(self):
+        return dict(self.params, **self.stats)
+
+
+def rebalance_dates(index, rebalance="ME", warmup=TRADING_DAYS):
+    """Row positions of the last trading day of each `rebalance` period (a pandas
+    offset alias like "W-FRI", "ME", "QE") or of every `rebalance`-th day if it's
+    an int, skipping the first `warmup` days so the price features have history."""
+    index = pd.DatetimeIndex(index)
+    if isinstance(rebalance, int):
+        positions = np.arange(warmup, len(index), rebalance)
+    else:
+        last = pd.Series(np.arange(len(index)), index=index).resample(rebalance).last().dropna()
+        positions = last.to_numpy(dtype=np.int64)
+        positions = positions[positions >= warmup]
+    if len(positions) == 0:
+        raise ValueError("Not enough price history for a single rebalance after the warmup")
+    return positions
+
+
+def _price_features(prices, rebalance_at):
+    """Price-derived score inputs as of each rebalance date, as rebalance dates x symbols frames."""
+    features = {"price": prices.iloc[rebalance_at]}
+    for column, (window, how) in PRICE_FEATURES.items():
+        rolled = getattr(prices.rolling(window, min_periods=window), how)()
+        features[column] = rolled.iloc[rebalance_at]
+    return features
+
+
+def _point_in_time(fundamentals, dates, symbols):
+    """Latest fundamentals row per symbol as of each date, one row per (date, symbol)."""
+    grid = pd.DataFrame({
+        "date": np.repeat(dates.to_numpy(), len(symbols)),
+        "symbol": np.tile(np.asarray(symbols, dtype=object), len(dates)),
+    })
+    if "date" not in fundamentals.columns:
+        static = fundamentals.drop_duplicates("symbol", keep="last").assign(_known=True)
+        return grid.merge(static, on="symbol", how="left")
+
+    right = fundamentals.assign(date=pd.to_datetime(fundamentals["date"]), _known=True)
+    right = right.sort_values("date", kind="stable")
+    right["date"] = right["date"].astype(grid["date"].dtype)
+    return pd.merge_asof(grid, right, on="date", by="symbol")  # keeps the grid's (date, symbol) order
+
+
+def prepare(prices, fundamentals, rebalance="ME", warmup=TRADING_DAYS):
+    """Score the universe at every rebalance date; reusable across strategy parameters."""
+    prices = prices.sort_index().astype(float)
+    prices.index = pd.DatetimeIndex(prices.index)
+    symbols = list(prices.columns)
+    rebalance_at = rebalance_dates(prices.index, rebalance, warmup)
+    dates = prices.index[rebalance_at]
+
+    returns = prices.pct_change(fill_method=None).to_numpy(copy=True)
+    returns[0] = 0.0
+    growth = np.cumprod(1.0 + np.nan_to_num(returns, nan=0.0), axis=0)
+
+    panel = _point_in_time(fundamentals.drop(columns=["price", *PRICE_FEATURES], errors="ignore"), dates, symbols)
+    for column, frame in _price_features(prices, rebalance_at).items():
+        panel[column] = frame.to_numpy().ravel()
+    scored = score_universe(panel)
+
+    shape = (len(dates), len(symbols))
+    price = panel["price"].to_numpy(dtype=float).reshape(shape)
+    known = panel["_known"].eq(True).to_numpy().reshape(shape)
+    return BacktestData(
+        prices=prices,
+        growth=growth,
+        rebalance_at=rebalance_at,
+        scored=scored,
+        roi=scored["roiScore"].to_numpy(dtype=float).reshape(shape),
+        risk=scored["riskScore"].to_numpy(dtype=float).reshape(shape),
+        listed=known & (price > 0),
+    )
+
+
+def select(data, num_stocks, max_risk):
+    """Column positions of the picks per rebalance date (rebalance dates x num_stocks, -1 padded).
+
+    Same rule as make_portfolio: riskScore < max_risk, best roiScore first,
+    NaN ROI last and ties in column order.
+    """
+    with np.errstate(invalid="ignore"):
+        eligible = data.listed & (data.risk < max_risk)
+    key = np.where(np.isnan(data.roi), np.finfo(float).max, -data.roi)
+    key = np.where(eligible, key, np.inf)
+    order = np.argsort(key, axis=1, kind="stable")[:, :num_stocks]
+    count = np.minimum(eligible.sum(axis=1), num_stocks)
+    return np.where(np.arange(order.shape[1])[None, :] < count[:, None], order, -1)
+
+
+def target_weights(data, picks, method="risk_parity", max_weight=None, sector_cap=None, lookback=TRADING_DAYS):
+    """Rebalance dates x symbols target weights (fractions) for the picks, using only past prices."""
+    n_dates, n_symbols = data.roi.shape
+    weights = np.zeros((n_dates, n_symbols))
+    for r, row in enumerate(picks):
+        chosen = row[row >= 0]
+        if len(chosen) == 0:
+            continue  # nothing passes the filter: sit in cash until the next rebalance
+        frame = data.scored.iloc[r * n_symbols + chosen]
+        window = None
+        if method != "logspace":
+            end = data.rebalance_at[r] + 1
+            window = data.prices.iloc[max(0, end - lookback):end, chosen]
+        weights[r, chosen] = portfolio_weights(frame, method, max_weight, sector_cap, prices=window) / 100.0
+    return weights
+
+
+def simulate(data, weights, cost_bps=10.0):
+    """Daily NAV for target `weights` held from each rebalance close to the next, after costs.
+
+    Costs are `cost_bps` basis points of every unit of weight traded.
+    Returns (day positions, equity, turnover, costs) arrays.
+    """
+    growth, at = data.growth, data.rebalance_at
+    days = np.arange(at[0], len(growth))
+    segment = np.searchsorted(at, days, side="right") - 1
+
+    # Holdings drift with prices: weight_i * G[t, i] / G[start, i] of the segment's starting value.
+    relative = growth[days] / growth[at[segment]]
+    multiplier = (weights[segment] * relative).sum(axis=1)
+    multiplier[weights[segment].sum(axis=1) == 0] = 1.0  # all cash
+
+    # Drifted weights just before each rebalance versus the new targets.
+    held = weights[:-1] * growth[at[1:]] / growth[at[:-1]]
+    totals = held.sum(axis=1)
+    drifted = np.zeros_like(weights)
+    np.divide(held, totals[:, None], out=drifted[1:], where=totals[:, None] > 0)
+    turnover = np.abs(weights - drifted).sum(axis=1)
+    costs = turnover * cost_bps / 1e4
+
+    # NAV at each segment start: the previous segment's growth, less this rebalance's costs.
+    segment_growth = np.ones(len(at))
+    segment_growth[1:] = np.where(totals > 0, totals, 1.0)
+    start_value = np.cumprod(segment_growth * (1.0 - costs))
+    return days, start_value[segment] * multiplier, turnover, costs
+
+
+def _drawdown(equity):
+    return equity / np.maximum.accumulate(equity) - 1.0
+
+
+def summarize(equity, turnover, costs, periods=TRADING_DAYS):
+    returns = np.diff(equity) / equity[:-1]
+    years = max(len(returns), 1) / periods
+    volatility = returns.std(ddof=1) * np.sqrt(periods) if len(returns) > 1 else 0.0
+    mean = returns.mean() * periods if len(returns) else 0.0
+    return {
+        "total_return": float(equity[-1] / equity[0] - 1.0),
+        "cagr": float((equity[-1] / equity[0]) ** (1.0 / years) - 1.0),
+        "volatility": float(volatility),
+        "sharpe": float(mean / volatility) if volatility > 0 else 0.0,
+        "max_drawdown": float(_drawdown(equity).min()),
+        "avg_turnover": float(turnover[1:].mean()) if len(turnover) > 1 else 0.0,
+        "annual_turnover": float(turnover[1:].sum() / years),
+        "total_costs": float(costs.sum()),
+        "rebalances": int(len(turnover)),
+    }
+
+
+def run(data, diversification=50, max_risk=50, method="risk_parity", max_weight=None, sector_cap=None,
+        cost_bps=10.0, lookback=TRADING_DAYS):
+    """Backtest one parameter set on prepared data."""
+    params = dict(diversification=diversification, max_risk=max_risk, method=method, max_weight=max_weight,
+                  sector_cap=sector_cap, cost_bps=cost_bps, lookback=lookback)
+    picks = select(data, num_stocks_for(diversification), max_risk)
+    weights = target_weights(data, picks, method, max_weight, sector_cap, lookback)
+    days, equity, turnover, costs = simulate(data, weights, cost_bps)
+
+    index = data.prices.index
+    rebalanced = index[data.rebalance_at]
+    equity = pd.Series(equity, index=index[days], name="equity")
+    return BacktestResult(
+        params=params,
+        equity=equity,
+        returns=equity.pct_change().fillna(0.0).rename("returns"),
+        weights=pd.DataFrame(weights, index=rebalanced, columns=data.prices.columns),
+        turnover=pd.Series(turnover, index=rebalanced, name="turnover"),
+        costs=pd.Series(costs, index=rebalanced, name="costs"),
+        stats=summarize(equity.to_numpy(), turnover, costs),
+    )
+
+
+def backtest(prices, fundamentals, rebalance="ME", warmup=TRADING_DAYS, **params):
+    """Prepare and run a single backtest; see run() for the strategy parameters."""
+    return run(prepare(prices, fundamentals, rebalance, warmup), **params)
+
+
+# Per-process state for sweep(): the inputs are sent once per worker, and each
+# worker prepares (scores) the data once per rebalance schedule it sees.
+_worker_inputs = None
+_worker_prepared = {}
+
+
+def _init_worker(prices, fundamentals, warmup):
+    global _worker_inputs
+    _worker_inputs = (prices, fundamentals, warmup)
+    _worker_prepared.clear()
+
+
+def _run_in_worker(params):
+    prices, fundamentals, warmup = _worker_inputs
+    params = dict(params)
+    rebalance = params.pop("rebalance")
+    data = _worker_prepared.get(rebalance)
+    if data is None:
+        data = _worker_prepared[rebalance] = prepare(prices, fundamentals, rebalance, warmup)
+    result = run(data, **params)
+    return dict(result.summary(), rebalance=rebalance)
+
+
+def sweep(prices, fundamentals, grid, rebalance="ME", warmup=TRADING_DAYS, max_workers=None, **fixed):
+    """Backtest every combination in `grid` (parameter -> list of values) across processes.
+
+    `grid` may include "rebalance" as well as any run() parameter; `fixed`
+    parameters apply to every run. Returns one row of summary stats per
+    combination.
+    """
+    keys = list(grid)
+    combos = [{**fixed, "rebalance": rebalance, **dict(zip(keys, values))}
+              for values in itertools.product(*(grid[k] for k in keys))]
+    # Group by schedule so each worker re-scores as rarely as possible.
+    combos.sort(key=lambda c: str(c["rebalance"]))
+    workers = min(max_workers or os.cpu_count() or 1, len(combos))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(prices, fundamentals, warmup)) as pool:
+        rows = list(pool.map(_run_in_worker, combos, chunksize=max(1, len(combos) // (workers * 4))))
+    return pd.DataFrame(rows)
@@ -0,0 +1,223 @@
+"""On-disk cache of historical OHLCV bars, one memory-mapped file per symbol and timeframe.
+
+Bars are stored as fixed-width binary records sorted by timestamp under
+backend/data/bars/<timeframe>/<symbol>.bin, next to a small JSON file that
+records which time range has already been fetched. Reads memory-map the file
+and return slices of it, so nothing is loaded into RAM until it's touched and
+indicator/backtest code can work directly on the NumPy columns.
+
+A bar that was still forming when it was fetched doesn't count as covered:
+the next read fetches it again and its final values replace the partial ones.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BAR_DIR = os.path.join(BASE_DIR, "data", "bars")
+
+BAR_DTYPE = np.dtype([
+    ("ts", "<i8"),  # bar start, ns since epoch (UTC)
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+])
+
+_EMPTY = np.zeros(0, dtype=BAR_DTYPE)
+
+# Bumped whenever any BarStore in this process writes bars, so results derived
+# from the cache (e.g. optimizer weights) can tell that their inputs moved.
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def generation():
+    return _generation
+
+
+def _bump_generation():
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+BAR_UNITS = {"Min": "min", "Hour": "h", "Day": "D", "Week": "W"}
+
+
+def bar_length_ns(timeframe):
+    """Length of one bar for a timeframe name like "1Day" or "5Min"."""
+    for unit, alias in BAR_UNITS.items():
+        if timeframe.endswith(unit):
+            return int(pd.Timedelta(f"{timeframe[:-len(unit)] or 1}{alias}").value)
+    raise ValueError(f"Unknown bar timeframe {timeframe!r}")
+
+
+def _now_ns():
+    return int(datetime.now(timezone.utc).timestamp() * 1e9)
+
+
+def _to_ns(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return int(ts.value)
+
+
+def frame_to_records(df):
+    """Convert a bar DataFrame (timestamp index or column, OHLCV columns) to BAR_DTYPE records."""
+    if df is None or len(df) == 0:
+        return _EMPTY
+    if isinstance(df.index, pd.MultiIndex):
+        df = df.reset_index(level=[n for n in df.index.names if n != "timestamp"], drop=True)
+    if "timestamp" in df.columns:
+        df = df.set_index("timestamp")
+    df = df.rename(columns=str.lower)
+
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is None:
+        index = index.tz_localize("UTC")
+    records = np.empty(len(df), dtype=BAR_DTYPE)
+    records["ts"] = index.tz_convert("UTC").as_unit("ns").asi8
+    for name in ("open", "high", "low", "close", "volume"):
+        records[name] = df[name].to_numpy(dtype="f8") if name in df.columns else np.nan
+    records.sort(order="ts")
+    return records
+
+
+class BarStore:
+    def __init__(self, root=None, fetcher=None):
+        """`fetcher(symbol, timeframe, start, end)` returns a bar DataFrame for a missing range."""
+        self.root = root or BAR_DIR
+        self.fetcher = fetcher
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _paths(self, symbol, timeframe):
+        folder = os.path.join(self.root, timeframe)
+        return os.path.join(folder, f"{symbol}.bin"), os.path.join(folder, f"{symbol}.json")
+
+    def coverage(self, symbol, timeframe):
+        """(start_ns, end_ns) already fetched for this series, or None."""
+        _, meta_path = self._paths(symbol, timeframe)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        return meta["start"], meta["end"]
+
+    def _write_meta(self, meta_path, start, end):
+        tmp = f"{meta_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"start": start, "end": end}, f)
+        os.replace(tmp, meta_path)
+
+    def _mmap(self, symbol, timeframe):
+        data_path, _ = self._paths(symbol, timeframe)
+        if not os.path.exists(data_path) or os.path.getsize(data_path) == 0:
+            return _EMPTY
+        return np.memmap(data_path, dtype=BAR_DTYPE, mode="r")
+
+    def write(self, symbol, timeframe, records, start=None, end=None):
+        """Merge `records` into the series and extend its coverage to [start, end]."""
+        records = records if isinstance(records, np.ndarray) else frame_to_records(records)
+        data_path, meta_path = self._paths(symbol, timeframe)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+
+        with self._lock((symbol, timeframe)):
+            existing = self._mmap(symbol, timeframe)
+            if len(records):
+                if len(existing) == 0 or records["ts"][0] > existing["ts"][-1]:
+                    # Common case: new bars after everything we have, so just append.
+                    with open(data_path, "ab") as f:
+                        f.write(records.tobytes())
+                else:
+                    merged = np.concatenate([np.asarray(existing), records])
+                    _, keep = np.unique(merged["ts"][::-1], return_index=True)
+                    merged = merged[::-1][keep]  # newest copy of each timestamp wins, sorted by ts
+                    del existing
+                    tmp = f"{data_path}.tmp"
+                    merged.tofile(tmp)
+                    os.replace(tmp, data_path)
+                _bump_generation()
+
+            old = self.coverage(symbol, timeframe)
+            starts = [start, old[0] if old else None, int(records["ts"][0]) if len(records) else None]
+            ends = [end, old[1] if old else None, int(records["ts"][-1]) if len(records) else None]
+            starts = [v for v in starts if v is not None]
+            ends = [v for v in ends if v is not None]
+            if starts and ends:
+                new_end = max(ends)
+                last = self._mmap(symbol, timeframe)
+                if len(last):
+                    last_ts = int(last["ts"][-1])
+                    if last_ts + bar_length_ns(timeframe) > _now_ns():
+                        new_end = min(new_end, last_ts)  # still forming: refetch it next time
+                    del last
+                self._write_meta(meta_path, min(starts), new_end)
+
+    def missing_ranges(self, symbol, timeframe, start, end):
+        """Sub-ranges of [start, end] (ns) not yet covered by the cache."""
+        cov = self.coverage(symbol, timeframe)
+        if cov is None:
+            return [(start, end)]
+        gaps = []
+        if start < cov[0]:
+            gaps.append((start, cov[0]))
+        if end > cov[1]:
+            gaps.append((cov[1], end))
+        return gaps
+
+    def read(self, symbol, timeframe="1Day", start=None, end=None, fetch_missing=True):
+        """Bars in [start, end] as a read-only view into the memory-mapped file.
+
+        Missing ranges are fetched first when a fetcher is configured and
+        `fetch_missing` is set. Columns are available as e.g. `bars["close"]`.
+        """
+        now = _now_ns()
+        start_ns = _to_ns(start)
+        end_ns = min(_to_ns(end), now) if end is not None else now
+
+        if fetch_missing and self.fetcher is not None and start_ns is not None:
+            for gap_start, gap_end in self.missing_ranges(symbol, timeframe, start_ns, end_ns):
+                df = self.fetcher(
+                    symbol, timeframe,
+                    pd.Timestamp(gap_start, tz="UTC").to_pydatetime(warn=False),
+                    pd.Timestamp(gap_end, tz="UTC").to_pydatetime(warn=False),
+                )
+                self.write(symbol, timeframe, frame_to_records(df), start=gap_start, end=gap_end)
+
+        bars = self._mmap(symbol, timeframe)
+        lo = 0 if start_ns is None else int(np.searchsorted(bars["ts"], start_ns, side="left"))
+        hi = int(np.searchsorted(bars["ts"], end_ns, side="right"))
+        return bars[lo:hi]
+
+    def column(self, symbol, field, timeframe="1Day", start=None, end=None, fetch_missing=True):
+        return self.read(symbol, timeframe, start, end, fetch_missing)[field]
+
+    def read_frame(self, symbol, timeframe="1Day", start=None, end=None, fetch_missing=True):
+        bars = self.read(symbol, timeframe, start, end, fetch_missing)
+        index = pd.to_datetime(np.asarray(bars["ts"]), utc=True)
+        return pd.DataFrame({name: np.asarray(bars[name]) for name in BAR_DTYPE.names[1:]}, index=index)
+
+    def close_matrix(self, symbols, timeframe="1Day", start=None, end=None, fetch_missing=True):
+        """Aligned close prices (dates x symbols) for a set of symbols."""
+        series = {}
+        for symbol in symbols:
+            bars = self.read(symbol, timeframe, start, end, fetch_missing)
+            if len(bars):
+                series[symbol] = pd.Series(np.asarray(bars["close"]), index=pd.to_datetime(np.asarray(bars["ts"]), utc=True))
+        return pd.DataFrame(series)
@@ -0,0 +1,501 @@
+"""In-process copy of the brokerage account, positions and open orders.
+
+BrokerState is seeded once from REST and then kept current from the
+trade-updates stream: order events upsert or drop open orders, fills move
+the position to the event's `position_qty`. Fills change cash and buying
+power in ways the event doesn't spell out, so they mark the account as
+pending and schedule a single account read instead of guessing.
+
+Reads never do I/O. Every change builds a new immutable BrokerSnapshot and
+swaps it in, so snapshot() is an attribute read and the get_*() helpers
+just copy a few dicts. A RefreshWorker reconciles against REST on a
+schedule, sooner while the stream is down, and straight away when it comes
+back, which repairs anything missed across a reconnect. Each snapshot carries when it was last
+confirmed by REST and when the stream last proved it was alive, so callers
+can tell how far to trust it.
+
+The stream only counts as connected while it keeps proving it: the server
+answers every "listen" request with a confirmation, so a heartbeat job
+re-sends it and a confirmation or a trade update within `stream_timeout`
+is required. A run() that is silently reconnecting, or a socket that has
+gone quiet, shows up as disconnected and the state as stale.
+
+LocalTradeStream stands in for alpaca's TradingStream in tests and local
+runs: it takes the same handler, confirms subscriptions the same way and
+delivers events published to it.
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from utils.refresh_worker import RefreshWorker
+
+OPEN_ORDER_STATUSES = {
+    "new", "accepted", "pending_new", "accepted_for_bidding", "partially_filled",
+    "pending_cancel", "pending_replace", "held", "calculated", "stopped", "suspended",
+}
+FILL_EVENTS = {"fill", "partial_fill"}
+CLOSED_ORDER_MEMORY = 1000  # terminal order ids remembered so a late event can't resurrect them
+
+RECONCILE_SECONDS = float(os.getenv("BROKER_RECONCILE_SECONDS", "300"))  # with the stream up
+FALLBACK_SECONDS = float(os.getenv("BROKER_FALLBACK_SECONDS", "15"))  # with the stream down
+MAX_AGE_SECONDS = float(os.getenv("BROKER_MAX_AGE_SECONDS", "60"))
+HEARTBEAT_SECONDS = float(os.getenv("BROKER_HEARTBEAT_SECONDS", "10"))
+
+
+def _text(value):
+    """Enum members and plain strings alike, as their lowercase value."""
+    value = getattr(value, "value", value)
+    return None if value is None else str(value).lower()
+
+
+def _field(obj, name, default=None):
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+
+def _number(value):
+    return format(float(value), ".10g")  # REST reports quantities and prices as strings
+
+
+def _order_dict(order):
+    """Same shape as alpaca_utils.get_open_orders(), from a REST or stream order."""
+    return {
+        "id": str(_field(order, "id")),
+        "client_order_id": _field(order, "client_order_id"),
+        "symbol": _field(order, "symbol"),
+        "qty": _field(order, "qty"),
+        "filled_qty": _field(order, "filled_qty"),
+        "side": _field(order, "side"),
+        "type": _field(order, "type") or _field(order, "order_type"),
+        "limit_price": _field(order, "limit_price"),
+        "status": _field(order, "status"),
+    }
+
+
+@dataclass(frozen=True)
+class BrokerSnapshot:
+    account: dict
+    positions: tuple
+    orders: tuple
+    version: int
+    synced_at: float  # last time REST confirmed the whole state (epoch seconds)
+    last_event_at: float
+    stream_seen_at: float  # last subscription confirmation or trade update from the stream
+    account_pending: bool  # a fill arrived and the account hasn't been re-read since
+    max_age: float
+    stream_timeout: float
+
+    def stream_connected(self, now=None):
+        now = time.time() if now is None else now
+        return self.stream_seen_at is not None and now - self.stream_seen_at <= self.stream_timeout
+
+    def is_stale(self, max_age=None, now=None):
+        """True unless REST confirmed the state within `max_age` or the stream is provably live."""
+        now = time.time() if now is None else now
+        max_age = self.max_age if max_age is None else max_age
+        if self.synced_at is None:
+            return True
+        return not self.stream_connected(now) and now - self.synced_at > max_age
+
+    def meta(self, now=None):
+        now = time.time() if now is None else now
+        age = None if self.synced_at is None else now - self.synced_at
+        return {
+            "version": self.version,
+            "synced_at": self.synced_at,
+            "age": None if age is None else round(age, 3),
+            "last_event_at": self.last_event_at,
+            "stream_seen_at": self.stream_seen_at,
+            "stream_connected": self.stream_connected(now),
+            "account_pending": self.account_pending,
+            # With the stream live, events keep the state current however long ago REST was read.
+            "stale": self.is_stale(now=now),
+        }
+
+
+class BrokerState:
+    def __init__(self, load_account, load_positions, load_orders, stream=None, worker=None,
+                 reconcile_interval=RECONCILE_SECONDS, fallback_interval=FALLBACK_SECONDS,
+                 max_age=MAX_AGE_SECONDS, heartbeat_interval=HEARTBEAT_SECONDS, reconnect_delay=1.0):
+        """`load_*` are the alpaca_utils REST readers (or stand-ins); `stream` is anything with
+        alpaca TradingStream's subscribe_trade_updates(handler) / run() / stop() that calls its
+        `on_listening` attribute when a subscription is confirmed (see trading_stream())."""
+        self.load_account = load_account
+        self.load_positions = load_positions
+        self.load_orders = load_orders
+        self.stream = stream
+        self.worker = worker or RefreshWorker()
+        self.reconcile_interval = reconcile_interval
+        self.fallback_interval = fallback_interval
+        self.max_age = max_age
+        self.heartbeat_interval = heartbeat_interval
+        self.stream_timeout = 3 * heartbeat_interval  # two missed confirmations in a row
+        self.reconnect_delay = reconnect_delay  # doubles with each run() that fails quickly
+        self._lock = threading.Lock()
+        self._account = {}
+        self._positions = {}
+        self._orders = {}
+        self._closed = OrderedDict()
+        self._reconciling = False
+        self._resync = False
+        self._buffer = []
+        self._synced_at = None
+        self._last_event_at = None
+        self._account_pending = False
+        self._stream_seen_at = None
+        self._stream_thread = None
+        self._stopping = threading.Event()
+        self._version = 0
+        self._snapshot = self._build_snapshot()
+        self.events = 0
+        self.reconciles = 0
+        self.last_error = None
+
+    # ---------- Reads (no I/O) ---------- #
+
+    def snapshot(self, max_age=None):
+        """Current state; with `max_age`, first re-read REST if the state is older than that
+        with no live stream to vouch for it, or if a fill left the account pending."""
+        snapshot = self._snapshot
+        if max_age is not None:
+            if snapshot.is_stale(max_age):
+                self.reconcile()
+            elif snapshot.account_pending:
+                self.refresh_account()
+            snapshot = self._snapshot
+        return snapshot
+
+    def get_account_info(self):
+        return dict(self._snapshot.account)
+
+    def get_positions(self):
+        return [dict(p) for p in self._snapshot.positions]
+
+    def get_open_orders(self):
+        return [dict(o) for o in self._snapshot.orders]
+
+    def meta(self):
+        return self._snapshot.meta()
+
+    def _build_snapshot(self):
+        """Called with the lock held (or from __init__)."""
+        self._version += 1
+        return BrokerSnapshot(
+            account=dict(self._account),
+            positions=tuple(dict(p) for p in self._positions.values()),
+            orders=tuple(dict(o) for o in self._orders.values()),
+            version=self._version,
+            synced_at=self._synced_at,
+            last_event_at=self._last_event_at,
+            stream_seen_at=self._stream_seen_at,
+            account_pending=self._account_pending,
+            max_age=self.max_age,
+            stream_timeout=self.stream_timeout,
+        )
+
+    def _publish(self):
+        self._snapshot = self._build_snapshot()
+
+    # ---------- Stream events ---------- #
+
+    async def on_trade_update(self, update):
+        """Handler for TradingStream.subscribe_trade_updates (which requires a coroutine)."""
+        self.apply(update)
+
+    def apply(self, update):
+        with self._lock:
+            if self._reconciling:
+                self._buffer.append(update)  # replayed over the REST result it may predate
+            fill = self._apply(update)
+            self._last_event_at = self._stream_seen_at = time.time()
+            self.events += 1
+            self._publish()
+        if fill and "broker_account" in self.worker.jobs:
+            self.worker.trigger("broker_account")
+
+    def _apply(self, update):
+        """Fold one trade update into the state; returns True for fills. Lock held."""
+        event = _text(_field(update, "event"))
+        order = _order_dict(_field(update, "order"))
+        order_id = order["id"]
+
+        if _text(order["status"]) in OPEN_ORDER_STATUSES:
+            if order_id not in self._closed:
+                self._orders[order_id] = order
+        else:
+            self._orders.pop(order_id, None)
+            self._closed[order_id] = True
+            while len(self._closed) > CLOSED_ORDER_MEMORY:
+                self._closed.popitem(last=False)
+
+        if event not in FILL_EVENTS:
+            return False
+        symbol = order["symbol"]
+        price = float(_field(update, "price"))
+        qty = float(_field(update, "qty") or 0.0)
+        signed = qty if _text(order["side"]) == "buy" else -qty
+        held = self._positions.get(symbol)
+        old_qty = float(held["qty"]) if held else 0.0
+        old_avg = float(held["avg_entry_price"]) if held else price
+        position_qty = _field(update, "position_qty")
+        new_qty = float(position_qty) if position_qty is not None else old_qty + signed
+
+        if new_qty == 0:
+            self._positions.pop(symbol, None)
+        else:
+            if old_qty == 0 or (old_qty > 0) != (new_qty > 0):
+                avg = price  # opened or flipped side
+            elif abs(new_qty) > abs(old_qty):
+                # Added to the position: weight in only the part that's new, which keeps a
+                # replayed fill (position already at new_qty) from moving the average.
+                added = new_qty - old_qty
+                avg = (old_qty * old_avg + added * price) / new_qty
+            else:
+                avg = old_avg  # reducing doesn't change the entry price
+            self._positions[symbol] = {
+                "symbol": symbol,
+                "qty": _number(new_qty),
+                "avg_entry_price": _number(avg),
+                "current_price": _number(price),
+                "market_value": _number(new_qty * price),
+            }
+        self._account_pending = True
+        return True
+
+    # ---------- REST ---------- #
+
+    @staticmethod
+    def _check(response, what):
+        if isinstance(response, dict) and "error" in response:
+            raise RuntimeError(f"Could not read {what}: {response['error']}")
+        return response
+
+    def reconcile(self):
+        """Replace the state with a fresh REST read; events that arrive meanwhile are replayed on top."""
+        with self._lock:
+            self._reconciling = True
+            self._resync = False
+            self._buffer = []
+        try:
+            account = self._check(self.load_account(), "the account")
+            positions = self._check(self.load_positions(), "positions")
+            orders = self._check(self.load_orders(), "open orders")
+        except Exception as e:
+            with self._lock:
+                self._reconciling = False
+                self._buffer = []
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        with self._lock:
+            self._account = dict(account)
+            self._positions = {p["symbol"]: dict(p) for p in positions}
+            self._orders = {str(o["id"]): _order_dict(o) for o in orders}
+            self._account_pending = False
+            for update in self._buffer:
+                self._apply(update)
+            self._reconciling = False
+            self._buffer = []
+            self._synced_at = time.time()
+            self.reconciles += 1
+            self.last_error = None
+            self._publish()
+
+    def refresh_account(self):
+        account = self._check(self.load_account(), "the account")
+        with self._lock:
+            self._account = dict(account)
+            self._account_pending = False
+            self._publish()
+
+    def _scheduled_reconcile(self):
+        due = self.reconcile_interval if self._snapshot.stream_connected() else self.fallback_interval
+        if self._resync or self._synced_at is None or time.time() - self._synced_at >= due:
+            self.reconcile()
+
+    def _scheduled_account(self):
+        if self._account_pending:
+            self.refresh_account()
+
+    # ---------- Lifecycle ---------- #
+
+    def _request_resync(self):
+        """Reconcile on the worker as soon as possible, whatever the schedule says."""
+        self._resync = True
+        if "broker_reconcile" in self.worker.jobs:
+            self.worker.trigger("broker_reconcile")
+
+    def _on_listening(self):
+        """The stream confirmed the trade_updates subscription: it's connected right now."""
+        with self._lock:
+            reconnected = not self._snapshot.stream_connected()
+            self._stream_seen_at = time.time()
+            self._publish()
+        if reconnected:
+            self._request_resync()  # events sent while it was down or silent never arrived
+
+    def _heartbeat(self):
+        # Re-subscribing makes a connected stream answer with a fresh confirmation;
+        # a stream that is down or reconnecting sends nothing and ages out.
+        self.stream.subscribe_trade_updates(self.on_trade_update)
+
+    def _run_stream(self):
+        retries = 0
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            try:
+                self.stream.run()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Trade update stream failed: {self.last_error}")
+            with self._lock:
+                self._stream_seen_at = None
+                self._publish()
+            if self._stopping.is_set():
+                break
+            self._request_resync()  # events may have been missed while down
+            retries = 0 if time.monotonic() - started > 60 else retries + 1
+            self._stopping.wait(min(60.0, self.reconnect_delay * 2.0 ** retries))
+
+    def start(self):
+        """Seed from REST, then follow the stream and reconcile in the background."""
+        self._stopping.clear()
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"Broker state seed failed, retrying in the background: {e}")
+        self.worker.add("broker_reconcile", self._scheduled_reconcile, min(self.fallback_interval,
+                                                                           self.reconcile_interval), warm=True)
+        self.worker.add("broker_account", self._scheduled_account, self.reconcile_interval, warm=True)
+        self.worker.start()
+        if self.stream is not None and self._stream_thread is None:
+            self.stream.on_listening = self._on_listening
+            self.stream.subscribe_trade_updates(self.on_trade_update)
+            self.worker.add("broker_heartbeat", self._heartbeat, self.heartbeat_interval, warm=True)
+            self._stream_thread = threading.Thread(target=self._run_stream, name="broker-stream", daemon=True)
+            self._stream_thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self.stream is not None:
+            try:
+                self.stream.stop()
+            except Exception as e:
+                print(f"Stopping the trade update stream failed: {e}")
+        if self._stream_thread is not None:
+            self._stream_thread.join(timeout=5)
+            self._stream_thread = None
+        self.worker.stop()
+
+    def stats(self):
+        return dict(self.meta(), events=self.events, reconciles=self.reconciles, last_error=self.last_error,
+                    positions=len(self._snapshot.positions), open_orders=len(self._snapshot.orders))
+
+
+class LocalTradeStream:
+    """Stand-in for alpaca's TradingStream: publish() events and run() hands them to the handler.
+
+    Like the real stream it confirms the subscription when run() connects and
+    whenever subscribe_trade_updates is called while running. Set
+    `responsive` to False to simulate a connection that has silently died.
+    """
+
+    _STOP = object()
+    _DROP = object()
+    _LISTEN = object()
+
+    def __init__(self):
+        self._handler = None
+        self._queue = queue.Queue()
+        self.running = threading.Event()
+        self.responsive = True
+        self.on_listening = None
+
+    def subscribe_trade_updates(self, handler):
+        self._handler = handler
+        if self.running.is_set():
+            self._queue.put(self._LISTEN)
+
+    def publish(self, update):
+        self._queue.put(update)
+
+    def drop(self):
+        """Make run() fail as if the connection went away."""
+        self._queue.put(self._DROP)
+
+    def join(self, timeout=5.0):
+        """Wait until every published event has been handled."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        self.running.set()
+        self._queue.put(self._LISTEN)  # the subscription sent on connect
+        try:
+            while True:
+                update = self._queue.get()
+                try:
+                    if update is self._STOP:
+                        return
+                    if update is self._DROP:
+                        raise ConnectionError("local stream dropped")
+                    if update is self._LISTEN:
+                        if self.responsive and self.on_listening is not None:
+                            self.on_listening()
+                        continue
+                    result = self._handler(update)
+                    if asyncio.iscoroutine(result):
+                        loop.run_until_complete(result)
+                finally:
+                    self._queue.task_done()
+        finally:
+            self.running.clear()
+            loop.close()
+
+    def stop(self):
+        self._queue.put(self._STOP)
+
+
+def trading_stream(api_key, secret_key, paper=True):
+    """alpaca TradingStream that reports subscription confirmations through `on_listening`."""
+    from alpaca.trading.stream import TradingStream
+
+    class ConfirmingTradingStream(TradingStream):
+        on_listening = None
+
+        async def _dispatch(self, msg):
+            # The server answers each "listen" with {"stream": "listening", ...}, which
+            # TradingStream drops; it's the only sign that the socket is really up.
+            if msg.get("stream") == "listening" and self.on_listening is not None:
+                if "trade_updates" in (msg.get("data") or {}).get("streams", []):
+                    self.on_listening()
+            await super()._dispatch(msg)
+
+    return ConfirmingTradingStream(api_key, secret_key, paper=paper)
+
+
+_broker_state = None
+_broker_state_lock = threading.Lock()
+
+
+def get_broker_state():
+    """Shared, started BrokerState for the Alpaca account; BROKER_STREAM=0 skips the stream."""
+    global _broker_state
+    with _broker_state_lock:
+        if _broker_state is None:
+            from utils import alpaca_utils  # needs broker credentials
+            stream = None
+            if os.getenv("BROKER_STREAM", "1") != "0":
+                stream = trading_stream(alpaca_utils.API_KEY, alpaca_utils.API_SECRET, paper=alpaca_utils.PAPER)
+            _broker_state = BrokerState(alpaca_utils.get_account_info, alpaca_utils.get_positions,
+                                        alpaca_utils.get_open_orders, stream=stream).start()
+        return _broker_state
@@ -0,0 +1,90 @@
+"""Concurrent, rate-limited bulk fetching over a list of symbols."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from utils.rate_limit import call_with_retry
+
+
+@dataclass
+class BulkResult:
+    succeeded: dict = field(default_factory=dict)  # symbol -> fetched payload
+    failed: dict = field(default_factory=dict)     # symbol -> error message
+    elapsed: float = 0.0
+
+    @property
+    def attempted(self):
+        return len(self.succeeded) + len(self.failed)
+
+    @property
+    def throughput(self):
+        """Completed symbols per second."""
+        return self.attempted / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"Fetched {len(self.succeeded)}/{self.attempted} symbols in {self.elapsed:.1f}s "
+            f"({self.throughput:.2f} symbols/s), {len(self.failed)} failed"
+        )
+
+
+def run_bulk(symbols, fetch, bucket=None, max_workers=4, retries=3, backoff=1.0, on_result=None,
+             on_batch=None, batch_size=25):
+    """Fetch every symbol concurrently and return a BulkResult.
+
+    `fetch(symbol)` is called on a worker thread, taking a token from `bucket`
+    before each attempt and retrying transient errors. A symbol that still fails
+    is recorded in `BulkResult.failed` and the run carries on with the rest.
+    `on_result(symbol, payload)` is called on the calling thread as results
+    arrive, so it can write to storage without extra locking; `on_batch`
+    gets them `batch_size` at a time instead, as a {symbol: payload} dict.
+    If either raises, the symbols it was given are recorded as failed.
+    """
+    result = BulkResult()
+    start = time.monotonic()
+    batch = {}
+
+    def flush():
+        if not batch:
+            return
+        items = dict(batch)
+        batch.clear()
+        try:
+            on_batch(items)
+        except Exception as e:
+            print(f"Failed to store {len(items)} symbols ({', '.join(items)}): {e}")
+            for symbol in items:
+                del result.succeeded[symbol]
+                result.failed[symbol] = f"store failed: {e}"
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(call_with_retry, fetch, symbol, retries=retries, backoff=backoff, bucket=bucket): symbol
+            for symbol in symbols
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                payload = future.result()
+            except Exception as e:
+                result.failed[symbol] = str(e)
+                print(f"Failed {symbol}: {e}")
+                continue
+            result.succeeded[symbol] = payload
+            if on_result is not None:
+                try:
+                    on_result(symbol, payload)
+                except Exception as e:
+                    del result.succeeded[symbol]
+                    result.failed[symbol] = f"store failed: {e}"
+                    print(f"Failed to store {symbol}: {e}")
+                    continue
+            if on_batch is not None:
+                batch[symbol] = payload
+                if len(batch) >= batch_size:
+                    flush()
+    flush()
+
+    result.elapsed = time.monotonic() - start
+    return result
@@ -4,6 +4,13 @@ from dotenv import load_dotenv
 import requests
 import os
 import numpy as np
+from dataclasses import dataclass
+
+from utils.bar_store import BarStore
+from utils.metrics import timed
+from utils.optimizer import optimize_weights
+from utils.portfolio_index import PortfolioIndex
+from utils.universe_cache import UniverseCache
 
 load_dotenv()
 
@@ -89,47 +96,375 @@ def score_stock(info):
 
     return pd.Series([round(total_roi, 2), round(total_risk, 2)])
 
-def make_portfolio(diversification, max_risk):
+# Sub-score columns added by score_universe, in the order score_stock computes them.
+# The beta-based "risk" sub-score is betaRiskScore so it isn't confused with the riskScore total.
+SUB_SCORE_COLUMNS = [
+    "valueScore",
+    "growthScore",
+    "profitabilityScore",
+    "dividendScore",
+    "betaRiskScore",
+    "stabilityScore",
+    "sentimentScore",
+    "rangeScore",
+    "trendScore",
+]
+
+
+def _clip_like_python(x):
+    """max(0, min(100, x)) with Python's NaN behaviour (NaN ends up as 100), elementwise."""
+    x = np.where(x < 100, x, 100.0)
+    return np.where(x > 0, x, 0.0)
+
+
+def _column(df, name, default):
+    """Numeric column as a float array, mirroring info.get(name, default) in score_stock."""
+    if name not in df.columns:
+        return np.full(len(df), float(default))
+    col = df[name]
+    if col.dtype == object:
+        col = col.fillna(default)  # `info.get(...) or 0` turns None into the default
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=float)
+
+
+RATING_COLUMNS = [
+    "AnalystRatingStrongBuy",
+    "AnalystRatingBuy",
+    "AnalystRatingHold",
+    "AnalystRatingSell",
+    "AnalystRatingStrongSell",
+]
+
+# Input columns each sub-score reads, so a change to some columns only recomputes what depends on them.
+SCORE_INPUTS = {
+    "valueScore": ["pe_ratio"],
+    "growthScore": ["quarterly_earnings_growth_yoy"],
+    "profitabilityScore": ["return_on_equity_ttm", "profit_margin"],
+    "dividendScore": ["dividend_yield"],
+    "betaRiskScore": ["beta"],
+    "stabilityScore": ["price_to_book_ratio"],
+    "sentimentScore": RATING_COLUMNS,
+    "rangeScore": ["price", "52WeekHigh", "52WeekLow"],
+    "trendScore": ["50DayMovingAverage", "200DayMovingAverage"],
+}
+
+
+def _value_score(df):
+    pe = _column(df, "pe_ratio", 0)
+    return _clip_like_python(100 - np.where(pe > 0, pe, 50))
+
+
+def _growth_score(df):
+    return _clip_like_python(_column(df, "quarterly_earnings_growth_yoy", 0) * 300)
+
+
+def _profitability_score(df):
+    roe = _column(df, "return_on_equity_ttm", 0)
+    pm = _column(df, "profit_margin", 0)
+    return _clip_like_python((roe * 400) + (pm * 200))
+
+
+def _dividend_score(df):
+    return _clip_like_python(_column(df, "dividend_yield", 0) * 8000)
+
+
+def _beta_risk_score(df):
+    return _clip_like_python(100 - np.abs(_column(df, "beta", 1) - 1) * 100)
+
+
+def _stability_score(df):
+    return _clip_like_python(100 - (_column(df, "price_to_book_ratio", 0) - 1) * 50)
+
+
+def _sentiment_score(df):
+    strong_buy, buy, hold, sell, strong_sell = (_column(df, name, 0) for name in RATING_COLUMNS)
+    total_ratings = strong_buy + buy + hold + sell + strong_sell
+    weighted = strong_buy * 5 + buy * 4 + hold * 3 + sell * 2 + strong_sell * 1
+    return np.where(total_ratings > 0, _clip_like_python(weighted / (total_ratings * 5) * 100), 50.0)
+
+
+def _range_score(df):
+    price = _column(df, "price", 0)
+    high = _column(df, "52WeekHigh", 0)
+    low = _column(df, "52WeekLow", 0)
+    range_position = (price - low) / (high - low)
+    return np.where((high > 0) & (low > 0), _clip_like_python((1 - np.abs(range_position - 0.5)) * 200), 50.0)
+
+
+def _trend_score(df):
+    fifty_day_ma = _column(df, "50DayMovingAverage", 0)
+    two_hundred_day_ma = _column(df, "200DayMovingAverage", 0)
+    return np.where(
+        (fifty_day_ma > 0) & (two_hundred_day_ma > 0),
+        _clip_like_python((fifty_day_ma / two_hundred_day_ma) * 100),
+        50.0,
+    )
+
+
+_SUB_SCORERS = {
+    "valueScore": _value_score,
+    "growthScore": _growth_score,
+    "profitabilityScore": _profitability_score,
+    "dividendScore": _dividend_score,
+    "betaRiskScore": _beta_risk_score,
+    "stabilityScore": _stability_score,
+    "sentimentScore": _sentiment_score,
+    "rangeScore": _range_score,
+    "trendScore": _trend_score,
+}
+
+
+def _add_totals(scored):
+    """roiScore/riskScore from the sub-score columns, weighted as in score_stock."""
+    col = {name: scored[name].to_numpy() for name in SUB_SCORE_COLUMNS}
+    total_roi = (
+        0.3 * col["valueScore"] +
+        0.3 * col["profitabilityScore"] +
+        0.2 * col["growthScore"] +
+        0.1 * col["dividendScore"] +
+        0.1 * col["trendScore"]
+    )
+
+    total_risk = (
+        0.35 * col["betaRiskScore"] +
+        0.30 * col["stabilityScore"] +
+        0.15 * col["sentimentScore"] +
+        0.20 * col["rangeScore"]
+    )
+    scored["roiScore"] = np.round(total_roi, 2)
+    scored["riskScore"] = np.round(total_risk, 2)
+    return scored
+
+
+@timed("score_universe")
+def score_universe(stock_df):
+    """Vectorized score_stock over a whole DataFrame.
+
+    Returns a copy of `stock_df` with every sub-score (SUB_SCORE_COLUMNS)
+    plus the roiScore/riskScore totals as columns, matching score_stock
+    row for row.
+    """
+    scored = stock_df.copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name in SUB_SCORE_COLUMNS:
+            scored[name] = _SUB_SCORERS[name](stock_df)
+    return _add_totals(scored)
+
+
+def affected_scores(columns):
+    """Sub-scores that read any of `columns`."""
+    columns = set(columns)
+    return [name for name in SUB_SCORE_COLUMNS if columns.intersection(SCORE_INPUTS[name])]
+
+
+@timed("rescore")
+def rescore(scored, changes):
+    """Apply changed input columns to a score_universe result, recomputing only what they affect.
+
+    `changes` has a 'symbol' column plus the changed columns, with the same
+    rows in the same order as `scored` (e.g. store.load_frame(["price"])).
+    A price-only change recomputes rangeScore and the totals instead of all
+    nine sub-scores. Returns a new frame; `scored` is left untouched.
+    """
+    if not np.array_equal(changes["symbol"].to_numpy(), scored["symbol"].to_numpy()):
+        raise ValueError("rescore needs the changes for exactly the scored rows, in order")
+    columns = [c for c in changes.columns if c != "symbol"]
+    updated = scored.copy(deep=False)
+    for column in columns:
+        updated[column] = changes[column].to_numpy()
+    names = affected_scores(columns)
+    if not names:
+        return updated
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for name in names:
+            updated[name] = _SUB_SCORERS[name](updated)
+    return _add_totals(updated)
+
+
+def validate_scores(stock_df, atol=1e-9):
+    """Check score_universe against the row-wise score_stock; returns the mismatching symbols."""
+    expected = stock_df.apply(score_stock, axis=1)
+    actual = score_universe(stock_df)[["roiScore", "riskScore"]].to_numpy()
+    bad = ~np.isclose(expected.to_numpy(dtype=float), actual, atol=atol, equal_nan=True).all(axis=1)
+    return stock_df.loc[bad, "symbol"].tolist()
+
+
+_universe_cache = None
+
+
+def get_universe_cache():
+    """Shared scored-universe cache used by make_portfolio and the API."""
+    global _universe_cache
+    if _universe_cache is None:
+        _universe_cache = UniverseCache(scorer=score_universe, rescorer=rescore)
+    return _universe_cache
+
+
+def num_stocks_for(diversification):
     if diversification > 90 and diversification <= 100:
-        num_stocks = 35
+        return 35
     elif diversification > 80:
-        num_stocks = 30
+        return 30
     elif diversification > 70:
-        num_stocks = 25
+        return 25
     elif diversification > 60:
-        num_stocks = 20
+        return 20
     elif diversification > 50:
-        num_stocks = 15
+        return 15
     elif diversification > 40:
-        num_stocks = 10
+        return 10
     elif diversification > 20:
-        num_stocks = 8
+        return 8
     elif diversification >= 0:
-        num_stocks = 5
+        return 5
+    raise ValueError(f"diversification must be between 0 and 100, got {diversification}")
+
+
+MAX_PORTFOLIO_SIZE = num_stocks_for(100)
+
+
+_bar_store = BarStore()
 
-    portfolio = []
 
-    stock_df = pd.read_csv("backend/data/stock_data.csv")
+def load_price_history(symbols, lookback_days=365, fetch_missing=False):
+    """Daily closes (dates x symbols) from the local bar cache.
+
+    By default this never hits a provider (the API's request path relies on
+    the background bar refresh); `fetch_missing` fills gaps through the bar
+    store's fetcher first, for scripts and other callers outside the app.
+    """
+    start = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=lookback_days)
+    return _bar_store.close_matrix(symbols, "1Day", start=start, fetch_missing=fetch_missing)
+
+
+@timed("portfolio_weights")
+def portfolio_weights(picks, method="risk_parity", max_weight=None, sector_cap=None, lookback_days=365,
+                      prices=None, fetch_missing=False):
+    """Weights (summing to exactly 100) for the selected rows of the scored universe.
+
+    `prices` (dates x symbols closes) overrides the bar cache, e.g. for a backtest window.
+    """
+    symbols = picks["symbol"].tolist()
+    if method == "logspace":
+        weights = np.logspace(0, -0.5, len(symbols))  # log scale from 10^0 to 10^-0.5
+        return weights / np.sum(weights) * 100
+    if prices is None:
+        prices = load_price_history(symbols, lookback_days, fetch_missing)
+    return optimize_weights(
+        symbols,
+        method=method,
+        prices=prices,
+        roi_scores=picks["roiScore"].to_numpy(),
+        sectors=picks["sector"].tolist() if "sector" in picks.columns else None,
+        max_weight=max_weight,
+        sector_cap=sector_cap,
+    )
 
-    stock_df[["roiScore", "riskScore"]] = stock_df.apply(score_stock, axis=1)
-    stock_df = stock_df[stock_df["riskScore"] < max_risk]
-    stock_df = stock_df.sort_values("roiScore", ascending=False)
 
-    weights = np.logspace(0, -0.5, num_stocks)  # log scale from 10^0 to 10^-1
-    weights = weights / np.sum(weights) * 100  # normalize to sum to 100%
+@timed("make_portfolio")
+def make_portfolio(diversification, max_risk, method="risk_parity", max_weight=None, sector_cap=None,
+                   snapshot=None, fetch_missing=False):
+    """Top stocks by ROI under the risk ceiling, weighted by `method`.
 
-    for (row, weight) in zip(stock_df.head(num_stocks).itertuples(), weights):
-        weight = int(weight)
-        print(f"{row.symbol}: {row.roiScore}, Weight: {weight}%")
-        portfolio.append((row.symbol, weight))
+    `method` is one of optimizer.METHODS (covariance-aware, using cached
+    daily bars) or "logspace" for the old fixed weighting curve. Pass the
+    universe `snapshot` a cache key was built from so the result matches
+    it; by default the current one is used. `fetch_missing` downloads
+    bars the cache lacks (see load_price_history). Returns (symbol, weight) pairs
+    with fractional weights summing to 100.
+    """
+    num_stocks = num_stocks_for(diversification)
+    if not np.isfinite(max_risk):
+        raise ValueError(f"max_risk must be a finite number, got {max_risk}")
+
+    portfolio = []
+
+    universe = get_universe_cache()
+    snapshot = snapshot or universe.get()
+    index = universe.derived(
+        "portfolio_index", lambda frame: PortfolioIndex(frame, max_k=MAX_PORTFOLIO_SIZE), snapshot
+    )
+    stock_df = snapshot.frame.iloc[index.top_k(max_risk, num_stocks)]
+
+    weights = portfolio_weights(stock_df, method, max_weight, sector_cap, fetch_missing=fetch_missing)
+
+    for (row, weight) in zip(stock_df.itertuples(), weights):
+        if weight <= 1e-9:
+            continue  # the optimizer gave this name nothing
+        print(f"{row.symbol}: {row.roiScore}, Weight: {weight:.2f}%")
+        portfolio.append((row.symbol, float(weight)))
     
     return portfolio
 
+DIVERSIFICATION_BINS = [20, 40, 50, 60, 70, 80, 90]  # upper edges (inclusive) of the num_stocks_for bands
+DIVERSIFICATION_SIZES = np.array([5, 8, 10, 15, 20, 25, 30, 35])
+
+
+@dataclass
+class PortfolioBatch:
+    """Portfolios for many profiles in compact array form.
+
+    Row i of `positions`/`weights` is profile i: indices into `symbols`
+    (-1 padded) and the matching weights (0 padded), best ROI first.
+    """
+    symbols: np.ndarray
+    positions: np.ndarray
+    weights: np.ndarray
+    version: int
+
+    def __len__(self):
+        return len(self.positions)
+
+    def portfolio(self, i):
+        keep = (self.positions[i] >= 0) & (self.weights[i] > 1e-9)
+        return [(self.symbols[p], float(w)) for p, w in zip(self.positions[i][keep], self.weights[i][keep])]
+
+
+@timed("make_portfolios")
+def make_portfolios(profiles, method="risk_parity", max_weight=None, sector_cap=None, fetch_missing=False):
+    """Portfolios for many (diversification, max_risk) profiles in one pass.
+
+    The universe snapshot and risk/ROI index are shared by every profile,
+    selection is one vectorized index lookup, and weights are computed once
+    per distinct selection. Returns a PortfolioBatch whose entries match
+    make_portfolio for the same profile.
+    """
+    profiles = np.asarray(profiles, dtype=float).reshape(-1, 2)
+    diversification, max_risk = profiles[:, 0], profiles[:, 1]
+    if ((diversification < 0) | (diversification > 100) | np.isnan(diversification)).any():
+        raise ValueError("diversification must be between 0 and 100")
+    if not np.isfinite(max_risk).all():
+        raise ValueError("max_risk must be a finite number")
+    sizes = DIVERSIFICATION_SIZES[np.searchsorted(DIVERSIFICATION_BINS, diversification, side="left")]
+
+    universe = get_universe_cache()
+    snapshot = universe.get()
+    index = universe.derived(
+        "portfolio_index", lambda frame: PortfolioIndex(frame, max_k=MAX_PORTFOLIO_SIZE), snapshot
+    )
+    positions = index.top_k_many(max_risk, MAX_PORTFOLIO_SIZE)
+    positions[np.arange(MAX_PORTFOLIO_SIZE)[None, :] >= sizes[:, None]] = -1
+
+    weights = np.zeros(positions.shape)
+    unique, inverse = np.unique(positions, axis=0, return_inverse=True)
+    for u, selection in enumerate(unique):
+        chosen = selection[selection >= 0]
+        if len(chosen) == 0:
+            continue
+        w = portfolio_weights(snapshot.frame.iloc[chosen], method, max_weight, sector_cap,
+                              fetch_missing=fetch_missing)
+        rows = np.flatnonzero(inverse.ravel() == u)
+        weights[np.ix_(rows, np.arange(len(chosen)))] = w
+
+    symbols = snapshot.frame["symbol"].to_numpy()
+    return PortfolioBatch(symbols=symbols, positions=positions, weights=weights, version=snapshot.version)
+
+
 if __name__ == "__main__":
-    portfolio = make_portfolio(diversification=50, max_risk=50)
+    portfolio = make_portfolio(diversification=50, max_risk=50, fetch_missing=True)
     print("\nGenerated Portfolio:")
     for symbol, weight in portfolio:
-        print(f"{symbol}: {weight}%")
+        print(f"{symbol}: {weight:.2f}%")
 
 
       
\ No newline at end of file
@@ -0,0 +1,175 @@
+"""Pooled HTTP clients for the market data providers.
+
+Each provider gets one long-lived requests.Session with a keep-alive
+connection pool, so repeated calls reuse TCP/TLS connections. Timeouts are
+configured once here, and each provider's way of signalling a rate limit is
+turned into RateLimitError so callers can back off uniformly. Transient
+failures are retried through rate_limit.call_with_retry (jittered backoff,
+a quota token per attempt), never by the transport. Bulk loaders that run
+calls under run_bulk, which retries on its own, pass `retries=0` so a
+failing call is never retried by two layers at once.
+"""
+
+import asyncio
+import io
+import os
+import threading
+
+import certifi
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import provider_call
+from utils.rate_limit import RateLimitError, call_with_retry, get_bucket
+from utils.response_cache import get_response_cache, make_key
+
+
+# Phrases Alpha Vantage uses in a 'Note'/'Information' body when the quota is exhausted.
+# The same fields also carry permanent problems (invalid key, premium-only endpoint).
+ALPHA_VANTAGE_QUOTA_PHRASES = ("rate limit", "call frequency", "requests per day", "calls per day", "per minute")
+
+
+def _alpha_vantage_errors(response, data):
+    if isinstance(data, dict):
+        message = data.get("Note") or data.get("Information")
+        if message:
+            # Alpha Vantage answers 200 with these instead of an error status
+            if any(phrase in message.lower() for phrase in ALPHA_VANTAGE_QUOTA_PHRASES):
+                raise RateLimitError(message)
+            raise RuntimeError(f"Alpha Vantage error: {message}")
+        if "Error Message" in data:
+            raise RuntimeError(f"Alpha Vantage error: {data['Error Message']}")
+
+
+def _polygon_errors(response, data):
+    if isinstance(data, dict) and data.get("status") == "ERROR":
+        message = data.get("message") or data.get("error") or "unknown error"
+        if response.status_code == 429 or "exceeded" in message.lower():
+            raise RateLimitError(f"Polygon rate limit: {message}")
+
+
+def _fmp_errors(response, data):
+    if isinstance(data, dict) and "Error Message" in data:
+        message = data["Error Message"]
+        if "limit" in message.lower():
+            raise RateLimitError(f"FMP rate limit: {message}")
+        raise RuntimeError(f"FMP error: {message}")
+
+
+# name -> (base URL, rate-limit parser)
+PROVIDERS = {
+    "alpha_vantage": ("https://www.alphavantage.co", _alpha_vantage_errors),
+    "polygon": ("https://api.polygon.io", _polygon_errors),
+    "fmp": ("https://financialmodelingprep.com", _fmp_errors),
+}
+
+
+class ProviderClient:
+    def __init__(self, name, base_url, check_errors=None, pool_size=10, timeout=10, bucket=None, cache=None,
+                 retries=2, backoff=0.5):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.check_errors = check_errors
+        self.timeout = timeout
+        self.retries = retries  # default for calls that don't pass their own
+        self.backoff = backoff
+        self.bucket = bucket  # quota is only spent on real network requests, not cache hits
+        self.cache = cache
+
+        # No transport-level retries: call_with_retry owns retrying (with backoff and the token bucket).
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.verify = certifi.where()
+
+    def _retrying(self, fn, retries, *args):
+        retries = self.retries if retries is None else retries
+        return call_with_retry(fn, *args, retries=retries, backoff=self.backoff)
+
+    def get_json(self, path, params=None, timeout=None, cache_policy=None, retries=None):
+        """GET `path` and return the decoded JSON body.
+
+        With a `cache_policy` (see response_cache.CACHE_POLICIES) the response
+        is served from the on-disk cache when still valid. Transient errors
+        (rate limits, timeouts, 429/5xx) are retried `retries` times, by
+        default the client's. Raises RateLimitError when the provider reports
+        a quota problem and requests.HTTPError for any other non-2xx status.
+        """
+        def fetch():
+            return self._retrying(self._fetch_json, retries, path, params, timeout)
+
+        if cache_policy is not None and self.cache is not None:
+            key = make_key(self.name, path, params)
+            return self.cache.get_or_fetch(key, cache_policy, fetch)
+        return fetch()
+
+    def _fetch_json(self, path, params=None, timeout=None):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        with provider_call(self.name, "get_json"):
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=timeout or self.timeout)
+            try:
+                data = response.json()
+            except ValueError:
+                data = None
+
+            if response.status_code == 429:
+                raise RateLimitError(f"{self.name} rate limit (429)")
+            if self.check_errors is not None:
+                self.check_errors(response, data)
+            response.raise_for_status()
+            if data is None:
+                raise ValueError(f"{self.name} returned a non-JSON response")
+            return data
+
+    def get_csv(self, path, params=None, timeout=None, retries=None):
+        """GET a CSV endpoint (e.g. FMP bulk downloads) and return it as a DataFrame."""
+        return self._retrying(self._fetch_csv, retries, path, params, timeout)
+
+    def _fetch_csv(self, path, params=None, timeout=None):
+        if self.bucket is not None:
+            self.bucket.acquire()
+        with provider_call(self.name, "get_csv"):
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=timeout or self.timeout)
+            if response.status_code == 429:
+                raise RateLimitError(f"{self.name} rate limit (429)")
+            response.raise_for_status()
+            return pd.read_csv(io.StringIO(response.text))
+
+    async def aget_json(self, path, params=None, timeout=None, cache_policy=None, retries=None):
+        """Async variant of get_json; runs on a worker thread so the pooled session is shared."""
+        return await asyncio.to_thread(self.get_json, path, params, timeout, cache_policy, retries)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(provider):
+    """Shared client for `provider`, rate limited by its token bucket and backed by the response cache.
+
+    Pool size, timeout and default retries come from <PROVIDER>_POOL_SIZE /
+    <PROVIDER>_TIMEOUT / <PROVIDER>_RETRIES.
+    """
+    with _clients_lock:
+        client = _clients.get(provider)
+        if client is None:
+            base_url, check_errors = PROVIDERS[provider]
+            prefix = provider.upper()
+            client = ProviderClient(
+                provider,
+                base_url,
+                check_errors,
+                pool_size=int(os.getenv(f"{prefix}_POOL_SIZE", "10")),
+                timeout=float(os.getenv(f"{prefix}_TIMEOUT", "10")),
+                bucket=get_bucket(provider),
+                cache=get_response_cache(),
+                retries=int(os.getenv(f"{prefix}_RETRIES", "2")),
+            )
+            _clients[provider] = client
+        return client
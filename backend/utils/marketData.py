@@ -1,20 +1,30 @@
 from arrow import get
 from dotenv import load_dotenv
 import os
-import certifi
 
 
 load_dotenv()
 
 from alpaca.data.historical import StockHistoricalDataClient
-from alpaca.data.requests import StockBarsRequest
-from alpaca.data.timeframe import TimeFrame
+from alpaca.data.requests import StockBarsRequest, StockLatestBarRequest
+from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
+from alpaca.common.enums import Sort
 from datetime import datetime, timedelta, timezone
+import numpy as np
 import pandas as pd
 import yfinance as yf
 import time
 import traceback
 import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.bar_store import BarStore
+from utils.bulk_loader import run_bulk
+from utils.http_client import get_client
+from utils.metrics import provider_call, timed
+from utils.quote_resolver import QuoteResolver
+from utils.rate_limit import RateLimitError, get_bucket
+from utils.stock_store import StockStore, get_store
 
 API_KEY = os.getenv("ALPACA_API_KEY")
 API_SECRET = os.getenv("ALPACA_API_SECRET")
@@ -30,9 +40,12 @@ STOCK_DATA_FILE = os.path.join(DATA_DIR, "stock_data.csv")
 # FMP_KEY = os.getenv("FMP_API_KEY")
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 
+MISSING_VALUES = (None, "None", "-", "")  # how providers spell "no value"
+
+
 def safe_float(value, default=0.0):
     try:
-        if value in (None, "None", "-", ""):
+        if value in MISSING_VALUES:
             return default
         return float(value)
     except (ValueError, TypeError):
@@ -41,10 +54,10 @@ def safe_float(value, default=0.0):
 
 def safe_int(value, default=0):
     try:
-        if value in (None, "None", "-", ""):
+        if value in MISSING_VALUES:
             return default
         return int(float(value))
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, OverflowError):  # OverflowError: "inf"
         return default
     
 
@@ -53,11 +66,10 @@ def get_live_price(symbol: str):
     if not polygon_api_key:
         raise RuntimeError("Missing POLYGON_API_KEY environment variable.")
 
-    url = f"https://api.polygon.io/v2/aggs/ticker/{symbol}/prev?apiKey={polygon_api_key}"
-
     try:
-        response = requests.get(url, timeout=10)
-        data = response.json()
+        data = get_client("polygon").get_json(
+            f"/v2/aggs/ticker/{symbol}/prev", params={"apiKey": polygon_api_key}, cache_policy="prices"
+        )
 
         if "results" in data and len(data["results"]) > 0:
             return round(float(data["results"][0]["c"]), 2)
@@ -65,38 +77,95 @@ def get_live_price(symbol: str):
             raise RuntimeError(f"Polygon error: {data['message']}")
         else:
             raise RuntimeError(f"Unexpected Polygon response: {data}")
+    except RateLimitError:
+        raise
     except Exception as e:
-        raise RuntimeError(f"Failed to fetch free Polygon price for {symbol}: {e}")
+        raise RuntimeError(f"Failed to fetch free Polygon price for {symbol}: {e}") from e
 
 
-def update_stock_data(symbol, stock_info, filename=None):
-    # Create DataFrame from the new info
-    new_data = pd.DataFrame([{ "symbol": symbol, **stock_info }])
+def fetch_grouped_daily_prices(date=None, max_lookback_days=5):
+    """Closing prices for every US stock from one Polygon grouped-daily call.
 
-    if filename is None:
-        filename = STOCK_DATA_FILE
+    With no `date`, walks back from yesterday (the free tier has no same-day
+    data) until a trading day with results is found. Returns {ticker: close}.
+    """
+    polygon_api_key = os.getenv("POLYGON_API_KEY")
+    if not polygon_api_key:
+        raise RuntimeError("Missing POLYGON_API_KEY environment variable.")
+
+    if date is not None:
+        days = [date]
+    else:
+        today = datetime.now(timezone.utc).date()
+        days = [(today - timedelta(days=i)).isoformat() for i in range(1, max_lookback_days + 1)]
 
-    # Ensure data directory exists
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    for day in days:
+        try:
+            data = get_client("polygon").get_json(
+                f"/v2/aggs/grouped/locale/us/market/stocks/{day}",
+                params={"adjusted": "true", "apiKey": polygon_api_key},
+                timeout=30,
+            )
+        except RateLimitError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to fetch Polygon grouped daily for {day}: {e}") from e
+
+        if data.get("results"):
+            return {row["T"]: round(float(row["c"]), 2) for row in data["results"] if "c" in row}
+        if "message" in data and data.get("status") not in ("OK", "DELAYED"):
+            raise RuntimeError(f"Polygon error: {data['message']}")
+        # Empty results on a weekend or holiday: try the day before.
+    raise RuntimeError(f"No Polygon grouped daily results in {days}")
 
-    # If the file doesn't exist, create it
-    if not os.path.exists(filename):
-        new_data.to_csv(filename, index=False)
-        print(f"Created {filename} with {symbol}")
-        return
 
-    # Otherwise, read existing data
-    df = pd.read_csv(filename)
+def fetch_alpaca_latest_prices(symbols, chunk_size=200, max_workers=4):
+    """Latest bar close for many symbols via Alpaca's multi-symbol latest-bars endpoint."""
+    bars = fetch_latest_bars(symbols, chunk_size=chunk_size, max_workers=max_workers)
+    return {symbol: round(float(close), 2) for (symbol, _), close in bars["close"].items()}
 
-    # Check if the symbol exists already
-    if symbol in df["symbol"].values:
-        df.loc[df["symbol"] == symbol, list(stock_info.keys())] = list(stock_info.values())
-        print(f"Updated data for {symbol}")
+
+@timed("refresh_prices")
+def refresh_prices(provider="polygon", store=None):
+    """Reprice the whole universe in one (or a few) provider calls and write the price column once."""
+    store = store or get_store()
+    tickers = store.load_frame(columns=["symbol"])["symbol"].tolist()
+
+    start = time.monotonic()
+    if provider == "polygon":
+        all_prices = fetch_grouped_daily_prices()
+    elif provider == "alpaca":
+        all_prices = fetch_alpaca_latest_prices(tickers)
+    else:
+        raise ValueError(f"Unknown price provider: {provider}")
+
+    prices = pd.Series({t: all_prices[t] for t in tickers if t in all_prices}, dtype=float)
+    missing = [t for t in tickers if t not in all_prices]
+    store.update_column("price", prices)
+    store.export_csv()
+
+    print(f"Priced {len(prices)}/{len(tickers)} symbols via {provider} in {time.monotonic() - start:.1f}s")
+    if missing:
+        print(f"No price for: {', '.join(missing)}")
+    return prices
+
+
+def update_stock_data(symbol, stock_info, filename=None):
+    """Upsert one symbol's fields into the fundamentals store.
+
+    `filename` selects a different CSV export (and its sibling .db store).
+    """
+    if filename is None:
+        store = get_store()
     else:
-        df = pd.concat([df, new_data], ignore_index=True)
-        print(f"Added new data for {symbol}")
+        store = StockStore(path=os.path.splitext(filename)[0] + ".db", csv_path=filename)
 
-    df.to_csv(filename, index=False)
+    existed = symbol in store.symbols()
+    store.upsert(symbol, stock_info)
+    print(f"{'Updated' if existed else 'Added new'} data for {symbol}")
+    if filename is not None:
+        store.export_csv()
+        store.close()
 
 def score_stock(current_revenue_growth, past_revenue_growth, pe_ratio, dividend_yield, debt_to_equity=None):
     """
@@ -138,191 +207,380 @@ def score_stock(current_revenue_growth, past_revenue_growth, pe_ratio, dividend_
     }
 
 
-def fetch_with_alpaca(symbol, timeframe=TimeFrame.Day):
+FMP_SCORE_INPUTS = ["current_revenue_growth", "past_revenue_growth", "pe_ratio", "dividend_yield", "debt_to_equity"]
+
+
+def score_stocks(data):
+    """Vectorized score_stock over many symbols.
+
+    `data` is a DataFrame (or dict of arrays) with FMP_SCORE_INPUTS columns;
+    debt_to_equity may be omitted. Returns a DataFrame with the same columns
+    as score_stock's dict, aligned to the input index. Missing inputs (NaN or
+    None) are masked out of the total the same way score_stock drops a
+    missing debt_to_equity, and negative revenue growth scores 0.
+    """
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+
+    def col(name):
+        if name not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)
+
+    cur, past, pe, dy, de = (col(name) for name in FMP_SCORE_INPUTS)
+
+    def growth_score(g):
+        with np.errstate(invalid="ignore"):
+            raw = 100 * np.power(np.maximum(100 * g / 50, 0), 0.7)
+        return np.where(np.isnan(g), np.nan, np.clip(raw, 0, 100))
+
+    scores = np.column_stack([
+        growth_score(cur),
+        growth_score(past),
+        np.clip(100 - np.abs((pe - 20) / 20 * 100), 0, 100),
+        np.minimum(dy * 2000, 100),
+        np.where(de < 0, 0.0, np.clip(100 - de * 50, 0, 100)),
+    ])
+
+    # Average over the sub-scores that are present, like score_stock's None filtering.
+    present = ~np.isnan(scores)
+    counts = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total = np.where(present, scores, 0.0).sum(axis=1) / counts
+    total = np.where(counts > 0, total, np.nan)
+
+    names = ["Current Revenue Growth Score", "Past Revenue Growth Score", "P/E Score", "Dividend Yield Score", "Debt Score"]
+    out = pd.DataFrame(np.round(scores, 2), columns=names, index=df.index)
+    out["Total Score"] = np.round(total, 2)
+    return out
+
+
+LATEST_BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+
+def _fetch_latest_chunk(symbols):
+    get_bucket("alpaca").acquire()
+    with provider_call("alpaca", "latest_bar"):
+        return client.get_stock_latest_bar(StockLatestBarRequest(symbol_or_symbols=list(symbols), feed="iex"))
+
+
+def fetch_latest_bars(symbols, chunk_size=200, max_workers=4):
+    """Most recent (minute) bar for many symbols at once.
+
+    Uses the latest-bars endpoint, so each symbol costs one row however long
+    the session has been open. Symbols are split into chunks of `chunk_size`
+    per request and the chunks are fetched concurrently. Returns one
+    DataFrame indexed by (symbol, timestamp) with open/high/low/close/volume
+    columns and one row per symbol that has traded.
+    """
     if client is None:
         raise RuntimeError("Alpaca client not configured (missing ALPACA_API_KEY/SECRET).")
 
-    now = datetime.now(timezone.utc)
-    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    end = now + timedelta(minutes=1)
-
-    req = StockBarsRequest(
-        symbol_or_symbols=[symbol],
-        timeframe=timeframe,
-        start=start,
-        end=end,
-        feed="iex", 
-        limit=1
-    )
+    symbols = list(dict.fromkeys(symbols))
+    chunks = [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        responses = list(pool.map(_fetch_latest_chunk, chunks))
 
-    bars = client.get_stock_bars(req)
+    rows = [
+        (symbol, bar.timestamp, *(float(getattr(bar, c)) for c in LATEST_BAR_COLUMNS))
+        for bars in responses
+        for symbol, bar in bars.items()
+    ]
+    df = pd.DataFrame(rows, columns=["symbol", "timestamp", *LATEST_BAR_COLUMNS])
+    return df.set_index(["symbol", "timestamp"]).sort_index()
 
-    try:
-        df = bars.df
-        if not df.empty:
-            latest_bar = df.iloc[-1]
-            return {
-                "symbol": symbol,
-                "timestamp": latest_bar.name[1] if isinstance(latest_bar.name, tuple) else latest_bar.name,
-                "open": latest_bar.open,
-                "high": latest_bar.high,
-                "low": latest_bar.low,
-                "close": latest_bar.close,
-                "volume": latest_bar.volume,
-            }
-        else:
-            raise RuntimeError("No data returned for today.")
-    except AttributeError:
-        rows = list(bars)
-        if not rows:
-            raise RuntimeError("No data returned for today.")
-        b = rows[-1]
-        return {
-            "symbol": symbol,
-            "timestamp": b.t,
-            "open": b.o,
-            "high": b.h,
-            "low": b.l,
-            "close": b.c,
-            "volume": getattr(b, "v", None),
-        }
 
+# Length of one bar per alpaca TimeFrameUnit value, for sizing history windows
+TIMEFRAME_UNIT_SECONDS = {"Min": 60, "Hour": 3600, "Day": 86400, "Week": 7 * 86400, "Month": 31 * 86400}
 
 
-def fetch_with_alpha_vintage(symbol):
-    # Primary and backup keys
-    key_1 = os.getenv("ALPHA_VANTAGE_API_KEY")
+def _fetch_last_bar(symbol, timeframe):
+    """Most recent completed-or-forming bar of `timeframe` for one symbol, from the bars endpoint."""
+    bar_seconds = timeframe.amount_value * TIMEFRAME_UNIT_SECONDS[timeframe.unit_value.value]
+    now = datetime.now(timezone.utc)
+    # Wide enough to reach back over weekends and holidays; newest first, so one row is enough.
+    start = now - max(timedelta(days=14), timedelta(seconds=3 * bar_seconds))
+    get_bucket("alpaca").acquire()
+    with provider_call("alpaca", "bars"):
+        bars = client.get_stock_bars(StockBarsRequest(
+            symbol_or_symbols=[symbol], timeframe=timeframe, start=start, end=now + timedelta(minutes=1),
+            feed="iex", sort=Sort.DESC, limit=1,
+        ))
+    df = bars.df
+    if df.empty:
+        return df
+    return df[list(LATEST_BAR_COLUMNS)].set_axis(df.index.rename(["symbol", "timestamp"]))
+
+
+def fetch_with_alpaca(symbol, timeframe=None):
+    """Latest bar for `symbol` as a dict.
+
+    By default (or with TimeFrame.Minute) this is the latest (minute) bar
+    from the latest-bars endpoint; any other `timeframe`, e.g. TimeFrame.Day,
+    returns the most recent bar of that size from the bars endpoint.
+    """
+    if client is None:
+        raise RuntimeError("Alpaca client not configured (missing ALPACA_API_KEY/SECRET).")
+    minute = timeframe is None or (timeframe.amount_value == 1 and timeframe.unit_value == TimeFrameUnit.Minute)
+    df = fetch_latest_bars([symbol]) if minute else _fetch_last_bar(symbol, timeframe)
+    if df.empty:
+        raise RuntimeError("No latest bar returned.")
+
+    (sym, timestamp), latest_bar = next(iter(df.iterrows()))
+    return {
+        "symbol": symbol,
+        "timestamp": timestamp,
+        "open": latest_bar.open,
+        "high": latest_bar.high,
+        "low": latest_bar.low,
+        "close": latest_bar.close,
+        "volume": latest_bar.volume,
+    }
+
+
+
+# Bar cache timeframe name -> (Alpaca timeframe, yfinance interval)
+BAR_TIMEFRAMES = {
+    "1Day": (TimeFrame.Day, "1d"),
+    "1Hour": (TimeFrame.Hour, "1h"),
+    "1Min": (TimeFrame.Minute, "1m"),
+    "5Min": (TimeFrame(5, TimeFrameUnit.Minute), "5m"),
+}
 
 
+def fetch_bar_history(symbol, timeframe, start, end):
+    """Historical bars for one symbol from Alpaca, falling back to yfinance."""
+    alpaca_tf, yf_interval = BAR_TIMEFRAMES[timeframe]
+    try:
+        get_bucket("alpaca").acquire()
+        with provider_call("alpaca", "bar_history"):
+            bars = client.get_stock_bars(StockBarsRequest(
+                symbol_or_symbols=[symbol],
+                timeframe=alpaca_tf,
+                start=start,
+                end=end,
+                feed="iex",
+            ))
+        return bars.df
+    except Exception as e:
+        print(f"Alpaca history failed for {symbol} ({e}); trying yfinance")
+
+    with provider_call("yfinance", "bar_history"):
+        df = yf.Ticker(symbol).history(start=start, end=end, interval=yf_interval, auto_adjust=False)
+    return df[["Open", "High", "Low", "Close", "Volume"]]
+
+
+_bar_store = None
+
+
+def get_bar_store():
+    """Process-wide bar cache that gap-fills from fetch_bar_history."""
+    global _bar_store
+    if _bar_store is None:
+        _bar_store = BarStore(fetcher=fetch_bar_history)
+    return _bar_store
+
+
+# Alpha Vantage OVERVIEW field -> (target column, dtype, default when missing or unparseable)
+OVERVIEW_SCHEMA = [
+    ("Symbol", "symbol", "str", None),
+    ("AssetType", "asset_type", "str", None),
+    ("Name", "name", "str", None),
+    ("Description", "description", "str", None),
+    ("CIK", "cik", "str", None),
+    ("Exchange", "exchange", "str", None),
+    ("Currency", "currency", "str", None),
+    ("Country", "country", "str", None),
+    ("Sector", "sector", "str", None),
+    ("Industry", "industry", "str", None),
+    ("Address", "address", "str", None),
+    ("OfficialSite", "official_site", "str", None),
+    ("FiscalYearEnd", "fiscal_year_end", "str", None),
+    ("LatestQuarter", "latest_quarter", "str", None),
+    ("MarketCapitalization", "market_capitalization", "float", 0.0),
+    ("EBITDA", "ebitda", "float", 0.0),
+    ("PERatio", "pe_ratio", "float", 0.0),
+    ("PEGRatio", "peg_ratio", "float", 0.0),
+    ("BookValue", "book_value", "float", 0.0),
+    ("DividendPerShare", "dividend_per_share", "float", 0.0),
+    ("DividendYield", "dividend_yield", "float", 0.0),
+    ("EPS", "eps", "float", 0.0),
+    ("RevenuePerShareTTM", "revenue_per_share_ttm", "float", 0.0),
+    ("ProfitMargin", "profit_margin", "float", 0.0),
+    ("OperatingMarginTTM", "operating_margin_ttm", "float", 0.0),
+    ("ReturnOnAssetsTTM", "return_on_assets_ttm", "float", 0.0),
+    ("ReturnOnEquityTTM", "return_on_equity_ttm", "float", 0.0),
+    ("RevenueTTM", "revenue_ttm", "float", 0.0),
+    ("GrossProfitTTM", "gross_profit_ttm", "float", 0.0),
+    ("DilutedEPSTTM", "diluted_eps_ttm", "float", 0.0),
+    ("QuarterlyEarningsGrowthYOY", "quarterly_earnings_growth_yoy", "float", 0.0),
+    ("QuarterlyRevenueGrowthYOY", "quarterly_revenue_growth_yoy", "float", 0.0),
+    ("AnalystTargetPrice", "analyst_target_price", "float", 0.0),
+    ("AnalystRatingStrongBuy", "analyst_rating_strong_buy", "int", 0),
+    ("AnalystRatingBuy", "analyst_rating_buy", "int", 0),
+    ("AnalystRatingHold", "analyst_rating_hold", "int", 0),
+    ("AnalystRatingSell", "analyst_rating_sell", "int", 0),
+    ("AnalystRatingStrongSell", "analyst_rating_strong_sell", "int", 0),
+    ("TrailingPE", "trailing_pe", "float", 0.0),
+    ("ForwardPE", "forward_pe", "float", 0.0),
+    ("PriceToSalesRatioTTM", "price_to_sales_ratio_ttm", "float", 0.0),
+    ("PriceToBookRatio", "price_to_book_ratio", "float", 0.0),
+    ("EVToRevenue", "ev_to_revenue", "float", 0.0),
+    ("EVToEBITDA", "ev_to_ebitda", "float", 0.0),
+    ("Beta", "beta", "float", 0.0),
+    ("52WeekHigh", "fifty_two_week_high", "float", 0.0),
+    ("52WeekLow", "fifty_two_week_low", "float", 0.0),
+    ("50DayMovingAverage", "fifty_day_moving_average", "float", 0.0),
+    ("200DayMovingAverage", "two_hundred_day_moving_average", "float", 0.0),
+    ("SharesOutstanding", "shares_outstanding", "int", 0),
+    ("SharesFloat", "shares_float", "int", 0),
+    ("PercentInsiders", "percent_insiders", "float", 0.0),
+    ("PercentInstitutions", "percent_institutions", "float", 0.0),
+    ("DividendDate", "dividend_date", "str", None),
+    ("ExDividendDate", "ex_dividend_date", "str", None),
+]
+
+
+def parse_overview_batch(payloads):
+    """Parse many OVERVIEW payloads into typed column arrays, one per OVERVIEW_SCHEMA entry.
+
+    Each column is converted in one vectorized pass through pd.to_numeric.
+    The few values that pass doesn't parse are settled one by one with
+    safe_float, so the result matches safe_float/safe_int exactly: missing
+    markers and junk become the field default, a literal "nan" stays NaN
+    in float fields, and non-finite values in int fields become the
+    default. Returns {column: ndarray}.
+    """
+    n = len(payloads)
+    columns = {}
+    for source, target, dtype, default in OVERVIEW_SCHEMA:
+        raw = pd.Series([p.get(source) for p in payloads], dtype=object)
+        if dtype == "str":
+            buf = np.empty(n, dtype=object)
+            buf[:] = raw.to_numpy()
+        else:
+            values = pd.to_numeric(raw, errors="coerce").to_numpy(dtype=float, copy=True)
+            unparsed = np.isnan(values)
+            if unparsed.any():
+                objects = raw.to_numpy()
+                missing = np.equal(objects, None) | raw.isin(MISSING_VALUES[1:]).to_numpy()
+                values[unparsed & missing] = np.nan if dtype == "int" else default
+                for i in np.flatnonzero(unparsed & ~missing):
+                    values[i] = safe_float(objects[i], np.nan if dtype == "int" else default)
+            if dtype == "int":
+                buf = np.full(n, default, dtype=np.int64)
+                ok = np.isfinite(values)
+                buf[ok] = np.trunc(values[ok])
+            else:
+                buf = values
+        columns[target] = buf
+    return columns
+
+
+def overview_frame(payloads, symbols=None):
+    """Columnar batch of parsed OVERVIEW payloads as a DataFrame, ready for StockStore.upsert_frame."""
+    df = pd.DataFrame(parse_overview_batch(payloads))
+    if symbols is not None:
+        df["symbol"] = list(symbols)
+    return df
+
+
+def fetch_overview_payload(symbol, retries=None):
+    """Raw Alpha Vantage OVERVIEW JSON for one symbol; `retries` as for ProviderClient.get_json."""
+    key_1 = os.getenv("ALPHA_VANTAGE_API_KEY")
     if not key_1:
         raise RuntimeError("No Alpha Vantage API key provided.")
 
-    def try_fetch(key):
-        url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={symbol}&apikey={key}"
-        resp = requests.get(url, timeout=10, verify=certifi.where())
-        resp.raise_for_status()
-        data = resp.json()
+    try:
+        # Rate-limit 'Note'/'Information' payloads raise RateLimitError in the client
+        data = get_client("alpha_vantage").get_json(
+            "/query", params={"function": "OVERVIEW", "symbol": symbol, "apikey": key_1}, cache_policy="fundamentals",
+            retries=retries,
+        )
         if not data:
             raise RuntimeError("Alpha Vantage returned empty response")
-        if "Note" in data or "Information" in data:
-            # Alpha Vantage returns 'Note' when rate limit is exceeded
-            raise RuntimeError(data.get("Note") or data.get("Information"))
         return data
-
-    # Try primary key first, then backup
-    try:
-        data = try_fetch(key_1)
+    except RateLimitError:
+        raise
     except Exception as e1:
-        raise RuntimeError(f"Alpha Vantage API keys failed: {e1}")
-
-    stock_info = {
-        "symbol": data.get("Symbol"),
-        "asset_type": data.get("AssetType"),
-        "name": data.get("Name"),
-        "description": data.get("Description"),
-        "cik": data.get("CIK"),
-        "exchange": data.get("Exchange"),
-        "currency": data.get("Currency"),
-        "country": data.get("Country"),
-        "sector": data.get("Sector"),
-        "industry": data.get("Industry"),
-        "address": data.get("Address"),
-        "official_site": data.get("OfficialSite"),
-        "fiscal_year_end": data.get("FiscalYearEnd"),
-        "latest_quarter": data.get("LatestQuarter"),
-        "market_capitalization": safe_float(data.get("MarketCapitalization")),
-        "ebitda": safe_float(data.get("EBITDA")),
-        "pe_ratio": safe_float(data.get("PERatio")),
-        "peg_ratio": safe_float(data.get("PEGRatio")),
-        "book_value": safe_float(data.get("BookValue")),
-        "dividend_per_share": safe_float(data.get("DividendPerShare")),
-        "dividend_yield": safe_float(data.get("DividendYield")),
-        "eps": safe_float(data.get("EPS")),
-        "revenue_per_share_ttm": safe_float(data.get("RevenuePerShareTTM")),
-        "profit_margin": safe_float(data.get("ProfitMargin")),
-        "operating_margin_ttm": safe_float(data.get("OperatingMarginTTM")),
-        "return_on_assets_ttm": safe_float(data.get("ReturnOnAssetsTTM")),
-        "return_on_equity_ttm": safe_float(data.get("ReturnOnEquityTTM")),
-        "revenue_ttm": safe_float(data.get("RevenueTTM")),
-        "gross_profit_ttm": safe_float(data.get("GrossProfitTTM")),
-        "diluted_eps_ttm": safe_float(data.get("DilutedEPSTTM")),
-        "quarterly_earnings_growth_yoy": safe_float(data.get("QuarterlyEarningsGrowthYOY")),
-        "quarterly_revenue_growth_yoy": safe_float(data.get("QuarterlyRevenueGrowthYOY")),
-        "analyst_target_price": safe_float(data.get("AnalystTargetPrice")),
-        "analyst_rating_strong_buy": safe_int(data.get("AnalystRatingStrongBuy")),
-        "analyst_rating_buy": safe_int(data.get("AnalystRatingBuy")),
-        "analyst_rating_hold": safe_int(data.get("AnalystRatingHold")),
-        "analyst_rating_sell": safe_int(data.get("AnalystRatingSell")),
-        "analyst_rating_strong_sell": safe_int(data.get("AnalystRatingStrongSell")),
-        "trailing_pe": safe_float(data.get("TrailingPE")),
-        "forward_pe": safe_float(data.get("ForwardPE")),
-        "price_to_sales_ratio_ttm": safe_float(data.get("PriceToSalesRatioTTM")),
-        "price_to_book_ratio": safe_float(data.get("PriceToBookRatio")),
-        "ev_to_revenue": safe_float(data.get("EVToRevenue")),
-        "ev_to_ebitda": safe_float(data.get("EVToEBITDA")),
-        "beta": safe_float(data.get("Beta")),
-        "fifty_two_week_high": safe_float(data.get("52WeekHigh")),
-        "fifty_two_week_low": safe_float(data.get("52WeekLow")),
-        "fifty_day_moving_average": safe_float(data.get("50DayMovingAverage")),
-        "two_hundred_day_moving_average": safe_float(data.get("200DayMovingAverage")),
-        "shares_outstanding": safe_int(data.get("SharesOutstanding")),
-        "shares_float": safe_int(data.get("SharesFloat")),
-        "percent_insiders": safe_float(data.get("PercentInsiders")),
-        "percent_institutions": safe_float(data.get("PercentInstitutions")),
-        "dividend_date": data.get("DividendDate"),
-        "ex_dividend_date": data.get("ExDividendDate")
-    }
+        raise RuntimeError(f"Alpha Vantage API keys failed: {e1}") from e1
 
+
+def fetch_with_alpha_vintage(symbol):
+    data = fetch_overview_payload(symbol)
+    columns = parse_overview_batch([data])
+    stock_info = {name: (values[0].item() if hasattr(values[0], "item") else values[0]) for name, values in columns.items()}
     return ("Stock Info", stock_info)
 
 
-def fetch_with_FMP(symbol):
-    def average_revenue_growth(data, years=5):
-        """
-        Compute the average revenue growth over the last `years` fiscal years.
-        Expects `data` to be a list of dicts with a 'growthRevenue' key.
-        """
-        # Sort by fiscal year (descending) and take the latest N
-        data_sorted = sorted(data, key=lambda x: int(x["fiscalYear"]), reverse=True)
-        recent = data_sorted[1:years]
-
-        # Extract valid growth values
-        growth_values = [entry["growthRevenue"] for entry in recent if "growthRevenue" in entry]
-
-        if not growth_values:
-            return None  # or 0 if you prefer a default
-
-        avg_growth = sum(growth_values) / len(growth_values)
-        return avg_growth
-    import requests
-    import certifi
+def _average_revenue_growth(data, years=5):
+    """
+    Compute the average revenue growth over the last `years` fiscal years.
+    Expects `data` to be a list of dicts with a 'growthRevenue' key.
+    """
+    # Sort by fiscal year (descending) and take the latest N
+    data_sorted = sorted(data, key=lambda x: int(x["fiscalYear"]), reverse=True)
+    recent = data_sorted[1:years]
+
+    # Extract valid growth values
+    growth_values = [entry["growthRevenue"] for entry in recent if "growthRevenue" in entry]
+
+    if not growth_values:
+        return None  # or 0 if you prefer a default
+
+    avg_growth = sum(growth_values) / len(growth_values)
+    return avg_growth
+
+
+def _fmp_ratio_inputs(row):
+    return {
+        "pe_ratio": row.get("priceToEarningsRatioTTM"),
+        "dividend_yield": row.get("dividendYieldTTM"),
+        "debt_to_equity": row.get("debtToEquityRatioTTM"),
+    }
 
+
+# Shared by every fetch_fmp_inputs call so the second FMP request per symbol runs
+# alongside the first without a new thread or event loop per symbol.
+_fmp_executor = ThreadPoolExecutor(max_workers=int(os.getenv("FMP_POOL_SIZE", "10")), thread_name_prefix="fmp")
+
+
+def fetch_fmp_inputs(symbol, ratios=None, retries=None):
+    """Raw score_stock inputs for one symbol, with both FMP endpoints requested concurrently.
+
+    Pass `ratios` (already-fetched TTM ratio inputs, e.g. from the bulk file)
+    to skip the ratios-ttm call; `retries` is passed on to get_json.
+    """
     key = os.getenv("FMP_API_KEY")
     if not key:
         raise RuntimeError("FMP API key not provided. Set FMP_API_KEY env var or pass api_key.")
 
-    income_statement_growth = f"https://financialmodelingprep.com/stable/income-statement-growth?symbol={symbol}&apikey={key}"
-    ratios = f"https://financialmodelingprep.com/stable/ratios-ttm?symbol={symbol}&apikey={key}"
-    try:
-        resp = requests.get(income_statement_growth, timeout=10, verify=certifi.where())
-        resp.raise_for_status()
-        data = resp.json()
-        if not data:
+    fmp = get_client("fmp")
+    params = {"symbol": symbol, "apikey": key}
+    ratio_call = None
+    if ratios is None:
+        ratio_call = _fmp_executor.submit(fmp.get_json, "/stable/ratios-ttm", params=params, cache_policy="ratios",
+                                          retries=retries)
+    growth = fmp.get_json("/stable/income-statement-growth", params=params, cache_policy="fundamentals",
+                          retries=retries)
+    if ratio_call is not None:
+        ratio_rows = ratio_call.result()
+        if not ratio_rows:
             raise RuntimeError("FMP returned empty response")
-        
-        current_revenue_growth = data[0].get("growthRevenue")
-        past_revenue_growth = average_revenue_growth(data, years=5)
+        ratios = _fmp_ratio_inputs(ratio_rows[0])
+
+    if not growth:
+        raise RuntimeError("FMP returned empty response")
+    return {
+        "current_revenue_growth": growth[0].get("growthRevenue"),
+        "past_revenue_growth": _average_revenue_growth(growth, years=5),
+        **ratios,
+    }
 
-        resp = requests.get(ratios, timeout=10, verify=certifi.where())
-        resp.raise_for_status()
-        data = resp.json()
-        if not data:
-            raise RuntimeError("FMP returned empty response")
-        pe = data[0].get("priceToEarningsRatioTTM")
-        dividend = data[0].get("dividendYieldTTM")
-        debt_to_equity = data[0].get("debtToEquityRatioTTM")
 
-        ROI = score_stock(current_revenue_growth, past_revenue_growth, pe, dividend, debt_to_equity)
+def fetch_with_FMP(symbol):
+    try:
+        inputs = fetch_fmp_inputs(symbol)
+        ROI = score_stock(*(inputs[name] for name in FMP_SCORE_INPUTS))
         return ("fmp", ROI)
 
     except requests.HTTPError as e:
@@ -334,52 +592,169 @@ def fetch_with_FMP(symbol):
         raise RuntimeError(f"FMP request failed: {e}") from e
     except ValueError as e:
         raise RuntimeError(f"FMP JSON parse failed: {e}") from e
-    
-    
-def get_data():
+
+
+def fetch_FMP_bulk_ratios():
+    """TTM ratio inputs for every symbol from FMP's bulk ratios file, as {symbol: inputs}."""
+    key = os.getenv("FMP_API_KEY")
+    if not key:
+        raise RuntimeError("FMP API key not provided. Set FMP_API_KEY env var.")
+    df = get_client("fmp").get_csv("/stable/ratios-ttm-bulk", params={"apikey": key}, timeout=120)
+    df = df.astype(object).where(df.notna(), None)
+    return {row["symbol"]: _fmp_ratio_inputs(row) for row in df.to_dict("records")}
+
+
+# FMP columns written to the stock store, keyed by score_stocks output column
+FMP_SCORE_COLUMNS = {
+    "Current Revenue Growth Score": "fmp_current_revenue_growth_score",
+    "Past Revenue Growth Score": "fmp_past_revenue_growth_score",
+    "P/E Score": "fmp_pe_score",
+    "Dividend Yield Score": "fmp_dividend_yield_score",
+    "Debt Score": "fmp_debt_score",
+    "Total Score": "fmp_total_score",
+}
+
+
+@timed("get_FMP_data")
+def get_FMP_data(symbols=None, max_workers=8, retries=3, use_bulk=True, batch_size=50, store=None):
+    """Fetch, score and store FMP fundamentals for the whole universe in one job.
+
+    Ratios come from the bulk file when the plan allows it (one request for
+    every symbol), otherwise per symbol alongside income growth. Symbols
+    are processed in parallel under the FMP quota, and each batch of
+    `batch_size` results is scored with score_stocks and upserted into the
+    store in one transaction; a batch that fails to store is reported as
+    failed symbol by symbol.
+    """
+    store = store or get_store()
+    if symbols is None:
+        symbols = store.load_frame(columns=["symbol"])["symbol"].tolist()
+
+    bulk_ratios = {}
+    if use_bulk:
+        try:
+            bulk_ratios = fetch_FMP_bulk_ratios()
+            print(f"Loaded bulk TTM ratios for {len(bulk_ratios)} symbols")
+        except Exception as e:
+            print(f"FMP bulk ratios unavailable ({e}); fetching ratios per symbol")
+
+    def write(batch):
+        inputs = pd.DataFrame.from_dict(batch, orient="index")
+        scores = score_stocks(inputs).rename(columns=FMP_SCORE_COLUMNS)
+        rows = pd.concat([inputs.add_prefix("fmp_"), scores], axis=1)
+        rows = rows.astype(object).where(rows.notna(), None)
+        store.upsert_many({"symbol": symbol, **row} for symbol, row in rows.to_dict("index").items())
+
+    result = run_bulk(
+        symbols,
+        lambda symbol: fetch_fmp_inputs(symbol, bulk_ratios.get(symbol), retries=0),  # run_bulk retries
+        max_workers=max_workers,
+        retries=retries,
+        on_batch=write,
+        batch_size=batch_size,
+    )
+    store.export_csv()
+    print(result.summary())
+    return result
+
+
+def fetch_quote_alpha_vantage(symbol):
+    key = os.getenv("ALPHA_VANTAGE_API_KEY")
+    if not key:
+        raise RuntimeError("No Alpha Vantage API key provided.")
+    data = get_client("alpha_vantage").get_json(
+        "/query", params={"function": "GLOBAL_QUOTE", "symbol": symbol, "apikey": key}, cache_policy="prices"
+    )
+    quote = data.get("Global Quote") or {}
+    if "05. price" not in quote:
+        raise RuntimeError(f"Unexpected Alpha Vantage quote response: {data}")
+    return round(float(quote["05. price"]), 2)
+
+
+def fetch_quote_FMP(symbol):
+    key = os.getenv("FMP_API_KEY")
+    if not key:
+        raise RuntimeError("FMP API key not provided. Set FMP_API_KEY env var.")
+    data = get_client("fmp").get_json(
+        "/stable/quote-short", params={"symbol": symbol, "apikey": key}, cache_policy="prices"
+    )
+    if not data or "price" not in data[0]:
+        raise RuntimeError(f"Unexpected FMP quote response: {data}")
+    return round(float(data[0]["price"]), 2)
+
+
+_quote_resolver = None
+
+
+def get_quote_resolver():
+    """Shared resolver over every price source we have credentials for."""
+    global _quote_resolver
+    if _quote_resolver is None:
+        providers = {}
+        if os.getenv("POLYGON_API_KEY"):
+            providers["polygon"] = get_live_price
+        if client is not None and API_KEY:
+            providers["alpaca"] = lambda symbol: fetch_with_alpaca(symbol)["close"]
+        if os.getenv("ALPHA_VANTAGE_API_KEY"):
+            providers["alpha_vantage"] = fetch_quote_alpha_vantage
+        if os.getenv("FMP_API_KEY"):
+            providers["fmp"] = fetch_quote_FMP
+        _quote_resolver = QuoteResolver(
+            providers,
+            hedge_after=float(os.getenv("QUOTE_HEDGE_AFTER", "0.5")),
+        )
+    return _quote_resolver
+
+
+def get_quote(symbol):
+    """Price for `symbol` from whichever provider answers first; see QuoteResolver."""
+    return get_quote_resolver().get_price(symbol)
+
+
+@timed("get_data")
+def get_data(max_workers=4, retries=3, refresh=False, batch_size=25):
+    """Load Alpha Vantage fundamentals for the S&P-500 universe into the stock store.
+
+    Symbols already in the store are skipped unless `refresh` is
+    set, so an interrupted run picks up where it left off. Fetches run
+    concurrently under the shared Alpha Vantage quota (taken by the provider
+    client, so cached responses cost nothing); failures are recorded per
+    symbol instead of aborting the run. Payloads are parsed and stored
+    `batch_size` at a time; if a batch can't be stored, every symbol in it
+    is reported as failed and the run carries on.
+    """
     # Read S&P-500 list from backend/data
     if not os.path.exists(SANDP_FILE):
         raise FileNotFoundError(f"S&P-500 file not found at {SANDP_FILE}")
     sp500_df = pd.read_csv(SANDP_FILE)
     tickers = sp500_df["Symbol"].tolist()
     print(len(tickers), tickers[:5])
-    # Load existing stock_data if present; otherwise start empty
-    if os.path.exists(STOCK_DATA_FILE):
-        stock_df = pd.read_csv(STOCK_DATA_FILE)
-        data = stock_df["symbol"].tolist()
-    else:
-        data = []
-
-    for stocks in tickers[len(data)+3:]:
-        symbol = os.getenv("SYMBOL", stocks)
-
-        try:
-            source, data = fetch_with_alpha_vintage(symbol)
-            update_stock_data(symbol, data)
-            print(data)
-        except Exception as e:
-            print("Failed:", str(e))
-            break
 
-        time.sleep(1)
+    store = get_store()
+    if os.getenv("SYMBOL"):
+        tickers = [os.getenv("SYMBOL")]
+    elif not refresh:
+        done = store.symbols()
+        tickers = [t for t in tickers if t not in done]
+        print(f"Resuming: {len(done)} symbols already loaded, {len(tickers)} remaining")
+
+    def write(batch):
+        store.upsert_frame(overview_frame(list(batch.values()), symbols=list(batch.keys())))
+
+    result = run_bulk(
+        tickers,
+        lambda symbol: fetch_overview_payload(symbol, retries=0),  # run_bulk retries
+        max_workers=max_workers,
+        retries=retries,
+        on_batch=write,
+        batch_size=batch_size,
+    )
+    store.export_csv()
+    print(result.summary())
+    return result
 
 
 
 if __name__ == "__main__":
     #get_data()
-    marketData = pd.read_csv("backend/data/stock_data.csv")
-    tickers = marketData["symbol"].tolist()
-
-    for i, symbol in enumerate(tickers):
-        try:
-            price = get_live_price(symbol)
-            marketData.at[i, "price"] = price
-            print(f"{symbol}: {price}")
-        except Exception as e:
-            print(f"Failed to get price for {symbol}: {e}")
-        time.sleep(12)
-        marketData.to_csv("backend/data/stock_data.csv", index=False)
-
-    
-
-    
+    refresh_prices(provider=os.getenv("PRICE_PROVIDER", "polygon"))
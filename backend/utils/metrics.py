@@ -0,0 +1,293 @@
+"""In-process metrics: counters, gauges and latency histograms, exposed in Prometheus text format.
+
+Cheap enough to leave on: a labelled child is resolved once per call site,
+and recording is a bisect plus a few additions under a per-child lock.
+timed() / provider_call() / llm_call() work as decorators or context
+managers; render() produces the /metrics payload.
+"""
+
+import bisect
+import functools
+import math
+import threading
+import time
+
+# Seconds; spans cache hits (~1ms) to slow provider and LLM calls (tens of seconds).
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self):
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self._samples():
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1.0, **labels):
+        self.labels(**labels).inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        """With `function`, the value is read from it at render time (no labels)."""
+        super().__init__(name, help, labelnames)
+        self.function = function
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value, **labels):
+        self.labels(**labels).set(value)
+
+    def render(self):
+        if self.function is None:
+            return super().render()
+        try:
+            value = float(self.function())
+        except Exception:
+            value = float("nan")
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_format_value(value)}"]
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labelnames, key):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines, cumulative = [], 0
+        for bound, n in zip(list(self.buckets) + [math.inf], counts):
+            cumulative += n
+            le = _format_value(bound)
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', le)])} {cumulative}")
+        labels = _format_labels(labelnames, key)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add `metric`, or return the one already registered under its name."""
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=(), function=None):
+    return REGISTRY.register(Gauge(name, help, labelnames, function))
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))
+
+
+def render():
+    return REGISTRY.render()
+
+
+OPERATION_SECONDS = histogram("operation_duration_seconds", "Time spent in internal operations.", ["operation"])
+OPERATION_ERRORS = counter("operation_errors_total", "Internal operations that raised.", ["operation", "error"])
+PROVIDER_SECONDS = histogram(
+    "provider_request_duration_seconds", "Latency of market data and broker API calls.", ["provider", "operation"]
+)
+PROVIDER_ERRORS = counter("provider_errors_total", "Failed provider calls by error kind.", ["provider", "kind"])
+RATE_LIMIT_HITS = counter("rate_limit_hits_total", "Responses where a provider reported a rate limit.", ["provider"])
+RATE_LIMIT_WAIT = histogram("rate_limit_wait_seconds", "Time spent waiting on a local token bucket.", ["provider"])
+RETRIES = counter("retries_total", "Retried calls after a transient failure.", ["operation"])
+HTTP_SECONDS = histogram("http_request_duration_seconds", "API request latency.", ["method", "endpoint", "status"])
+LLM_SECONDS = histogram("llm_request_duration_seconds", "Latency of LLM calls by agent.", ["agent"])
+LLM_ERRORS = counter("llm_errors_total", "Failed LLM calls by agent.", ["agent"])
+
+
+class Timer:
+    """Observe elapsed seconds into `child` as a context manager or decorator.
+
+    `on_error(exc)` is called when the timed block raises. Used as a
+    decorator, each call is timed independently, so it's thread-safe.
+    """
+
+    def __init__(self, child, on_error=None):
+        self.child = child
+        self.on_error = on_error
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.child.observe(time.perf_counter() - self._start)
+        if exc is not None and self.on_error is not None:
+            self.on_error(exc)
+        return False
+
+    def __call__(self, fn):
+        child, on_error = self.child, self.on_error
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if on_error is not None:
+                    on_error(e)
+                raise
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return wrapper
+
+
+def timed(operation):
+    """Time an internal operation (scoring, portfolio construction, ...)."""
+    errors = OPERATION_ERRORS
+    return Timer(OPERATION_SECONDS.labels(operation=operation),
+                 lambda e: errors.inc(operation=operation, error=type(e).__name__))
+
+
+def provider_error_kind(exc):
+    from utils.rate_limit import RateLimitError  # imported late: rate_limit itself reports into this module
+    if isinstance(exc, RateLimitError):
+        return "rate_limit"
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return f"http_{status}" if status else type(exc).__name__
+
+
+def record_provider_error(provider, exc):
+    kind = provider_error_kind(exc)
+    PROVIDER_ERRORS.inc(provider=provider, kind=kind)
+    if kind == "rate_limit":
+        RATE_LIMIT_HITS.inc(provider=provider)
+
+
+def provider_call(provider, operation="request"):
+    """Time a call to an external provider and count its failures by kind."""
+    return Timer(PROVIDER_SECONDS.labels(provider=provider, operation=operation),
+                 lambda e: record_provider_error(provider, e))
+
+
+def llm_call(agent):
+    """Time one LLM invocation for `agent`."""
+    return Timer(LLM_SECONDS.labels(agent=agent), lambda e: LLM_ERRORS.inc(agent=agent))
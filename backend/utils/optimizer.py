@@ -0,0 +1,257 @@
+"""Portfolio weight optimizers: minimum variance, mean-variance and risk parity.
+
+All solvers are long-only with per-position and optional per-sector caps,
+use a Ledoit-Wolf shrunk covariance of historical returns, and run on plain
+NumPy arrays through a small ADMM quadratic-programming solver.
+"""
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+METHODS = ("min_variance", "mean_variance", "risk_parity")
+MIN_OBSERVATIONS = 60  # daily returns a symbol needs before its own variance is trusted
+
+
+def shrinkage_covariance(returns):
+    """Ledoit-Wolf covariance (shrunk toward a scaled identity) of a T x N returns array.
+
+    Returns (covariance, shrinkage intensity). NaNs are treated as zero excess returns.
+    """
+    X = np.asarray(returns, dtype=float)
+    t, n = X.shape
+    if t < 2:
+        raise ValueError("Need at least two return observations")
+    X = X - np.nanmean(X, axis=0)
+    X = np.nan_to_num(X, nan=0.0)
+
+    sample = X.T @ X / t
+    mu = np.trace(sample) / n
+    delta = np.sum((sample - mu * np.eye(n)) ** 2) / n
+    beta = np.sum((X ** 2).T @ (X ** 2) / t - sample ** 2) / (n * t)
+    shrinkage = 0.0 if delta == 0 else min(1.0, max(0.0, beta / delta))
+    return shrinkage * mu * np.eye(n) + (1 - shrinkage) * sample, shrinkage
+
+
+def symbols_with_history(prices, symbols, min_observations=MIN_OBSERVATIONS):
+    """The `symbols` with at least `min_observations` daily returns in `prices`."""
+    if prices is None or prices.empty:
+        return []
+    counts = prices.reindex(columns=symbols).pct_change(fill_method=None).iloc[1:].count()
+    return [s for s in symbols if counts[s] >= min_observations]
+
+
+def estimate_covariance(prices, symbols, min_observations=MIN_OBSERVATIONS):
+    """Annualized shrunk covariance for `symbols` from a dates x symbols price frame.
+
+    Symbols without enough history get the median variance of the rest and
+    no correlation, so they neither dominate nor vanish from the solution.
+    """
+    n = len(symbols)
+    have = symbols_with_history(prices, symbols, min_observations)
+
+    cov = np.zeros((n, n))
+    if len(have) >= 2:
+        returns = prices[have].pct_change(fill_method=None).iloc[1:]
+        sub, _ = shrinkage_covariance(returns.to_numpy())
+        idx = [symbols.index(s) for s in have]
+        cov[np.ix_(idx, idx)] = sub * TRADING_DAYS
+        fill = np.median(np.diag(sub)) * TRADING_DAYS
+    else:
+        fill = 0.3 ** 2  # ~30% annual volatility when we have no history at all
+    missing = [i for i, s in enumerate(symbols) if s not in have]
+    cov[missing, missing] = fill
+    return cov
+
+
+def _shift_to_sum(v, upper, total, lo, hi):
+    """clip(v - tau, 0, upper) with tau in [lo, hi] bisected so the weights sum to `total`."""
+    for _ in range(60):
+        tau = (lo + hi) / 2
+        if np.clip(v - tau, 0, upper).sum() > total:
+            lo = tau
+        else:
+            hi = tau
+    return np.clip(v - (lo + hi) / 2, 0, upper)
+
+
+def _project_capped_simplex(v, upper):
+    """Euclidean projection of v onto {w : sum(w) = 1, 0 <= w <= upper}."""
+    return _shift_to_sum(v, upper, 1.0, v.min() - 1.0, v.max())
+
+
+def _project_feasible(v, upper, sector_matrix=None, sector_caps=None):
+    """Euclidean projection of v onto the capped simplex intersected with the sector caps.
+
+    Sectors partition the positions, so the projection is clip(v - tau - lam_s,
+    0, upper): one shared shift tau for the budget, plus a further shift lam_s
+    for each sector that would otherwise exceed its cap.
+    """
+    if sector_matrix is None:
+        return _project_capped_simplex(v, upper)
+    members = [row.astype(bool) for row in sector_matrix]
+
+    def budget(tau):
+        return sum(min(np.clip(v[m] - tau, 0, upper).sum(), cap) for m, cap in zip(members, sector_caps))
+
+    lo, hi = v.min() - 1.0, v.max()
+    for _ in range(60):
+        tau = (lo + hi) / 2
+        if budget(tau) > 1:
+            lo = tau
+        else:
+            hi = tau
+    tau = (lo + hi) / 2
+    w = np.clip(v - tau, 0, upper)
+    for m, cap in zip(members, sector_caps):
+        if w[m].sum() > cap:
+            w[m] = _shift_to_sum(v[m], upper, cap, tau, v[m].max())
+    return w
+
+
+def _sector_matrix(sectors, sector_cap):
+    labels = np.unique(sectors)
+    return (sectors[None, :] == labels[:, None]).astype(float), np.full(len(labels), float(sector_cap))
+
+
+def solve_qp(P, q, upper, sector_matrix=None, sector_caps=None, rho=0.1, sigma=1e-6, alpha=1.6,
+             iterations=10000, tol=1e-8):
+    """min 1/2 w'Pw + q'w  s.t.  sum(w) = 1, 0 <= w <= upper, sector_matrix @ w <= sector_caps.
+
+    Operator-splitting ADMM (the OSQP iteration): the KKT matrix is inverted
+    once, after which every iteration is a couple of matrix-vector products
+    and a clip, so hundreds of names solve in milliseconds.
+    """
+    n = len(q)
+    rows = [np.ones((1, n)), np.eye(n)]
+    lower_b = [np.ones(1), np.zeros(n)]
+    upper_b = [np.ones(1), np.full(n, float(upper))]
+    if sector_matrix is not None:
+        rows.append(sector_matrix)
+        lower_b.append(np.full(len(sector_caps), -np.inf))
+        upper_b.append(np.asarray(sector_caps, dtype=float))
+    A = np.vstack(rows)
+    lower_b = np.concatenate(lower_b)
+    upper_b = np.concatenate(upper_b)
+    rho_vec = np.where(lower_b == upper_b, 1e3 * rho, rho)  # stiffer on the equality row
+
+    K_inv = np.linalg.inv(P + sigma * np.eye(n) + A.T @ (rho_vec[:, None] * A))
+    x = np.full(n, 1.0 / n)
+    z = A @ x
+    y = np.zeros(len(A))
+    for i in range(iterations):
+        x_tilde = K_inv @ (sigma * x - q + A.T @ (rho_vec * z - y))
+        z_tilde = A @ x_tilde
+        x = alpha * x_tilde + (1 - alpha) * x
+        z_relaxed = alpha * z_tilde + (1 - alpha) * z
+        z_next = np.clip(z_relaxed + y / rho_vec, lower_b, upper_b)
+        y = y + rho_vec * (z_relaxed - z_next)
+        z = z_next
+        if i % 10 == 0:
+            primal = np.abs(A @ x - z).max()
+            dual = np.abs(P @ x + q + A.T @ y).max()
+            if primal < tol and dual < tol:
+                break
+    return x
+
+
+def _finish(w, upper, sector_matrix=None, sector_caps=None):
+    """Clean up solver round-off: feasible for the position caps, the sector caps and the budget."""
+    return _project_feasible(np.clip(w, 0, upper), upper, sector_matrix, sector_caps)
+
+
+def min_variance(cov, upper, sector_matrix=None, sector_caps=None):
+    cov = np.asarray(cov, dtype=float)
+    w = solve_qp(2 * cov, np.zeros(len(cov)), upper, sector_matrix, sector_caps)
+    return _finish(w, upper, sector_matrix, sector_caps)
+
+
+def mean_variance(cov, expected, upper, risk_aversion=4.0, sector_matrix=None, sector_caps=None):
+    """Maximize expected'w - risk_aversion/2 * w'Σw."""
+    cov = np.asarray(cov, dtype=float)
+    w = solve_qp(risk_aversion * cov, -np.asarray(expected, dtype=float), upper, sector_matrix, sector_caps)
+    return _finish(w, upper, sector_matrix, sector_caps)
+
+
+def risk_parity(cov, upper, sector_matrix=None, sector_caps=None, iterations=500, tol=1e-10):
+    """Equal risk contribution weights, then the nearest weights that respect the caps."""
+    cov = np.asarray(cov, dtype=float)
+    n = len(cov)
+    w = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        w_next = 1.0 / np.maximum(cov @ w, 1e-18)
+        w_next = 0.5 * w + 0.5 * w_next / w_next.sum()  # damped fixed point w_i ∝ 1 / (Σw)_i
+        if np.abs(w_next - w).max() < tol:
+            w = w_next
+            break
+        w = w_next
+    w = w / w.sum()
+    if w.max() <= upper and sector_matrix is None:
+        return w
+    # Euclidean projection onto the constraint set is the QP with P = I, q = -w.
+    return _finish(solve_qp(np.eye(n), -w, upper, sector_matrix, sector_caps), upper, sector_matrix, sector_caps)
+
+
+def roi_to_expected_return(roi_scores, scale=0.20):
+    """Map 0-100 ROI scores onto an annual expected-return proxy in [0, scale]."""
+    return np.nan_to_num(np.asarray(roi_scores, dtype=float), nan=0.0) / 100.0 * scale
+
+
+def optimize_weights(symbols, method="mean_variance", prices=None, roi_scores=None, sectors=None,
+                     max_weight=None, sector_cap=None, target=100.0, risk_aversion=4.0):
+    """Weights for `symbols` (same order) summing exactly to `target`.
+
+    `prices` is a dates x symbols frame of historical closes used for the
+    covariance; `roi_scores` is required for mean_variance; `sectors` (one
+    label per symbol) plus `sector_cap` (a fraction, e.g. 0.35) limit each
+    sector's total weight. `max_weight` is the per-position cap as a fraction.
+
+    With history for fewer than two symbols there is no covariance to work
+    with, so every method falls back to equal weights (within the caps) and
+    says so; symbols missing from otherwise usable history are logged too.
+    """
+    symbols = list(symbols)
+    n = len(symbols)
+    if n == 0:
+        return np.zeros(0)
+    if method not in METHODS:
+        raise ValueError(f"Unknown optimizer method {method!r}; expected one of {METHODS}")
+
+    if method == "mean_variance" and roi_scores is None:
+        raise ValueError("mean_variance needs roi_scores")
+
+    upper = 1.0 if max_weight is None else float(max_weight)
+    if upper * n < 1:
+        raise ValueError(f"max_weight={upper} is infeasible for {n} positions")
+
+    sector_matrix = sector_caps = None
+    if sectors is not None and sector_cap is not None:
+        labels = np.asarray(pd.Series(list(sectors)).fillna("Unknown"), dtype=object).astype(str)
+        sector_matrix, sector_caps = _sector_matrix(labels, sector_cap)
+        if np.minimum(sector_caps, sector_matrix.sum(axis=1) * upper).sum() < 1:
+            raise ValueError("sector_cap is infeasible for this selection")
+
+    have = symbols_with_history(prices, symbols)
+    if len(have) < 2:
+        print(f"Warning: price history for {len(have)} of {n} symbols; {method} falls back to equal weights")
+        w = _finish(np.full(n, 1.0 / n), upper, sector_matrix, sector_caps)
+        return _scale(w, target)
+    if len(have) < n:
+        print(f"Warning: no price history for {n - len(have)} of {n} symbols; "
+              f"{method} gives them the median variance")
+
+    cov = estimate_covariance(prices, symbols)
+    if method == "min_variance":
+        w = min_variance(cov, upper, sector_matrix, sector_caps)
+    elif method == "mean_variance":
+        w = mean_variance(cov, roi_to_expected_return(roi_scores), upper, risk_aversion, sector_matrix, sector_caps)
+    else:
+        w = risk_parity(cov, upper, sector_matrix, sector_caps)
+    return _scale(w, target)
+
+
+def _scale(w, target):
+    w = np.clip(w, 0, None)
+    w = w / w.sum() * target
+    w[np.argmax(w)] += target - w.sum()  # absorb float round-off so the total is exact
+    return w
@@ -0,0 +1,65 @@
+"""LRU cache of generated portfolios, keyed on request parameters plus the data version.
+
+Including the universe version in the key means a data refresh naturally
+misses the cache (and the old entries age out), so nothing has to be
+invalidated by hand. The same key doubles as the response ETag.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def etag_for(key):
+    return hashlib.sha1(repr(key).encode()).hexdigest()[:20]
+
+
+class PortfolioCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def get_or_compute(self, key, compute):
+        """Cached value for `key`, computing (outside the lock) and storing it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "not_modified": self.not_modified,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
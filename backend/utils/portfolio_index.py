@@ -0,0 +1,63 @@
+"""Precomputed index answering "top k by ROI among stocks under a risk ceiling".
+
+Stocks are sorted by riskScore once, so the candidates for any ceiling form
+a prefix of that order. For every prefix length we also keep the best
+`max_k` stocks by roiScore (built incrementally from the previous prefix), so
+a query is one binary search plus a slice instead of a filter and a sort.
+"""
+
+import numpy as np
+
+
+class PortfolioIndex:
+    def __init__(self, frame, max_k=35, risk_column="riskScore", roi_column="roiScore"):
+        risk = frame[risk_column].to_numpy(dtype=float)
+        roi = frame[roi_column].to_numpy(dtype=float)
+        n = len(frame)
+        self.max_k = max_k
+        self.size = n
+
+        # ROI rank 0 is the best; NaN ROI sorts last and ties keep frame order, like a stable sort_values.
+        self.by_roi = np.lexsort((np.arange(n), np.isnan(roi), -np.nan_to_num(roi, nan=0.0)))
+        rank = np.empty(n, dtype=np.int64)
+        rank[self.by_roi] = np.arange(n)
+
+        # Stocks with a NaN risk never satisfy riskScore < ceiling, so they're left out.
+        valid = np.flatnonzero(~np.isnan(risk))
+        order = valid[np.argsort(risk[valid], kind="stable")]
+        self.risk_sorted = risk[order]
+
+        # prefix_top[i] = ROI ranks of the best max_k stocks among the i least risky, ascending.
+        sentinel = n
+        prefix_top = np.full((len(order) + 1, max_k), sentinel, dtype=np.int64)
+        current = prefix_top[0].copy()
+        for i, pos in enumerate(order, start=1):
+            r = rank[pos]
+            if r < current[-1]:
+                at = np.searchsorted(current, r)
+                current[at + 1:] = current[at:-1]
+                current[at] = r
+            prefix_top[i] = current
+        self.prefix_top = prefix_top
+
+    def count_below(self, max_risk):
+        """Number of stocks with riskScore strictly below `max_risk`."""
+        return int(np.searchsorted(self.risk_sorted, max_risk, side="left"))
+
+    def top_k(self, max_risk, k):
+        """Row positions of the top `k` stocks by ROI with riskScore < max_risk, best first."""
+        if k > self.max_k:
+            raise ValueError(f"k={k} exceeds the index's max_k={self.max_k}")
+        ranks = self.prefix_top[self.count_below(max_risk), :k]
+        return self.by_roi[ranks[ranks < self.size]]
+
+    def top_k_many(self, max_risks, k):
+        """Vectorized top_k for an array of risk ceilings: an (len(max_risks), k) array of row positions, -1 padded."""
+        if k > self.max_k:
+            raise ValueError(f"k={k} exceeds the index's max_k={self.max_k}")
+        max_risks = np.asarray(max_risks, dtype=float)
+        if self.size == 0:
+            return np.full((len(max_risks), k), -1, dtype=np.int64)
+        counts = np.searchsorted(self.risk_sorted, max_risks, side="left")
+        ranks = self.prefix_top[counts, :k]
+        return np.where(ranks < self.size, self.by_roi[np.minimum(ranks, self.size - 1)], -1)
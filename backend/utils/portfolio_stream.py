@@ -0,0 +1,218 @@
+"""Live valuation of a generated portfolio, shared by every streaming client.
+
+One PortfolioStream per portfolio definition runs a single producer thread
+that, at most once per `interval`, reprices the portfolio and works out what
+changed: prices, position values and drift from the target weights. The
+result is pushed to every subscriber, so N clients cost one computation.
+
+Each subscriber holds at most one pending snapshot plus one pending update.
+New updates are merged into the pending one rather than queued, so a slow
+client just receives fewer, larger updates and memory never grows.
+"""
+
+import threading
+import time
+
+
+def _round(value, digits=6):
+    return None if value is None else round(float(value), digits)
+
+
+class Subscriber:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._snapshot = None
+        self._update = None
+        self.closed = False
+
+    def push_snapshot(self, state):
+        with self._cond:
+            self._snapshot = state
+            self._update = None  # the snapshot already contains everything
+            self._cond.notify()
+
+    def push_update(self, diff):
+        with self._cond:
+            if self._update is None:
+                self._update = {**diff, "positions": dict(diff["positions"])}
+            else:
+                positions = self._update["positions"]
+                for symbol, fields in diff["positions"].items():
+                    positions[symbol] = {**positions.get(symbol, {}), **fields}
+                self._update = {**diff, "positions": positions}
+            self._cond.notify()
+
+    def next(self, timeout=None):
+        """Next ("snapshot" | "update", payload), or None after `timeout` seconds without news."""
+        with self._cond:
+            if self._snapshot is None and self._update is None and not self.closed:
+                self._cond.wait(timeout)
+            if self._snapshot is not None:
+                event, payload, self._snapshot = "snapshot", self._snapshot, None
+                return event, payload
+            if self._update is not None:
+                event, payload, self._update = "update", self._update, None
+                return event, payload
+            return None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class PortfolioStream:
+    def __init__(self, load_portfolio, price_source, notional=100_000.0, interval=1.0):
+        """`load_portfolio()` returns (key, [(symbol, weight %), ...]), `key` identifying the
+        data it was built from; `price_source(symbols)` returns {symbol: price}."""
+        self.load_portfolio = load_portfolio
+        self.price_source = price_source
+        self.notional = float(notional)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._closed = False
+        self._wake = threading.Event()
+        self._portfolio = None
+        self._positions = {}  # symbol -> target, shares and last price (unrounded)
+        self._state = None  # last full state, sent to new subscribers
+        self.computations = 0
+        self.last_error = None
+
+    # ---------- Subscribers ---------- #
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._state is not None:
+                # Under the lock, so a broadcast can't slip in between and be wiped by this snapshot.
+                subscriber.push_snapshot(self._state)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="portfolio-stream", daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            self._subscribers.discard(subscriber)  # with nobody left the producer exits on its next pass
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _broadcast(self, event, payload):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            if event == "snapshot":
+                self._state = payload
+        for subscriber in subscribers:
+            if event == "snapshot":
+                subscriber.push_snapshot(payload)
+            else:
+                subscriber.push_update(payload)
+
+    # ---------- Producer ---------- #
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._closed or not self._subscribers:
+                    self._thread = None  # a later subscribe() starts a fresh producer
+                    return
+            started = time.monotonic()
+            try:
+                self.tick()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Portfolio stream update failed: {self.last_error}")
+            self._wake.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _rebase(self, portfolio):
+        """Buy `notional` of the portfolio at current prices; drift is measured from here."""
+        symbols = [symbol for symbol, _ in portfolio]
+        prices = self.price_source(symbols)
+        positions = {}
+        for symbol, weight in portfolio:
+            price = prices.get(symbol)
+            target = weight / 100.0
+            shares = self.notional * target / price if price else 0.0
+            positions[symbol] = {"target": target, "shares": shares, "price": price}
+        self._portfolio = portfolio
+        self._positions = positions
+        return positions
+
+    def tick(self):
+        """Reprice once and push a snapshot (new portfolio) or an update (what changed)."""
+        key, portfolio = self.load_portfolio()
+        # Only a different selection or weighting starts over; new data alone (e.g. a price
+        # refresh) keeps the same holdings so their drift keeps accumulating.
+        rebased = self._state is None or list(portfolio) != self._portfolio
+        if rebased:
+            positions = self._rebase(list(portfolio))
+        else:
+            positions = self._positions
+            fresh = self.price_source(list(positions))
+            for symbol, position in positions.items():
+                if fresh.get(symbol):
+                    position["price"] = fresh[symbol]
+
+        values = {s: p["shares"] * p["price"] if p["price"] else 0.0 for s, p in positions.items()}
+        total = sum(values.values())
+        rows = []
+        for symbol, position in positions.items():
+            weight = values[symbol] / total if total > 0 else 0.0
+            rows.append({
+                "symbol": symbol,
+                "target": _round(position["target"]),
+                "shares": _round(position["shares"]),
+                "price": _round(position["price"], 4),
+                "value": _round(values[symbol], 2),
+                "weight": _round(weight),
+                "drift": _round(weight - position["target"]),
+            })
+        state = {"key": str(key), "notional": self.notional, "total_value": _round(total, 2),
+                 "updated_at": time.time(), "positions": rows}
+        self.computations += 1
+
+        previous = self._state
+        if rebased:
+            self._broadcast("snapshot", state)
+            return
+        with self._lock:
+            self._state = state
+
+        before = {row["symbol"]: row for row in previous["positions"]}
+        changed = {}
+        for row in rows:
+            old = before.get(row["symbol"], {})
+            fields = {f: row[f] for f in ("price", "value", "weight", "drift") if row[f] != old.get(f)}
+            if fields:
+                changed[row["symbol"]] = fields
+        if changed:
+            self._broadcast("update", {"total_value": state["total_value"], "updated_at": state["updated_at"],
+                                       "positions": changed})
+
+    def stats(self):
+        return {
+            "subscribers": self.subscriber_count,
+            "computations": self.computations,
+            "interval": self.interval,
+            "last_error": self.last_error,
+        }
+
+    def stop(self):
+        with self._lock:
+            self._closed = True
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+            thread = self._thread
+        self._wake.set()
+        for subscriber in subscribers:
+            subscriber.close()
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,132 @@
+"""Hedged, health-aware quote fetching across several price providers."""
+
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+
+@dataclass
+class Quote:
+    symbol: str
+    price: float
+    provider: str
+    latency: float
+
+
+class ProviderHealth:
+    """Exponentially weighted latency and error rate for one provider."""
+
+    def __init__(self, alpha=0.2, initial_latency=0.5):
+        self.alpha = alpha
+        self.latency = initial_latency
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency, ok):
+        self.calls += 1
+        self.errors += 0 if ok else 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency += self.alpha * (latency - self.latency)
+
+    @property
+    def score(self):
+        """Lower is better: expected latency inflated by recent failures."""
+        return self.latency * (1.0 + 10.0 * self.error_rate)
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency": round(self.latency, 4),
+            "error_rate": round(self.error_rate, 4),
+        }
+
+
+class QuoteResolver:
+    """Ask the healthiest provider first and hedge to the next one if it's slow or fails.
+
+    `providers` maps a name to `fn(symbol) -> price`. The first valid price
+    wins; slower calls still finish in the background and update the health
+    stats used to order providers for the next request.
+    """
+
+    def __init__(self, providers, hedge_after=0.5, timeout=15.0, max_workers=8):
+        if not providers:
+            raise ValueError("QuoteResolver needs at least one provider")
+        self.providers = dict(providers)
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.health = {name: ProviderHealth() for name in self.providers}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="quote")
+
+    def ranked(self):
+        with self._lock:
+            return sorted(self.providers, key=lambda name: self.health[name].score)
+
+    def _call(self, name, symbol):
+        start = time.monotonic()
+        try:
+            price = float(self.providers[name](symbol))
+            if not math.isfinite(price) or price <= 0:
+                raise ValueError(f"invalid price {price!r}")
+        except Exception:
+            with self._lock:
+                self.health[name].record(time.monotonic() - start, ok=False)
+            raise
+        latency = time.monotonic() - start
+        with self._lock:
+            self.health[name].record(latency, ok=True)
+        return price, latency
+
+    def resolve(self, symbol, timeout=None):
+        """Return a Quote from the first provider to answer with a valid price."""
+        order = self.ranked()
+        deadline = time.monotonic() + (timeout or self.timeout)
+        pending = {}
+        errors = {}
+        launched = 0
+
+        while pending or launched < len(order):
+            if not pending:
+                # Nothing in flight (start, or every launched call failed): go to the next provider now.
+                name = order[launched]
+                pending[self._pool.submit(self._call, name, symbol)] = name
+                launched += 1
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = min(self.hedge_after, remaining) if launched < len(order) else remaining
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            if not done:
+                if launched < len(order):
+                    name = order[launched]
+                    pending[self._pool.submit(self._call, name, symbol)] = name
+                    launched += 1
+                continue
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    price, latency = future.result()
+                except Exception as e:
+                    errors[name] = str(e)
+                    continue
+                return Quote(symbol=symbol, price=round(price, 2), provider=name, latency=latency)
+
+        if pending:
+            errors.update({name: "timed out" for name in pending.values()})
+        raise RuntimeError(f"All quote providers failed for {symbol}: {errors}")
+
+    def get_price(self, symbol, timeout=None):
+        return self.resolve(symbol, timeout).price
+
+    def stats(self):
+        with self._lock:
+            return {name: health.as_dict() for name, health in self.health.items()}
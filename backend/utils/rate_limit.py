@@ -0,0 +1,112 @@
+"""Rate limiting and retry helpers shared by the market data loaders."""
+
+import os
+import random
+import threading
+import time
+
+import requests
+
+from utils.metrics import RATE_LIMIT_WAIT, RETRIES
+
+
+class RateLimitError(RuntimeError):
+    """Raised when a provider tells us we've exceeded our quota."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursting up to `capacity`."""
+
+    def __init__(self, rate, capacity=None, name=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._wait_metric = RATE_LIMIT_WAIT.labels(provider=name) if name else None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` are available."""
+        start = time.perf_counter()
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    break
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+        if self._wait_metric is not None:
+            self._wait_metric.observe(time.perf_counter() - start)
+
+
+# Requests per minute for each provider, overridable with e.g. ALPHA_VANTAGE_CALLS_PER_MINUTE.
+DEFAULT_QUOTAS = {
+    "alpha_vantage": 60,
+    "fmp": 250,
+    "polygon": 5,
+    "alpaca": 200,
+    "alpaca_trading": 200,
+}
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(provider):
+    """Return the shared token bucket for `provider`, creating it on first use."""
+    with _buckets_lock:
+        bucket = _buckets.get(provider)
+        if bucket is None:
+            env_name = f"{provider.upper()}_CALLS_PER_MINUTE"
+            per_minute = float(os.getenv(env_name, DEFAULT_QUOTAS.get(provider, 60)))
+            # Allow a small burst so concurrent workers don't all start in lockstep.
+            bucket = TokenBucket(per_minute / 60.0, capacity=max(1.0, per_minute / 12.0), name=provider)
+            _buckets[provider] = bucket
+        return bucket
+
+
+def is_transient(exc):
+    """True for errors worth retrying: rate limits, timeouts, dropped connections, 429/5xx."""
+    if isinstance(exc, (RateLimitError, requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError):
+        status = getattr(exc.response, "status_code", None)
+        return status == 429 or (status is not None and status >= 500)
+    cause = exc.__cause__
+    return cause is not None and cause is not exc and is_transient(cause)
+
+
+def call_with_retry(fn, *args, retries=3, backoff=1.0, max_backoff=30.0, bucket=None, **kwargs):
+    """Call `fn`, retrying transient failures with jittered exponential backoff.
+
+    If a token bucket is given, a token is taken before every attempt.
+    """
+    attempt = 0
+    while True:
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not is_transient(e):
+                raise
+            RETRIES.inc(operation=getattr(fn, "__name__", "call"))
+            delay = min(max_backoff, backoff * (2 ** attempt))
+            time.sleep(delay * (0.5 + random.random() / 2))
+            attempt += 1
@@ -0,0 +1,358 @@
+"""Trade the brokerage account to a target portfolio.
+
+plan_orders() diffs target weights against current holdings and nets them
+into at most one order per symbol, dropping trades too small to matter.
+execute() submits the sells, waits until every one has filled (or otherwise
+finished) so their proceeds are in the account, then submits the buys; each
+phase runs in parallel with a bounded pool. Client order ids are
+derived from the rebalance id, symbol and side, so re-running the same
+rebalance (after a timeout or a crash half way through) can't place an
+order twice: the broker rejects the repeat id, and the earlier order is
+looked up and reported as a duplicate with its real status, or as a
+failure if it was canceled, expired or rejected.
+"""
+
+import hashlib
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import date
+
+from utils.metrics import timed
+from utils.rate_limit import get_bucket
+
+SHARE_DECIMALS = 6  # fractional orders are rounded to this many decimals
+# Alpaca order statuses after which an order can't fill any further
+FINAL_STATUSES = {"filled", "canceled", "expired", "rejected", "done_for_day", "replaced", "stopped", "suspended"}
+DEAD_STATUSES = {"canceled", "expired", "rejected"}  # ended without (fully) filling
+
+
+@dataclass
+class PlannedOrder:
+    symbol: str
+    side: str  # "buy" | "sell"
+    qty: float
+    price: float
+    current_qty: float
+    target_qty: float
+
+    @property
+    def notional(self):
+        return self.qty * self.price
+
+
+@dataclass
+class OrderResult:
+    symbol: str
+    side: str
+    qty: float
+    notional: float
+    client_order_id: str
+    status: str  # "planned" (dry run) | "submitted" | "duplicate" | "failed" | "blocked" (buy held back)
+    order_id: str = None
+    broker_status: str = None
+    filled_qty: float = None
+    error: str = None
+    latency: float = None
+
+
+@dataclass
+class RebalanceReport:
+    rebalance_id: str
+    dry_run: bool
+    equity: float
+    orders: list = field(default_factory=list)
+    skipped: list = field(default_factory=list)  # {"symbol", "reason"}
+    started_at: float = None
+    elapsed: float = None
+
+    def count(self, status):
+        return sum(1 for o in self.orders if o.status == status)
+
+    @property
+    def ok(self):
+        return self.count("failed") == 0 and self.count("blocked") == 0
+
+    def summary(self):
+        sells = [o for o in self.orders if o.side == "sell"]
+        buys = [o for o in self.orders if o.side == "buy"]
+        return {
+            "rebalance_id": self.rebalance_id,
+            "dry_run": self.dry_run,
+            "equity": self.equity,
+            "orders": len(self.orders),
+            "sells": len(sells),
+            "buys": len(buys),
+            "sell_notional": round(sum(o.notional for o in sells), 2),
+            "buy_notional": round(sum(o.notional for o in buys), 2),
+            "submitted": self.count("submitted"),
+            "duplicates": self.count("duplicate"),
+            "failed": self.count("failed"),
+            "blocked": self.count("blocked"),
+            "skipped": len(self.skipped),
+            "elapsed": None if self.elapsed is None else round(self.elapsed, 3),
+        }
+
+    def as_dict(self):
+        return dict(self.summary(), orders=[asdict(o) for o in self.orders], skipped=self.skipped)
+
+
+def _float(value, default=0.0):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _round_qty(qty, fractional):
+    if fractional:
+        return math.floor(qty * 10**SHARE_DECIMALS + 1e-9) / 10**SHARE_DECIMALS
+    return float(math.floor(qty + 1e-9))
+
+
+def plan_orders(targets, positions, equity, prices, cash_buffer=0.01, min_trade_value=1.0,
+                tolerance=0.0, fractional=False, liquidate_others=True):
+    """Net target weights against holdings; returns ([PlannedOrder], [skipped]).
+
+    `targets` is [(symbol, weight %)] as made by make_portfolio, `positions`
+    is get_positions() output and `prices` maps symbol to a current price
+    (held positions fall back to their reported current_price). Of
+    `equity`, `cash_buffer` is left uninvested so market buys that fill a
+    little above the quote aren't rejected for buying power. A trade is
+    dropped if it's worth less than `min_trade_value` or moves the weight
+    by less than `tolerance` (a fraction, 0.01 = 1 point). Sells that close
+    a position use the exact held quantity; everything else rounds toward
+    zero to whole shares unless `fractional`.
+    """
+    equity = _float(equity)
+    if equity <= 0:
+        raise ValueError(f"Account equity must be positive, got {equity}")
+    weights = {}
+    for symbol, weight in (targets.items() if isinstance(targets, dict) else targets):
+        weights[symbol] = weights.get(symbol, 0.0) + float(weight) / 100.0
+    if any(w < 0 for w in weights.values()):
+        raise ValueError("Target weights must be non-negative")
+    if sum(weights.values()) > 1.0 + 1e-6:
+        raise ValueError(f"Target weights sum to {sum(weights.values()) * 100:.2f}%, more than 100%")
+
+    held = {}
+    for position in positions:
+        held[position["symbol"]] = {
+            "qty": _float(position.get("qty")),
+            "price": _float(position.get("current_price"), None),
+        }
+    symbols = list(weights) + [s for s in held if s not in weights and liquidate_others]
+
+    investable = equity * (1.0 - cash_buffer)
+    orders, skipped = [], []
+    for symbol in symbols:
+        price = prices.get(symbol) or held.get(symbol, {}).get("price")
+        current = held.get(symbol, {}).get("qty", 0.0)
+        target_weight = weights.get(symbol, 0.0)
+        if not price or price <= 0:
+            skipped.append({"symbol": symbol, "reason": "no price"})
+            continue
+        target = investable * target_weight / price
+        delta = target - current
+        if target_weight == 0.0 and current != 0.0:
+            qty = abs(current)  # close out exactly, fractional remainder included
+        else:
+            qty = _round_qty(abs(delta), fractional)
+        if qty <= 0:
+            continue
+        if qty * price < min_trade_value:
+            skipped.append({"symbol": symbol, "reason": "below min_trade_value"})
+            continue
+        if target_weight > 0.0 and abs(delta) * price / equity < tolerance:
+            skipped.append({"symbol": symbol, "reason": "within tolerance"})
+            continue
+        orders.append(PlannedOrder(symbol=symbol, side="buy" if delta > 0 else "sell", qty=qty,
+                                   price=float(price), current_qty=current, target_qty=target))
+    return orders, skipped
+
+
+def rebalance_id_for(targets, day=None):
+    """Stable id for a rebalance: the same targets on the same day give the same id."""
+    items = sorted((s, round(float(w), 6)) for s, w in (targets.items() if isinstance(targets, dict) else targets))
+    raw = json.dumps([str(day or date.today()), items])
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+def client_order_id(rebalance_id, symbol, side):
+    # qty is deliberately left out: a re-run after a partial fill plans a different
+    # qty for the same leg, and must still be recognised as the same order.
+    return f"rb-{rebalance_id}-{symbol}-{side}"
+
+
+def _status(value):
+    return None if value is None else str(getattr(value, "value", value)).lower()
+
+
+def _refresh(result, response):
+    """Copy a get_order_by_client_id() response onto `result`; False if the lookup failed."""
+    if not isinstance(response, dict) or "error" in response:
+        return False
+    result.broker_status = _status(response.get("status"))
+    result.filled_qty = _float(response.get("filled_qty"), None)
+    result.order_id = result.order_id or (str(response["id"]) if response.get("id") else None)
+    return True
+
+
+def _resolve_duplicate(result, get_order):
+    """The id was used before: report what happened to that order rather than assume it's fine."""
+    get_bucket("alpaca_trading").acquire()
+    response = get_order(result.client_order_id)
+    if not _refresh(result, response):
+        error = response.get("error") if isinstance(response, dict) else response
+        result.error = f"client_order_id already used and the order could not be looked up: {error}"
+        return result
+    if result.broker_status in DEAD_STATUSES:
+        # The id is spent; a new order for this leg needs a new rebalance id.
+        result.error = f"client_order_id already used by an order that was {result.broker_status}"
+        return result
+    result.status = "duplicate"
+    return result
+
+
+def _submit_one(order, rebalance_id, submit, get_order, fractional):
+    coid = client_order_id(rebalance_id, order.symbol, order.side)
+    result = OrderResult(symbol=order.symbol, side=order.side, qty=order.qty, notional=round(order.notional, 2),
+                         client_order_id=coid, status="failed")
+    get_bucket("alpaca_trading").acquire()
+    start = time.monotonic()
+    try:
+        # Alpaca only takes fractional quantities as day orders; a close-out of a
+        # fractional holding can be fractional even when the plan rounds to whole shares.
+        whole = not fractional and float(order.qty).is_integer()
+        response = submit(order.symbol, order.qty, order.side, client_order_id=coid,
+                          time_in_force="gtc" if whole else "day")
+    except Exception as e:
+        response = {"error": str(e)}
+    result.latency = time.monotonic() - start
+
+    error = response.get("error") if isinstance(response, dict) else None
+    if error:
+        lowered = error.lower()
+        if "client_order_id" in lowered and ("unique" in lowered or "exist" in lowered):
+            return _resolve_duplicate(result, get_order)
+        result.error = error
+        return result
+    result.status = "submitted"
+    result.order_id = str(response.get("id")) if response.get("id") is not None else None
+    result.broker_status = _status(response.get("status"))
+    return result
+
+
+def wait_for_orders(results, get_order, timeout=30.0, poll_interval=0.5):
+    """Poll submitted or duplicate orders until they reach a final status; True if all did.
+
+    Updates each result's broker_status and filled_qty in place.
+    """
+    pending = [r for r in results if r.status in ("submitted", "duplicate") and r.broker_status not in FINAL_STATUSES]
+    deadline = time.monotonic() + timeout
+    while pending:
+        for result in pending:
+            get_bucket("alpaca_trading").acquire()
+            _refresh(result, get_order(result.client_order_id))
+        pending = [r for r in pending if r.broker_status not in FINAL_STATUSES]
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(poll_interval)
+    return not pending
+
+
+def _run_phase(orders, rebalance_id, submit, get_order, max_workers, fractional):
+    if not orders:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(orders)))) as pool:
+        return list(pool.map(lambda o: _submit_one(o, rebalance_id, submit, get_order, fractional), orders))
+
+
+def execute(orders, rebalance_id, submit=None, get_order=None, max_workers=4, dry_run=False, fractional=False,
+            fill_timeout=30.0, poll_interval=0.5):
+    """Submit `orders`: all sells, then all buys; returns [OrderResult] in submission order.
+
+    Buys only start once every sell has filled, so the proceeds are in the
+    account before they're spent. If a sell failed, ended unfilled or is
+    still working after `fill_timeout` seconds the buys are not sent and are
+    reported as "blocked"; running the same rebalance again later submits
+    them. `submit` has place_market_order's signature and `get_order`
+    get_order_by_client_id's; both default to the Alpaca ones.
+    """
+    sells = [o for o in orders if o.side == "sell"]
+    buys = [o for o in orders if o.side == "buy"]
+    if dry_run:
+        return [
+            OrderResult(symbol=o.symbol, side=o.side, qty=o.qty, notional=round(o.notional, 2),
+                        client_order_id=client_order_id(rebalance_id, o.symbol, o.side), status="planned")
+            for o in sells + buys
+        ]
+    if submit is None or get_order is None:
+        from utils import alpaca_utils  # needs broker credentials
+        submit = submit or alpaca_utils.place_market_order
+        get_order = get_order or alpaca_utils.get_order_by_client_id
+    results = _run_phase(sells, rebalance_id, submit, get_order, max_workers, fractional)
+    if buys and sells:
+        wait_for_orders(results, get_order, fill_timeout, poll_interval)
+        unfilled = [r for r in results if r.status not in ("submitted", "duplicate") or r.broker_status != "filled"]
+        if unfilled:
+            reasons = ", ".join(f"{r.symbol} {r.broker_status or r.status}" for r in unfilled)
+            return results + [
+                OrderResult(symbol=o.symbol, side=o.side, qty=o.qty, notional=round(o.notional, 2),
+                            client_order_id=client_order_id(rebalance_id, o.symbol, o.side), status="blocked",
+                            error=f"sells not filled after {fill_timeout:g}s: {reasons}")
+                for o in buys
+            ]
+    return results + _run_phase(buys, rebalance_id, submit, get_order, max_workers, fractional)
+
+
+@timed("rebalance")
+def rebalance(targets, dry_run=False, prices=None, price_source=None, account=None, positions=None,
+              submit=None, get_order=None, max_workers=4, rebalance_id=None, fractional=False,
+              fill_timeout=30.0, **plan_kwargs):
+    """Bring the account to `targets` ([(symbol, weight %)]); returns a RebalanceReport.
+
+    Account and positions come from the shared broker state unless given;
+    before a live run it is re-read from REST, so orders are never sized
+    from cached holdings. Prices come from Alpaca;
+    `price_source(symbols)` is used for symbols missing from `prices`.
+    With `dry_run` nothing is submitted and every order is reported as
+    "planned". Extra keyword arguments go to plan_orders().
+    """
+    started = time.time()
+    start = time.monotonic()
+    if account is None or positions is None:
+        from utils.broker_state import get_broker_state
+        state = get_broker_state()
+        if dry_run:
+            snapshot = state.snapshot(max_age=state.max_age)
+        else:
+            state.reconcile()  # raises if REST can't be read, so nothing is submitted
+            snapshot = state.snapshot()
+        account = snapshot.account if account is None else account
+        positions = list(snapshot.positions) if positions is None else positions
+    for response in (account, positions):
+        if isinstance(response, dict) and "error" in response:
+            raise RuntimeError(f"Could not read the account: {response['error']}")
+
+    symbols = [s for s, _ in (targets.items() if isinstance(targets, dict) else targets)]
+    prices = dict(prices or {})
+    missing = [s for s in symbols if not prices.get(s)]
+    if missing:
+        if price_source is None:
+            from utils.marketData import fetch_alpaca_latest_prices
+            price_source = fetch_alpaca_latest_prices
+        prices.update(price_source(missing))
+
+    rebalance_id = rebalance_id or rebalance_id_for(targets)
+    equity = _float(account.get("equity"))
+    orders, skipped = plan_orders(targets, positions, equity, prices, fractional=fractional, **plan_kwargs)
+    report = RebalanceReport(rebalance_id=rebalance_id, dry_run=dry_run, equity=equity, skipped=skipped,
+                             started_at=started)
+    report.orders = execute(orders, rebalance_id, submit=submit, get_order=get_order, max_workers=max_workers,
+                            dry_run=dry_run, fractional=fractional, fill_timeout=fill_timeout)
+    report.elapsed = time.monotonic() - start
+    print(f"Rebalance {rebalance_id}: {report.summary()}")
+    return report
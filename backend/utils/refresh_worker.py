@@ -0,0 +1,131 @@
+"""Scheduled background jobs that keep the API's in-memory state fresh.
+
+Every job (repricing, bar gap-filling, ...) runs on one daemon thread on its
+own interval, so provider I/O never happens on a request thread. warm() runs
+the startup jobs once before the server starts taking traffic, so the first
+request doesn't pay for a cold cache.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Job:
+    name: str
+    fn: object
+    interval: float
+    warm: bool = False
+    next_run: float = 0.0
+    runs: int = 0
+    failures: int = 0
+    last_duration: float = None
+    last_success: float = None
+    last_error: str = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def as_dict(self):
+        return {
+            "interval": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_duration": None if self.last_duration is None else round(self.last_duration, 3),
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+        }
+
+
+class RefreshWorker:
+    def __init__(self):
+        self.jobs = {}
+        self.ready = threading.Event()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, name, fn, interval, warm=False):
+        """Run `fn()` every `interval` seconds; `warm` jobs also run once in warm()."""
+        if interval <= 0:
+            return None  # disabled
+        job = Job(name=name, fn=fn, interval=float(interval), warm=warm)
+        job.next_run = time.monotonic() + job.interval if warm else time.monotonic()
+        self.jobs[name] = job
+        self._wake.set()  # let a running loop pick up the new schedule
+        return job
+
+    def run(self, name):
+        """Run one job now on the calling thread; returns True if it succeeded."""
+        job = self.jobs[name]
+        with job.lock:  # never run the same job twice at once
+            start = time.monotonic()
+            try:
+                job.fn()
+            except Exception as e:
+                job.failures += 1
+                job.last_error = f"{type(e).__name__}: {e}"
+                print(f"Background job {name} failed: {job.last_error}")
+                ok = False
+            else:
+                job.last_success = time.time()
+                job.last_error = None
+                ok = True
+            job.runs += 1
+            job.last_duration = time.monotonic() - start
+            job.next_run = time.monotonic() + job.interval
+        return ok
+
+    def warm(self, *steps):
+        """Run the warm jobs, then any extra `steps` (plain callables), and mark the worker ready.
+
+        Failures are logged but don't block startup: the app serves whatever
+        state it has and the scheduled runs keep retrying.
+        """
+        start = time.monotonic()
+        for job in list(self.jobs.values()):
+            if job.warm:
+                self.run(job.name)
+        for step in steps:
+            try:
+                step()
+            except Exception as e:
+                print(f"Warm-up step {getattr(step, '__name__', step)} failed: {e}")
+        self.ready.set()
+        print(f"Warm-up finished in {time.monotonic() - start:.2f}s")
+
+    def trigger(self, name):
+        """Schedule a job to run as soon as the worker thread is free."""
+        self.jobs[name].next_run = 0.0
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.is_set():
+                self._wake.clear()  # before running, so a trigger() during a job isn't lost
+                now = time.monotonic()
+                for job in list(self.jobs.values()):
+                    if job.next_run <= now and not self._stop.is_set():
+                        self.run(job.name)
+                upcoming = min((job.next_run for job in self.jobs.values()), default=now + 60)
+                self._wake.wait(max(0.0, upcoming - time.monotonic()))
+
+        self._thread = threading.Thread(target=loop, name="refresh-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "ready": self.ready.is_set(),
+            "running": self._thread is not None and self._thread.is_alive(),
+            "jobs": {name: job.as_dict() for name, job in self.jobs.items()},
+        }
@@ -0,0 +1,193 @@
+"""Persistent TTL cache for provider responses.
+
+Responses are stored as JSON in a small SQLite file keyed by provider, path
+and query parameters (API keys excluded). Each endpoint is cached under a
+named policy giving its TTL and a stale-while-revalidate window: within the
+TTL the cached body is returned as-is, within the stale window it is returned
+immediately while a background thread refreshes it, and past that it is
+refetched inline. Empty or error-shaped bodies are returned but never
+stored, so a bad answer isn't served for a whole TTL. The file is kept under
+a byte budget by evicting the least recently used entries.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CACHE_FILE = os.path.join(BASE_DIR, "data", "response_cache.db")
+
+DAY = 24 * 60 * 60
+
+# policy -> (ttl seconds, extra seconds a stale entry may be served while it refreshes)
+CACHE_POLICIES = {
+    "fundamentals": (30 * DAY, 60 * DAY),  # company overview, income statement growth: quarterly
+    "ratios": (DAY, 2 * DAY),              # TTM ratios move with the daily price
+    "prices": (60, 5 * 60),                # intraday / previous-close quotes
+}
+
+SECRET_PARAMS = {"apikey", "apiKey", "api_key", "token"}
+# Top-level keys providers use to report a problem in an otherwise successful response
+ERROR_KEYS = {"Error Message", "Note", "Information", "error"}
+
+
+def make_key(provider, path, params=None):
+    items = sorted((k, str(v)) for k, v in (params or {}).items() if k not in SECRET_PARAMS)
+    return f"{provider}:{path}?" + "&".join(f"{k}={v}" for k, v in items)
+
+
+def is_cacheable(value):
+    """False for empty bodies (e.g. Alpha Vantage's `{}` for an unknown symbol) and error payloads."""
+    if not value:
+        return False
+    if isinstance(value, dict):
+        return not (ERROR_KEYS & value.keys()) and value.get("status") != "ERROR"
+    return True
+
+
+class ResponseCache:
+    def __init__(self, path=None, max_bytes=None):
+        self.path = path or CACHE_FILE
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            float(os.getenv("RESPONSE_CACHE_MAX_MB", "256")) * 1024 * 1024
+        )
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body TEXT, fetched_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(accessed_at)")
+        self._conn.commit()
+        # Kept up to date by put/_evict so writes never have to sum the whole table.
+        self._entries, self._bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+
+        self._refreshing = set()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "evictions": 0, "uncacheable": 0}
+
+    def _count(self, name, n=1):
+        self.counters[name] += n
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "entries": self._entries, "bytes": self._bytes}
+
+    def _lookup(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT body, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+        return row
+
+    def put(self, key, value):
+        """Store `value` under `key`; returns False (storing nothing) if it isn't cacheable."""
+        if not is_cacheable(value):
+            with self._lock:
+                self._count("uncacheable")
+            return False
+        body = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is None:
+                self._entries += 1
+            else:
+                self._bytes -= old[0]
+            self._bytes += len(body)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses(key, body, fetched_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, body, now, now, len(body)),
+            )
+            self._evict()
+            self._conn.commit()
+        return True
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+            if self._bytes <= self.max_bytes:
+                break
+            victims.append((key,))
+            self._bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._entries -= len(victims)
+        self._count("evictions", len(victims))
+
+    def _refresh_in_background(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                if self.put(key, fetch()):
+                    with self._lock:
+                        self._count("refreshes")
+            except Exception as e:
+                print(f"Background refresh failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_or_fetch(self, key, policy, fetch):
+        """Return the cached value for `key` under `policy`, calling `fetch()` when needed."""
+        ttl, stale = CACHE_POLICIES[policy]
+        row = self._lookup(key)
+        if row is not None:
+            body, fetched_at = row
+            age = time.time() - fetched_at
+            if age < ttl:
+                with self._lock:
+                    self._count("hits")
+                return json.loads(body)
+            if age < ttl + stale:
+                with self._lock:
+                    self._count("stale_hits")
+                self._refresh_in_background(key, fetch)
+                return json.loads(body)
+
+        with self._lock:
+            self._count("misses")
+        value = fetch()
+        self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._entries = self._bytes = 0
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Process-wide cache, or None when disabled with RESPONSE_CACHE=0."""
+    global _default_cache
+    if os.getenv("RESPONSE_CACHE", "1") == "0":
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+def default_stats():
+    """stats() of the process-wide cache, or {} if it hasn't been created (or is disabled)."""
+    cache = _default_cache
+    return {} if cache is None else cache.stats()
@@ -0,0 +1,227 @@
+"""SQLite-backed store for the per-symbol fundamentals table.
+
+Rows are keyed by symbol and upserted in place, so refreshing one symbol no
+longer rewrites the whole table. Columns are added on demand as new fields
+show up. stock_data.csv is kept as an export for anything that still reads
+the flat file.
+
+Every committed write bumps a data version and records which columns it
+touched, so readers can ask what changed since the version they last saw
+and reload only that.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+STOCK_DATA_FILE = os.path.join(DATA_DIR, "stock_data.csv")
+STOCK_DB_FILE = os.path.join(DATA_DIR, "stock_data.db")
+
+TABLE = "stock_data"
+ANY_COLUMN = "*"  # recorded for writes that can add rows, so no column-level shortcut is safe
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _to_sql_value(value):
+    if value is None:
+        return None
+    if hasattr(value, "item"):  # numpy scalar
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+class StockStore:
+    def __init__(self, path=None, csv_path=None):
+        self.path = path or STOCK_DB_FILE
+        self.csv_path = csv_path or STOCK_DATA_FILE
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        is_new = not os.path.exists(self.path)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (symbol TEXT PRIMARY KEY)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS column_versions (name TEXT PRIMARY KEY, version INTEGER)")
+        self._columns = self._load_columns()
+
+        if is_new and os.path.exists(self.csv_path):
+            self.import_csv(self.csv_path)
+
+    def _load_columns(self):
+        return [row[1] for row in self._conn.execute(f"PRAGMA table_info({TABLE})")]
+
+    def _ensure_columns(self, names):
+        for name in names:
+            if name not in self._columns:
+                self._conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(name)}")
+                self._columns.append(name)
+
+    @contextmanager
+    def _transaction(self, columns=(ANY_COLUMN,)):
+        """Run writes atomically, bump the version and record `columns` as changed at it."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute(
+                    "INSERT INTO meta(key, value) VALUES('version', 1) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+                )
+                self._conn.executemany(
+                    "INSERT INTO column_versions(name, version) "
+                    "SELECT ?, value FROM meta WHERE key = 'version' "
+                    "ON CONFLICT(name) DO UPDATE SET version = excluded.version",
+                    [(c,) for c in columns],
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self._columns = self._load_columns()
+                raise
+            self._conn.execute("COMMIT")
+
+    # ---------- Writes ---------- #
+
+    def upsert_many(self, rows):
+        """Upsert an iterable of dicts (each with a 'symbol' key) in a single transaction."""
+        rows = [row for row in rows if row.get("symbol")]
+        if not rows:
+            return 0
+        with self._transaction() as conn:
+            for row in rows:
+                fields = [k for k in row.keys() if k != "symbol"]
+                self._ensure_columns(fields)
+                cols = ["symbol"] + fields
+                updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in fields)
+                sql = (
+                    f"INSERT INTO {TABLE} ({', '.join(_quote(c) for c in cols)}) "
+                    f"VALUES ({', '.join('?' for _ in cols)}) "
+                    + (f"ON CONFLICT(symbol) DO UPDATE SET {updates}" if fields else "ON CONFLICT(symbol) DO NOTHING")
+                )
+                conn.execute(sql, [row["symbol"]] + [_to_sql_value(row[c]) for c in fields])
+        return len(rows)
+
+    def upsert_frame(self, df):
+        """Upsert every row of a DataFrame with a 'symbol' column using one statement."""
+        df = df[df["symbol"].notna()]
+        if df.empty:
+            return 0
+        fields = [c for c in df.columns if c != "symbol"]
+        cols = ["symbol"] + fields
+        updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in fields)
+        sql = (
+            f"INSERT INTO {TABLE} ({', '.join(_quote(c) for c in cols)}) "
+            f"VALUES ({', '.join('?' for _ in cols)}) "
+            + (f"ON CONFLICT(symbol) DO UPDATE SET {updates}" if fields else "ON CONFLICT(symbol) DO NOTHING")
+        )
+        rows = df[cols].itertuples(index=False, name=None)
+        with self._transaction() as conn:
+            self._ensure_columns(fields)
+            conn.executemany(sql, ([_to_sql_value(v) for v in row] for row in rows))
+        return len(df)
+
+    def upsert(self, symbol, info):
+        return self.upsert_many([{**info, "symbol": symbol}])
+
+    def update_column(self, column, values):
+        """Set `column` for many symbols at once from a {symbol: value} mapping or Series."""
+        items = [(_to_sql_value(v), s) for s, v in dict(values).items()]
+        if not items:
+            return 0
+        with self._transaction(columns=[column]) as conn:  # UPDATE never adds rows
+            self._ensure_columns([column])
+            conn.executemany(f"UPDATE {TABLE} SET {_quote(column)} = ? WHERE symbol = ?", items)
+        return len(items)
+
+    @contextmanager
+    def writer(self, batch_size=50):
+        """Buffer upserts and commit them every `batch_size` rows (and on exit)."""
+        pending = []
+
+        def flush():
+            if pending:
+                self.upsert_many(pending)
+                pending.clear()
+
+        def add(symbol, info):
+            pending.append({**info, "symbol": symbol})
+            if len(pending) >= batch_size:
+                flush()
+
+        add.flush = flush
+        try:
+            yield add
+        finally:
+            flush()
+
+    def import_csv(self, path):
+        df = pd.read_csv(path)
+        return self.upsert_many(df.to_dict("records"))
+
+    # ---------- Reads ---------- #
+
+    @property
+    def version(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def changed_columns(self, since_version):
+        """Columns written after `since_version`, or None if rows may have been added since."""
+        with self._lock:
+            names = {row[0] for row in self._conn.execute(
+                "SELECT name FROM column_versions WHERE version > ?", (since_version,)
+            )}
+        return None if ANY_COLUMN in names else names
+
+    def symbols(self):
+        with self._lock:
+            return {row[0] for row in self._conn.execute(f"SELECT symbol FROM {TABLE}")}
+
+    def load_frame(self, columns=None):
+        with self._lock:
+            if columns:
+                cols = ["symbol"] + [c for c in columns if c != "symbol" and c in self._columns]
+                sql = f"SELECT {', '.join(_quote(c) for c in cols)} FROM {TABLE} ORDER BY rowid"
+            else:
+                sql = f"SELECT * FROM {TABLE} ORDER BY rowid"
+            return pd.read_sql_query(sql, self._conn)
+
+    def export_csv(self, path=None):
+        """Write the table to CSV atomically (temp file + rename)."""
+        path = path or self.csv_path
+        tmp = f"{path}.tmp"
+        self.load_frame().to_csv(tmp, index=False)
+        os.replace(tmp, path)
+        return path
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide store for backend/data."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = StockStore()
+        return _default_store
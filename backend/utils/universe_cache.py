@@ -0,0 +1,129 @@
+"""Process-level cache of the scored stock universe.
+
+The fundamentals table is loaded and scored once, then reused until the
+store's data version changes (every committed write bumps it, including
+writes from other processes). A background thread can poll the version and
+rebuild the snapshot off the request path; readers always get the last
+complete snapshot and never see a half-built one.
+
+With a `rescorer`, a change that only touched some columns (e.g. a price
+refresh) reloads just those columns and patches the previous snapshot
+instead of rescoring the whole table.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+from utils.stock_store import get_store
+
+
+@dataclass(frozen=True)
+class UniverseSnapshot:
+    frame: pd.DataFrame  # treat as read-only: shared by every request thread
+    version: int
+    loaded_at: float
+
+
+class UniverseCache:
+    def __init__(self, scorer, store=None, rescorer=None):
+        """`scorer(stock_df)` turns the raw fundamentals table into the scored universe;
+        optional `rescorer(scored, changes)` applies a few changed columns to a scored frame."""
+        self.scorer = scorer
+        self.rescorer = rescorer
+        self.full_builds = 0
+        self.incremental_builds = 0
+        self._store = store
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._derived = {}
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    def _build(self, version, previous=None):
+        store = self.store
+        if previous is not None and self.rescorer is not None and hasattr(store, "changed_columns"):
+            changed = store.changed_columns(previous.version)
+            if changed is not None:
+                frame = self._patch(previous.frame, store, changed)
+                if frame is not None:
+                    self.incremental_builds += 1
+                    return UniverseSnapshot(frame=frame, version=version, loaded_at=time.time())
+        self.full_builds += 1
+        frame = self.scorer(store.load_frame())
+        return UniverseSnapshot(frame=frame, version=version, loaded_at=time.time())
+
+    def _patch(self, frame, store, changed):
+        """Previous frame with only `changed` columns reloaded and rescored; None to fall back to a full build."""
+        if not changed:
+            return frame
+        changes = store.load_frame(sorted(changed))
+        if len(changes) != len(frame) or not set(changed) <= set(changes.columns):
+            return None
+        try:
+            return self.rescorer(frame, changes)
+        except ValueError:
+            return None  # rows moved under us; rebuild from scratch
+
+    def refresh(self, force=False):
+        """Rebuild the snapshot if the store has changed (or `force`); returns the current snapshot."""
+        version = self.store.version
+        snapshot = self._snapshot
+        if not force and snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            # Another thread may have rebuilt it while we waited for the lock.
+            snapshot = self._snapshot
+            if force or snapshot is None or snapshot.version != version:
+                snapshot = self._build(version, previous=None if force else snapshot)
+                self._snapshot = snapshot
+        return snapshot
+
+    def get(self):
+        """Current snapshot. With the background refresher running this never touches the store."""
+        snapshot = self._snapshot
+        if snapshot is not None and self._thread is not None and self._thread.is_alive():
+            return snapshot
+        return self.refresh()
+
+    def derived(self, key, build, snapshot=None):
+        """`build(frame)` computed once per snapshot version and shared, e.g. a query index."""
+        snapshot = snapshot or self.get()
+        cached = self._derived.get(key)
+        if cached is not None and cached[0] == snapshot.version:
+            return cached[1]
+        with self._lock:
+            cached = self._derived.get(key)
+            if cached is None or cached[0] != snapshot.version:
+                cached = (snapshot.version, build(snapshot.frame))
+                self._derived[key] = cached
+        return cached[1]
+
+    def start(self, interval=30.0):
+        """Load now and keep the snapshot current from a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.refresh()
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Universe refresh failed: {e}")
+
+        self._thread = threading.Thread(target=run, name="universe-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,199 @@
+"""Projection, filtering, keyset pagination and encoding of the scored universe.
+
+Pages are cut with a keyset cursor (the sort key and symbol of the last row
+returned) rather than an offset, so rows added or removed by a refresh between
+two page requests don't shift later pages. With sort=symbol no row is skipped
+or repeated. Sorted by a score, a row whose score changes between pages can
+move across the cursor and be skipped or seen twice; X-Universe-Version tells
+a client when that may have happened. Results are columnar: one array per
+column, which is also what the msgpack and Arrow encodings carry.
+"""
+
+import base64
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import msgpack
+except ImportError:  # optional: JSON is always available
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional
+    pa = None
+
+DEFAULT_COLUMNS = ["symbol", "sector", "price", "roiScore", "riskScore"]
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# query argument -> (column, comparison)
+RANGE_FILTERS = {
+    "min_risk": ("riskScore", "ge"),
+    "max_risk": ("riskScore", "le"),
+    "min_roi": ("roiScore", "ge"),
+    "max_roi": ("roiScore", "le"),
+}
+
+CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def encode_cursor(sort, key, symbol):
+    raw = json.dumps([sort, key, symbol]).encode()  # sort keys may be +/-Infinity, which json round-trips
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    """(key, symbol) of the last row already returned; the cursor must come from the same sort."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, key, symbol = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError("cursor was issued for a different sort")
+    return key, symbol
+
+
+def sort_keys(frame, sort):
+    """Ascending sort key for `sort` ("column" or "-column" for descending), NaN last either way."""
+    column = sort.lstrip("-")
+    if column == "symbol":
+        return None
+    values = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=float)
+    keys = -values if sort.startswith("-") else values
+    return np.where(np.isnan(keys), np.inf, keys)
+
+
+def sort_order(frame, sort):
+    """Row positions of `frame` in (sort key, symbol) order; cheap to cache per snapshot."""
+    symbols = frame["symbol"].astype(str).to_numpy()
+    keys = sort_keys(frame, sort)
+    if keys is None:
+        return np.argsort(symbols, kind="stable")
+    return np.lexsort((symbols, keys))
+
+
+def parse_query(args, frame):
+    """Validate query arguments against the universe's columns; raises ValueError."""
+    columns = args.get("columns")
+    if columns in (None, ""):
+        columns = [c for c in DEFAULT_COLUMNS if c in frame.columns]
+    elif columns == "*":
+        columns = list(frame.columns)
+    else:
+        columns = [c.strip() for c in columns.split(",") if c.strip()]
+        unknown = [c for c in columns if c not in frame.columns]
+        if unknown:
+            raise ValueError(f"unknown columns: {', '.join(unknown)}")
+        if "symbol" not in columns:
+            columns.insert(0, "symbol")
+
+    sort = args.get("sort") or "symbol"
+    if sort.lstrip("-") not in frame.columns:
+        raise ValueError(f"unknown sort column {sort.lstrip('-')!r}")
+    if sort.lstrip("-") != "symbol" and not pd.api.types.is_numeric_dtype(frame[sort.lstrip("-")]):
+        raise ValueError("sort must be symbol or a numeric column")
+
+    ranges = {}
+    for name in RANGE_FILTERS:
+        raw = args.get(name)
+        if raw not in (None, ""):
+            try:
+                ranges[name] = float(raw)
+            except ValueError:
+                raise ValueError(f"{name} must be a number, got {raw!r}")
+
+    sectors = args.get("sector")
+    sectors = [s.strip().lower() for s in sectors.split(",") if s.strip()] if sectors else []
+    if sectors and "sector" not in frame.columns:
+        raise ValueError("the universe has no sector column")
+
+    try:
+        limit = int(args.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    cursor = args.get("cursor")
+    fmt = (args.get("format") or "json").lower()
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"format must be one of {', '.join(CONTENT_TYPES)}")
+    return {
+        "columns": columns,
+        "sort": sort,
+        "ranges": ranges,
+        "sectors": sectors,
+        "limit": limit,
+        "cursor": decode_cursor(cursor, sort) if cursor else None,
+        "format": fmt,
+    }
+
+
+def run_query(frame, query, order=None):
+    """Apply filters and the cursor to `frame`; returns (page frame, next cursor or None, matching rows)."""
+    order = sort_order(frame, query["sort"]) if order is None else order
+    mask = np.ones(len(frame), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        for name, bound in query["ranges"].items():
+            column, op = RANGE_FILTERS[name]
+            values = pd.to_numeric(frame[column], errors="coerce").to_numpy(dtype=float)
+            mask &= values >= bound if op == "ge" else values <= bound
+    if query["sectors"]:
+        mask &= frame["sector"].astype(str).str.lower().isin(query["sectors"]).to_numpy()
+
+    rows = order[mask[order]]
+    total = len(rows)
+    symbols = frame["symbol"].astype(str).to_numpy()
+    keys = sort_keys(frame, query["sort"])
+
+    if query["cursor"] is not None:
+        after_key, after_symbol = query["cursor"]
+        if keys is None:
+            rows = rows[symbols[rows] > after_symbol]
+        else:
+            k = keys[rows]
+            rows = rows[(k > after_key) | ((k == after_key) & (symbols[rows] > after_symbol))]
+
+    page = rows[:query["limit"]]
+    next_cursor = None
+    if len(rows) > len(page) and len(page):
+        last = page[-1]
+        next_cursor = encode_cursor(query["sort"], None if keys is None else float(keys[last]), str(symbols[last]))
+    return frame.iloc[page][query["columns"]], next_cursor, total
+
+
+def _column_values(series):
+    """Plain Python list with NaN/NaT as None, for JSON and msgpack."""
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=float)
+        return [None if v != v else v for v in values.tolist()]
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def encode(page, next_cursor, total, version, fmt):
+    """Serialize a page; returns (body, content type)."""
+    meta = {"version": version, "count": len(page), "total": total, "next_cursor": next_cursor}
+    if fmt == "arrow":
+        if pa is None:
+            raise LookupError("Arrow output needs pyarrow installed")
+        table = pa.Table.from_pandas(page, preserve_index=False)
+        table = table.replace_schema_metadata({k: json.dumps(v) for k, v in meta.items()})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), CONTENT_TYPES["arrow"]
+
+    body = dict(meta, columns={name: _column_values(page[name]) for name in page.columns})
+    if fmt == "msgpack":
+        if msgpack is None:
+            raise LookupError("msgpack output needs msgpack installed")
+        return msgpack.packb(body, use_bin_type=True), CONTENT_TYPES["msgpack"]
+    return json.dumps(body, separators=(",", ":")), CONTENT_TYPES["json"]
@@ -1,14 +1,49 @@
 import React, { useEffect, useState } from "react";
 import PortfolioTreemap from "./components/PortfolioTreemap.jsx";
 
+const API_URL = "http://localhost:5000";
+
 const App = () => {
   const [portfolio, setPortfolio] = useState([]);
 
   useEffect(() => {
-    fetch("http://localhost:5000/portfolio")
-      .then((res) => res.json())
-      .then((data) => setPortfolio(data))
-      .catch((err) => console.error(err));
+    // Live values from the server; positions are kept by symbol so updates only touch what changed.
+    let positions = {};
+    const publish = () =>
+      setPortfolio(Object.values(positions).map((p) => ({ symbol: p.symbol, weight: p.weight * 100 })));
+
+    const fetchOnce = () =>
+      fetch(`${API_URL}/portfolio`)
+        .then((res) => res.json())
+        .then((data) => setPortfolio(data))
+        .catch((err) => console.error(err));
+
+    if (!window.EventSource) {
+      fetchOnce();
+      return undefined;
+    }
+
+    const source = new EventSource(`${API_URL}/portfolio/stream`);
+    source.addEventListener("snapshot", (e) => {
+      const state = JSON.parse(e.data);
+      positions = Object.fromEntries(state.positions.map((p) => [p.symbol, p]));
+      publish();
+    });
+    source.addEventListener("update", (e) => {
+      const diff = JSON.parse(e.data);
+      for (const [symbol, fields] of Object.entries(diff.positions)) {
+        positions[symbol] = { ...positions[symbol], ...fields };
+      }
+      publish();
+    });
+    source.onerror = (err) => {
+      console.error(err);
+      // EventSource reconnects on its own after a dropped connection, but gives up on an
+      // error status such as the 503 sent when the server's stream limit is reached.
+      if (source.readyState === EventSource.CLOSED) fetchOnce();
+    };
+
+    return () => source.close();
   }, []);
 
   return (